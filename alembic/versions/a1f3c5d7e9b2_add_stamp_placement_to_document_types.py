@@ -0,0 +1,41 @@
+"""add_stamp_placement_to_document_types
+
+Revision ID: a1f3c5d7e9b2
+Revises: convert_ids_to_ulid
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1f3c5d7e9b2'
+down_revision: Union[str, Sequence[str], None] = 'convert_ids_to_ulid'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Política de posicionamento do carimbo por tipo de documento (idempotente)
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    if 'document_types' not in inspector.get_table_names():
+        return
+    existing_columns = [col['name'] for col in inspector.get_columns('document_types')]
+    if 'stamp_placement' not in existing_columns:
+        op.add_column('document_types', sa.Column('stamp_placement', sa.String(length=20), nullable=False, server_default='all'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    if 'document_types' not in inspector.get_table_names():
+        return
+    existing_columns = [col['name'] for col in inspector.get_columns('document_types')]
+    if 'stamp_placement' in existing_columns:
+        op.drop_column('document_types', 'stamp_placement')
@@ -0,0 +1,41 @@
+"""add_document_analysis_to_signatures
+
+Revision ID: b7d2e4f6a8c1
+Revises: a1f3c5d7e9b2
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d2e4f6a8c1'
+down_revision: Union[str, Sequence[str], None] = 'a1f3c5d7e9b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Análise do PDF registrada no upload (idempotente)
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    if 'signatures' not in inspector.get_table_names():
+        return
+    existing_columns = [col['name'] for col in inspector.get_columns('signatures')]
+    if 'document_analysis' not in existing_columns:
+        op.add_column('signatures', sa.Column('document_analysis', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    if 'signatures' not in inspector.get_table_names():
+        return
+    existing_columns = [col['name'] for col in inspector.get_columns('signatures')]
+    if 'document_analysis' in existing_columns:
+        op.drop_column('signatures', 'document_analysis')
@@ -2,35 +2,30 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-from flask import Flask, render_template, request, jsonify, send_file, session, flash, redirect, url_for, g
+from flask import Flask, render_template, request, jsonify, send_file, session, flash, redirect, url_for, g, make_response
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_caching import Cache
 from flask_compress import Compress
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-import PyPDF2
 import aiofiles
 import asyncio
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage
-from reportlab.lib.units import inch, cm
-import io
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from reportlab.lib.units import inch
 import os
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 import threading
-from queue import Queue
 import time
 import tempfile
 import base64
 from PIL import Image
 import numpy as np
 import uuid
-import shutil
 import json
+from types import SimpleNamespace
 from functools import wraps
 import logging
 
@@ -38,14 +33,22 @@ import logging
 logger = logging.getLogger(__name__)
 
 # Imports dos serviços e utilitários
-from services import certificate_manager, pdf_validator
+from services import certificate_manager, pdf_validator, stamping_engine, StampingUnavailable, scan_verdict_cache, upload_ingestor
+from pdf_stamper import stamp_single_signer, stamp_multi_signer, normalize_placement
+from pdf_backend import open_pdf
+from pdf_scanner import scan_pdf_safeness, analyze_pdf_upload, get_scanner_engine
+from services.resumable_upload import resumable_uploads, ResumableUploadError
+from services.content_store import content_store
+from services.batch_validation import batch_validator, BatchValidationError
+from services.validation_cache import validation_cache
+from services.upload_ingest import StreamingUploadRequest, ASYNC_INGEST as UPLOAD_ASYNC_INGEST, STALE_SECONDS as UPLOAD_INGEST_STALE_SECONDS
 from utils import signature_manager
+from utils.key_cache import key_material_cache
 from models import db, User, Signature, AppSetting
 from forms import LoginForm, UserEditForm, ChangePasswordForm, AdminUserForm, ReportFilterForm
 from auth import admin_required, create_user_session, cleanup_expired_sessions, get_user_stats, get_signature_stats
 
 from config import config
-import os
 import re
 from datetime import date
 from utils.mobile_optimizations import (
@@ -55,6 +58,8 @@ from utils.mobile_optimizations import (
     get_mobile_headers, log_performance_metrics
 )
 from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.exceptions import HTTPException
+from sqlalchemy import event
 from flask_wtf.csrf import CSRFProtect
 from audit_logger import log_event, log_signature_event, log_validation_event
 try:
@@ -196,235 +201,6 @@ def detect_device_info(user_agent, request_obj):
     
     return device_info
 
-def scan_pdf_safeness(file_path: str):
-    """
-    Retorna (ok, mensagem). Bloqueia PDFs com JavaScript/ações perigosas.
-    SECURITY: Implementa limites de páginas e timeouts para prevenir DoS.
-    Detecta múltiplos vetores de ataque incluindo scripts, ações maliciosas e embedded files.
-    """
-    # Limites de segurança para prevenir DoS
-    MAX_PAGES = 1000  # Limite máximo de páginas processadas
-    TIMEOUT_SECONDS = 30  # Timeout para processamento
-    MAX_RECURSION_DEPTH = 10  # Limite de profundidade recursiva
-    
-    # SECURITY: Lista expandida de tokens perigosos em PDFs
-    # Nota: /S, /AcroForm e /OpenAction foram removidos pois são comuns em PDFs legítimos
-    # Serão detectados apenas em contexto de JavaScript ou ações de execução
-    dangerous_tokens = [
-        # JavaScript e scripts (completos)
-        '/JavaScript', '/JS',
-        # Ações automáticas perigosas (sem contexto)
-        '/AA', '/XFA',
-        # Ações de execução (sempre perigosas)
-        '/Launch', '/GoToR', '/GoToE', '/URI', '/SubmitForm', '/ImportData',
-        # RichMedia e embedded content
-        '/RichMedia', '/EmbeddedFiles', '/EmbeddedFile', '/FileAttachment',
-        # Ações de formulário perigosas
-        '/ResetForm', '/ImportData', '/ExportData',
-        # Annotations perigosas
-        '/Movie', '/Sound', '/3D', '/RichMediaAnnotation',
-        # Outros vetores
-        '/JavaScript ', '/JS ', '/XFAForm'
-    ]
-    
-    # Tokens que só são perigosos em contexto específico
-    context_dangerous_tokens = {
-        '/S': ['/JavaScript', '/JS'],  # /S só é perigoso quando relacionado a JavaScript
-        '/AcroForm': ['/JavaScript', '/JS', '/AA', '/OpenAction', '/XFA'],  # /AcroForm só é perigoso quando tem JavaScript ou ações automáticas
-        '/OpenAction': ['/JavaScript', '/JS', '/Launch', '/URI', '/SubmitForm'],  # /OpenAction só é perigoso quando tem JavaScript ou ações de execução
-    }
-    
-    def check_object_for_dangerous_content(obj, context="", depth=0):
-        """Verifica recursivamente um objeto PDF por conteúdo perigoso"""
-        # Limita profundidade recursiva para prevenir DoS
-        if depth > MAX_RECURSION_DEPTH:
-            return False, None
-        
-        if obj is None:
-            return False, None
-        
-        try:
-            obj_str = str(obj)
-            obj_repr = repr(obj)
-            obj_lower = obj_str.lower()
-        except Exception:
-            # Se não conseguir converter para string, ignora
-            return False, None
-        
-        # Verifica tokens perigosos diretos
-        for token in dangerous_tokens:
-            if token in obj_str or token in obj_repr:
-                return True, f'Token perigoso encontrado: {token}'
-        
-        # Verifica tokens que só são perigosos em contexto específico
-        for token, required_contexts in context_dangerous_tokens.items():
-            if token in obj_str or token in obj_repr:
-                # Verifica se está em contexto perigoso
-                for ctx in required_contexts:
-                    if ctx in obj_str or ctx in obj_repr:
-                        return True, f'Token perigoso encontrado: {token} (em contexto de {ctx})'
-        
-        # Verifica padrões de JavaScript
-        js_patterns = [
-            'javascript:', 'js:', 'eval(', 'unescape(', 'fromCharCode(',
-            'app.alert', 'app.execMenuItem', 'this.', 'event.',
-            'AFSimple_Calculate', 'AFDate_Format', 'AFTime_Format'
-        ]
-        for pattern in js_patterns:
-            if pattern.lower() in obj_lower:
-                return True, f'Padrão JavaScript suspeito: {pattern}'
-        
-        # Verifica URLs suspeitas em ações
-        if '/URI' in obj_str or '/Launch' in obj_str:
-            uri_patterns = ['http://', 'https://', 'file://', 'ftp://', 'javascript:']
-            for pattern in uri_patterns:
-                if pattern in obj_lower:
-                    return True, f'Ação com URI suspeita: {pattern}'
-        
-        # Verifica objetos aninhados (com limite de profundidade)
-        if hasattr(obj, 'get_object'):
-            try:
-                nested = obj.get_object()
-                if nested != obj:
-                    return check_object_for_dangerous_content(nested, context, depth + 1)
-            except Exception:
-                pass
-        
-        # Verifica dicionários e listas (com limite de itens para prevenir DoS)
-        if isinstance(obj, dict):
-            # Limita verificação a primeiros 100 itens
-            items_to_check = list(obj.items())[:100]
-            for key, value in items_to_check:
-                if isinstance(key, str) and any(token in key for token in dangerous_tokens):
-                    return True, f'Chave perigosa no objeto: {key}'
-                is_dangerous, reason = check_object_for_dangerous_content(value, f"{context}.{key}", depth + 1)
-                if is_dangerous:
-                    return True, reason
-        elif isinstance(obj, (list, tuple)):
-            # Limita verificação a primeiros 100 itens
-            items_to_check = list(obj)[:100]
-            for item in items_to_check:
-                is_dangerous, reason = check_object_for_dangerous_content(item, context, depth + 1)
-                if is_dangerous:
-                    return True, reason
-        
-        return False, None
-    
-    def _scan_pdf_worker(file_path, result_queue):
-        """Worker function que executa a varredura do PDF"""
-        try:
-            with open(file_path, 'rb') as f:
-                reader = PyPDF2.PdfReader(f)
-                try:
-                    num_pages = len(reader.pages)
-                except Exception:
-                    num_pages = 0
-                
-                if num_pages == 0:
-                    result_queue.put((False, 'PDF sem páginas'))
-                    return
-                
-                # SECURITY: Limita número de páginas processadas para prevenir DoS
-                if num_pages > MAX_PAGES:
-                    result_queue.put((False, f'PDF excede limite de {MAX_PAGES} páginas (encontrado: {num_pages})'))
-                    return
-                
-                # Verifica trailer/catalog (raiz do documento)
-                try:
-                    if reader.trailer:
-                        is_dangerous, reason = check_object_for_dangerous_content(reader.trailer, "trailer")
-                        if is_dangerous:
-                            result_queue.put((False, f'PDF contém conteúdo perigoso no trailer: {reason}'))
-                            return
-                except Exception:
-                    pass
-                
-                # Verifica catalog (metadados do documento)
-                try:
-                    if hasattr(reader, 'trailer') and reader.trailer:
-                        catalog = reader.trailer.get('/Root')
-                        if catalog:
-                            is_dangerous, reason = check_object_for_dangerous_content(catalog, "catalog")
-                            if is_dangerous:
-                                result_queue.put((False, f'PDF contém conteúdo perigoso no catalog: {reason}'))
-                                return
-                except Exception:
-                    pass
-                
-                # Verifica metadados
-                try:
-                    if reader.metadata:
-                        is_dangerous, reason = check_object_for_dangerous_content(reader.metadata, "metadata")
-                        if is_dangerous:
-                            result_queue.put((False, f'PDF contém conteúdo perigoso nos metadados: {reason}'))
-                            return
-                except Exception:
-                    pass
-                
-                # Varre páginas (limitado a MAX_PAGES)
-                try:
-                    pages_to_check = min(num_pages, MAX_PAGES)
-                    for i, page in enumerate(reader.pages[:pages_to_check]):
-                        # Verifica a página completa
-                        is_dangerous, reason = check_object_for_dangerous_content(page, f"page_{i}")
-                        if is_dangerous:
-                            result_queue.put((False, f'PDF contém conteúdo perigoso na página {i+1}: {reason}'))
-                            return
-                        
-                        # Verifica annotations da página
-                        if '/Annots' in page:
-                            try:
-                                annots = page['/Annots']
-                                if annots:
-                                    is_dangerous, reason = check_object_for_dangerous_content(annots, f"page_{i}_annotations")
-                                    if is_dangerous:
-                                        result_queue.put((False, f'PDF contém anotações perigosas na página {i+1}: {reason}'))
-                                        return
-                            except Exception:
-                                pass
-                        
-                        # Verifica AA (Additional Actions) da página
-                        if '/AA' in page:
-                            result_queue.put((False, f'PDF contém ações automáticas na página {i+1}'))
-                            return
-                except Exception as e:
-                    # Se houver erro ao processar páginas, rejeita por segurança
-                    result_queue.put((False, f'Erro ao processar páginas: {str(e)}'))
-                    return
-                
-                # Verifica embedded files
-                try:
-                    if hasattr(reader, 'attachments') or '/EmbeddedFiles' in str(reader.trailer):
-                        result_queue.put((False, 'PDF contém arquivos embutidos (potencialmente perigoso)'))
-                        return
-                except Exception:
-                    pass
-                
-                result_queue.put((True, 'OK'))
-        except Exception as e:
-            result_queue.put((False, f'Falha ao abrir PDF: {e}'))
-    
-    try:
-        # Usa threading para timeout que funciona em Windows e Unix
-        result_queue = Queue()
-        scan_thread = threading.Thread(target=_scan_pdf_worker, args=(file_path, result_queue))
-        scan_thread.daemon = True
-        scan_thread.start()
-        scan_thread.join(timeout=TIMEOUT_SECONDS)
-        
-        if scan_thread.is_alive():
-            # Thread ainda está rodando = timeout
-            return False, f'Timeout ao processar PDF (limite: {TIMEOUT_SECONDS}s)'
-        
-        # Verifica resultado
-        if result_queue.empty():
-            return False, 'Erro ao processar PDF (sem resultado)'
-        
-        return result_queue.get()
-                
-    except Exception as e:
-        return False, f'Falha ao processar PDF: {e}'
-
 def get_client_ip(request_obj):
     """Obtém o IP real do cliente, considerando proxies"""
     # Prioridade para headers de proxy
@@ -439,6 +215,12 @@ def get_client_ip(request_obj):
     else:
         return request_obj.remote_addr
 
+@event.listens_for(Signature, 'after_update')
+@event.listens_for(Signature, 'after_delete')
+def invalidate_validation_results(mapper, connection, target):
+    """Descarta os resultados de validação em cache do registro alterado ou removido"""
+    validation_cache.invalidate(target.id)
+
 def create_app(config_name=None):
     """Factory function para criar a aplicação Flask"""
     if config_name is None:
@@ -464,11 +246,26 @@ def create_app(config_name=None):
         app.config['REMEMBER_COOKIE_SECURE'] = False
     app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=24)
     app.config['MAX_CONTENT_LENGTH'] = 20 * 1024 * 1024
+    # PDFs enviados são gravados em TEMP_DIR durante a leitura do multipart, com
+    # SHA-256, tamanho e cabeçalho calculados na mesma passada
+    app.request_class = StreamingUploadRequest
+    app.config['UPLOAD_TEMP_DIR'] = TEMP_DIR
     if os.environ.get('SERVER_NAME'):
         app.config['SERVER_NAME'] = os.environ.get('SERVER_NAME')
     
     # Segurança: confiar no proxy e habilitar CSRF
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_port=1)
+
+    @app.before_request
+    def raise_batch_upload_limit():
+        """Limite do lote em /validate/batch (cada PDF continua limitado a MAX_CONTENT_LENGTH)
+        
+        Registrado antes do CSRFProtect: a verificação do token lê o formulário,
+        e o limite precisa valer antes dessa leitura.
+        """
+        if request.endpoint == 'validate_pdf_batch':
+            request.max_content_length = batch_validator.max_bytes
+
     if app.config.get('WTF_CSRF_ENABLED', True):
         CSRFProtect(app)
     # HSTS/CSP via Talisman em produção (opcional)
@@ -531,6 +328,24 @@ def create_app(config_name=None):
                         conn.execute(db.text('ALTER TABLE signatures ADD COLUMN document_type_id INTEGER'))
             except Exception:
                 pass
+            # Adiciona coluna stamp_placement em document_types se não existir
+            try:
+                inspector = db.inspect(db.engine)
+                cols = [c['name'] for c in inspector.get_columns('document_types')]
+                if 'stamp_placement' not in cols:
+                    with db.engine.begin() as conn:
+                        conn.execute(db.text("ALTER TABLE document_types ADD COLUMN stamp_placement VARCHAR(20) NOT NULL DEFAULT 'all'"))
+            except Exception:
+                pass
+            # Adiciona coluna document_analysis em signatures se não existir
+            try:
+                inspector = db.inspect(db.engine)
+                cols = [c['name'] for c in inspector.get_columns('signatures')]
+                if 'document_analysis' not in cols:
+                    with db.engine.begin() as conn:
+                        conn.execute(db.text('ALTER TABLE signatures ADD COLUMN document_analysis TEXT'))
+            except Exception:
+                pass
     except Exception:
         pass
     
@@ -677,6 +492,13 @@ def create_app(config_name=None):
         except Exception as e:
             print(f"Não foi possível iniciar o agendador de limpeza: {e}")
     
+    # Pré-inicia os processos de verificação de PDFs (evita o custo do spawn no primeiro envio)
+    if os.environ.get('SCANNER_PRESTART', 'true').lower() == 'true' and not app.config.get('TESTING'):
+        try:
+            get_scanner_engine().prestart()
+        except Exception as e:
+            print(f"Não foi possível iniciar os processos de verificação de PDF: {e}")
+    
     return app
 
 def register_routes(app):
@@ -691,6 +513,7 @@ def register_routes(app):
             if action == 'create':
                 name = request.form.get('name', '').strip()
                 description = request.form.get('description', '').strip()
+                stamp_placement = normalize_placement(request.form.get('stamp_placement'))
                 if not name:
                     flash('Nome do tipo é obrigatório', 'error')
                 else:
@@ -698,7 +521,7 @@ def register_routes(app):
                     if DocumentType.query.filter(db.func.lower(DocumentType.name) == name.lower()).first():
                         flash('Já existe um tipo com este nome.', 'error')
                     else:
-                        dt = DocumentType(name=name, description=description)
+                        dt = DocumentType(name=name, description=description, stamp_placement=stamp_placement)
                         db.session.add(dt)
                         db.session.commit()
                         flash('Tipo de documento criado com sucesso!', 'success')
@@ -708,6 +531,7 @@ def register_routes(app):
                 name = request.form.get('name', '').strip()
                 description = request.form.get('description', '').strip()
                 active = request.form.get('active') == 'on'
+                stamp_placement = normalize_placement(request.form.get('stamp_placement'))
                 dt = DocumentType.query.get_or_404(dt_id)
                 if not name:
                     flash('Nome do tipo é obrigatório', 'error')
@@ -720,6 +544,7 @@ def register_routes(app):
                         dt.name = name
                         dt.description = description
                         dt.active = active
+                        dt.stamp_placement = stamp_placement
                         db.session.commit()
                         flash('Tipo de documento atualizado!', 'success')
                 return redirect(url_for('admin_document_types'))
@@ -741,7 +566,7 @@ def register_routes(app):
             like = f"%{q}%"
             query = query.filter(db.or_(DocumentType.name.ilike(like), DocumentType.description.ilike(like)))
         items = query.order_by(DocumentType.active.desc(), DocumentType.name.asc()).all()
-        return render_template('admin/document_types.html', items=items, q=q)
+        return render_template('admin/document_types.html', items=items, q=q, stamp_placements=STAMP_PLACEMENT_LABELS)
     """Register all application routes"""
     
     # Helpers de configuração de armazenamento de PDFs
@@ -759,6 +584,45 @@ def register_routes(app):
         else:
             setting.value = 'true' if value else 'false'
         db.session.commit()
+    
+    def stamping_unavailable_response(exc, as_json=True):
+        """Resposta quando o motor de carimbo não processou o documento
+
+        429 (fila cheia), 504 (tempo limite), 413 (teto de memória) ou 503
+        (processo perdido), com Retry-After quando houver estimativa.
+        """
+        if exc.status_code == 429:
+            message = 'Servidor ocupado processando outros documentos. Tente novamente em instantes.'
+        elif exc.status_code == 413:
+            message = 'O documento é grande demais para ser processado. Reduza o tamanho do arquivo.'
+        elif exc.status_code == 504:
+            message = 'O processamento do documento excedeu o tempo limite. Tente novamente.'
+        else:
+            message = 'Falha temporária ao processar o documento. Tente novamente.'
+        if as_json:
+            response = jsonify({'success': False, 'message': message, 'retry_after': exc.retry_after})
+        else:
+            flash(message, 'warning')
+            response = make_response(render_template('signature/draw.html'))
+        response.status_code = exc.status_code
+        if exc.retry_after:
+            response.headers['Retry-After'] = str(exc.retry_after)
+        return response
+    
+    @app.route('/admin/metrics')
+    @login_required
+    @admin_required
+    def admin_metrics():
+        """Métricas internas de processamento (JSON)"""
+        return jsonify({
+            'stamping': stamping_engine.get_metrics(),
+            'scanning': get_scanner_engine().get_metrics(),
+            'scan_cache': scan_verdict_cache.get_metrics(),
+            'content_store': content_store.usage(original_references()),
+            'key_material': key_material_cache.get_metrics(),
+            'validation_cache': validation_cache.get_metrics()
+        })
+    
     @app.route('/admin/settings', methods=['GET', 'POST'])
     @login_required
     @admin_required
@@ -968,6 +832,8 @@ def register_routes(app):
             
             if action == 'cleanup_temp':
                 cleanup_temp_files()
+                cleanup_resumable_uploads()
+                cleanup_original_blobs()
                 flash('Limpeza de arquivos temporários executada.', 'success')
             elif action == 'cleanup_old':
                 cleanup_old_files()
@@ -979,6 +845,8 @@ def register_routes(app):
             elif action == 'cleanup_all':
                 from flask import current_app
                 cleanup_temp_files_all()  # Remove TODOS os arquivos temporários
+                cleanup_resumable_uploads()
+                cleanup_original_blobs()
                 cleanup_signed_pdfs_temp()
                 cleanup_old_files()
                 cleanup_old_files_by_database(app_instance=current_app._get_current_object())
@@ -989,18 +857,21 @@ def register_routes(app):
         # Estatísticas dos diretórios
         temp_files_count = 0
         signed_files_count = 0
+        originals_usage = None
         
         try:
             if os.path.exists(TEMP_DIR):
                 temp_files_count = len([f for f in os.listdir(TEMP_DIR) if os.path.isfile(os.path.join(TEMP_DIR, f))])
             if os.path.exists(PDF_SIGNED_DIR):
                 signed_files_count = len([f for f in os.listdir(PDF_SIGNED_DIR) if os.path.isfile(os.path.join(PDF_SIGNED_DIR, f))])
+            originals_usage = content_store.usage(original_references())
         except Exception as e:
             flash(f'Erro ao obter estatísticas: {e}', 'error')
         
         return render_template('admin/cleanup.html', 
                              temp_files_count=temp_files_count,
-                             signed_files_count=signed_files_count)
+                             signed_files_count=signed_files_count,
+                             originals_usage=originals_usage)
     
     @app.route('/')
     @login_required
@@ -1899,8 +1770,11 @@ def register_routes(app):
             file_id = str(uuid.uuid4())
             filename = f"{file_id}_{pdf_file.filename}"
             temp_path = os.path.join(TEMP_DIR, filename)
-            pdf_file.save(temp_path)
-            ok_pdf, msg_pdf = scan_pdf_safeness(temp_path)
+            received = upload_ingestor.receive(pdf_file, pdf_file.filename, file_id, temp_path)
+            if not received['ok']:
+                flash(f"PDF rejeitado: {received['message']}", 'error')
+                return render_template('signature/upload.html')
+            ok_pdf, msg_pdf, analysis = analyze_pdf_upload(temp_path, digest=received['sha256'])
             if not ok_pdf:
                 try:
                     os.remove(temp_path)
@@ -1909,11 +1783,14 @@ def register_routes(app):
                 flash(f'PDF rejeitado: {msg_pdf}', 'error')
                 return render_template('signature/upload.html')
             
-            # Salva informações na sessão
+            # Salva informações na sessão (a análise sem as dimensões das páginas,
+            # que não cabem no cookie de sessão)
             session['signature_process'] = {
                 'file_id': file_id,
                 'original_filename': pdf_file.filename,
                 'temp_path': temp_path,
+                'analysis': {key: value for key, value in analysis.items() if key != 'page_boxes'},
+                'sha256': received['sha256'],
                 'step': 'upload_completed'
             }
             
@@ -2028,8 +1905,8 @@ def register_routes(app):
         try:
             process_data = session['signature_process']
             
-            # Cria arquivo de saída
-            fd, output_path = tempfile.mkstemp(suffix='.pdf')
+            # Cria arquivo de saída no próprio diretório final, para ser renomeado sem cópia
+            fd, output_path = tempfile.mkstemp(suffix='.pdf', dir=PDF_SIGNED_DIR)
             os.close(fd)
             
             # Lê a imagem da assinatura do arquivo
@@ -2046,7 +1923,8 @@ def register_routes(app):
                 output_path,
                 signature_image_data,
                 process_data['client_info'],
-                create_logo_image()
+                create_logo_image(),
+                analysis=process_data.get('analysis')
             )
             
             if success:
@@ -2058,7 +1936,7 @@ def register_routes(app):
                 clean_final_filename = process_data['original_filename'].replace('.pdf', '_assinado.pdf')
                 stored_final_filename = f"{process_data['file_id']}_{clean_final_filename.replace('.pdf', f'_{retention_tag}.pdf')}"
                 final_path = os.path.join(PDF_SIGNED_DIR, stored_final_filename)
-                shutil.move(output_path, final_path)
+                os.replace(output_path, final_path)
                 
                 # NOTA: O hash será calculado APÓS aplicar o carimbo/assinatura visual
                 # na função client_sign_document, não aqui
@@ -2087,7 +1965,9 @@ def register_routes(app):
                     original_filename=process_data['original_filename'],
                     signature_hash='',  # Será preenchido após assinatura do cliente
                     signature_algorithm='PENDING',  # Será preenchido após assinatura do cliente
-                    file_size=0,  # Será preenchido após assinatura do cliente
+                    file_size=success['size'],  # Tamanho do PDF carimbado (conferido no download)
+                    document_analysis=json.dumps(process_data['analysis']) if process_data.get('analysis') else None,
+                    pdf_hash_cached=process_data.get('sha256'),  # SHA-256 do PDF enviado, calculado no upload
                     
                     # Informações do Cliente/Assinante
                     client_name=client_info.get('nome', ''),
@@ -2126,9 +2006,15 @@ def register_routes(app):
                 flash('PDF assinado com sucesso! Pronto para download.', 'success')
                 return redirect(url_for('signature_download'))
             else:
+                try:
+                    os.remove(output_path)
+                except Exception:
+                    pass
                 flash('Erro ao processar o PDF', 'error')
                 return redirect(url_for('signature_upload'))
                 
+        except StampingUnavailable as e:
+            return stamping_unavailable_response(e, as_json=False)
         except Exception as e:
             flash(f'Erro: {str(e)}', 'error')
             return redirect(url_for('signature_upload'))
@@ -2166,12 +2052,15 @@ def register_routes(app):
             if file_path and os.path.exists(file_path):
                 # Verifica se o arquivo não está corrompido
                 try:
-                    # Testa se é um PDF válido
-                    with open(file_path, 'rb') as f:
-                        pdf_reader = PyPDF2.PdfReader(f)
-                        # Tenta acessar a primeira página para validar
-                        if len(pdf_reader.pages) > 0:
-                            first_page = pdf_reader.pages[0]
+                    # O tamanho gravado na assinatura e a análise do upload dispensam
+                    # reabrir o PDF; sem registro, testa se é um PDF válido
+                    signature_record = Signature.query.filter_by(file_id=file_id, user_id=current_user.id).first()
+                    analysis = signature_record.get_document_analysis() if signature_record else None
+                    if not (analysis and analysis.get('page_count') and signature_record.file_size == os.path.getsize(file_path)):
+                        with open_pdf(file_path) as document:
+                            # Tenta acessar a primeira página para validar
+                            if document.page_count > 0:
+                                document.page_geometry(0)
                     
                     # Se chegou até aqui, o PDF está válido
                     # Limpa a sessão APÓS confirmar que o arquivo é válido
@@ -2320,12 +2209,14 @@ def register_routes(app):
         from models import DocumentType
         document_types = DocumentType.query.filter_by(active=True).order_by(DocumentType.name.asc()).all()
         if request.method == 'POST':
-            if 'pdf_files' not in request.files:
+            # PDFs grandes enviados antes em partes (uploads retomáveis concluídos)
+            upload_ids = [upload_id for upload_id in request.form.getlist('upload_ids[]') if upload_id]
+            if 'pdf_files' not in request.files and not upload_ids:
                 flash('Nenhum arquivo PDF foi enviado', 'error')
                 return render_template('internal/upload.html', document_types=document_types)
             
-            pdf_files = request.files.getlist('pdf_files')
-            if not pdf_files or pdf_files[0].filename == '':
+            pdf_files = [pdf_file for pdf_file in request.files.getlist('pdf_files') if pdf_file.filename != '']
+            if not pdf_files and not upload_ids:
                 flash('Nenhum arquivo selecionado', 'error')
                 return render_template('internal/upload.html', document_types=document_types)
             
@@ -2337,7 +2228,7 @@ def register_routes(app):
                 else:
                     flash(f'Arquivo {pdf_file.filename} não é um PDF válido', 'error')
             
-            if not valid_files:
+            if not valid_files and not upload_ids:
                 return render_template('internal/upload.html', document_types=document_types)
             
             # Tipo de Documento (obrigatório)
@@ -2404,53 +2295,53 @@ def register_routes(app):
             is_multi_signer = len(signers_data) > 1
             total_signers = len(signers_data)
             
-            # Processa cada arquivo
-            signature_ids = []
+            # Recebe os arquivos em paralelo (gravação + hash, cabeçalho, verificação e análise);
+            # no modo assíncrono apenas grava, e a verificação segue em segundo plano
+            from werkzeug.utils import secure_filename
+            for upload_id in upload_ids:
+                try:
+                    valid_files.append(resumable_uploads.take(upload_id, current_user.id))
+                except ResumableUploadError as e:
+                    flash(f'Envio em partes {upload_id}: {e}', 'error')
+            uploads = []
             for pdf_file in valid_files:
                 file_id = str(uuid.uuid4())
-                from werkzeug.utils import secure_filename
                 safe_name = secure_filename(pdf_file.filename)
-                filename = f"{file_id}_{safe_name}"
-                temp_path = os.path.join(TEMP_DIR, filename)
-                pdf_file.save(temp_path)
-                # valida cabeçalho PDF
-                try:
-                    with open(temp_path, 'rb') as f:
-                        if f.read(4) != b'%PDF':
-                            os.remove(temp_path)
-                            flash(f'Arquivo {safe_name} inválido (não é PDF).', 'error')
-                            continue
-                except Exception:
-                    try:
-                        os.remove(temp_path)
-                    except Exception:
-                        pass
-                    flash(f'Falha ao ler {safe_name}', 'error')
-                    continue
-                # varredura de segurança
-                ok_pdf, msg_pdf = scan_pdf_safeness(temp_path)
-                if not ok_pdf:
-                    try:
-                        os.remove(temp_path)
-                    except Exception:
-                        pass
-                    flash(f'Arquivo rejeitado: {msg_pdf}', 'error')
+                uploads.append((pdf_file, pdf_file.filename, file_id, os.path.join(TEMP_DIR, f"{file_id}_{safe_name}")))
+            async_ingest = UPLOAD_ASYNC_INGEST
+            if async_ingest:
+                results = [upload_ingestor.receive(*upload) for upload in uploads]
+            else:
+                results = upload_ingestor.ingest(uploads)
+                # Originais aprovados idênticos passam a compartilhar um único arquivo
+                for result in results:
+                    if result['ok']:
+                        result['temp_path'] = store_original(result['temp_path'], result['sha256'])
+            
+            # Registros de todos os arquivos aceitos inseridos em uma única transação
+            from models import SignatureSigner, generate_ulid
+            first_signer = signers_data[0]
+            records = []
+            for result in results:
+                if not result['ok']:
+                    flash(f"Arquivo {result['filename']} rejeitado: {result['message']}", 'error')
                     continue
                 
                 # Cria registro de assinatura pendente
                 # Para compatibilidade, mantém dados do primeiro assinante no Signature principal
-                first_signer = signers_data[0]
                 signature_record = Signature(
+                    id=generate_ulid(),
                     user_id=current_user.id,
-                    file_id=file_id,
-                    original_filename=pdf_file.filename,
+                    file_id=result['file_id'],
+                    original_filename=result['filename'],
                     signature_hash='',  # Será preenchido após todas as assinaturas
                     signature_algorithm='PENDING',
                     timestamp=datetime.now(),
-                    file_size=os.path.getsize(temp_path),
+                    file_size=result['size'],
+                    pdf_hash_cached=result['sha256'],
                     signature_valid=False,
-                    status='pending',
-                    pdf_file_path=temp_path,
+                    status='ingesting' if async_ingest else 'pending',
+                    pdf_file_path=result['temp_path'],
                     document_type_id=document_type_id,
                     # Dados do primeiro assinante para compatibilidade
                     client_name=first_signer['name'],
@@ -2467,14 +2358,13 @@ def register_routes(app):
                     total_signers=total_signers,
                     signed_signers_count=0
                 )
-                
-                db.session.add(signature_record)
-                db.session.flush()  # Para obter o ID do signature
+                signature_record.set_document_analysis(result['analysis'])
+                records.append(signature_record)
+                result['signature_id'] = signature_record.id
                 
                 # Cria registros SignatureSigner para cada assinante
-                from models import SignatureSigner
                 for signer_data in signers_data:
-                    signer_record = SignatureSigner(
+                    records.append(SignatureSigner(
                         signature_id=signature_record.id,
                         signer_name=signer_data['name'],
                         signer_cpf=signer_data['cpf'],
@@ -2483,18 +2373,32 @@ def register_routes(app):
                         signer_birth_date=signer_data['birth_date'],
                         signer_address=signer_data['address'],
                         status='pending'
-                    )
-                    db.session.add(signer_record)
-                
-                signature_ids.append(file_id)
+                    ))
             
-            db.session.commit()
-            
-            flash(f'{len(valid_files)} arquivo(s) enviado(s) com sucesso! Aguardando assinatura do cliente.', 'success')
+            accepted = [result for result in results if result['ok']]
+            if records:
+                db.session.add_all(records)
+                db.session.commit()
+            if async_ingest:
+                # Após o commit, para que a verificação em segundo plano encontre os registros
+                for result in accepted:
+                    upload_ingestor.submit(finish_upload_ingest, app, result['signature_id'], result['temp_path'], result['sha256'])
+            
+            outcomes = [
+                {'file': result['filename'], 'ok': result['ok'], 'message': result['message'], 'seconds': round(result['seconds'], 3)}
+                for result in results
+            ]
             try:
-                log_event(action='internal_upload', actor_user_id=current_user.id, status='success', ip_address=get_client_ip(request), details={"files": len(valid_files)})
+                log_event(action='internal_upload', actor_user_id=current_user.id, status='success' if accepted else 'failure',
+                          ip_address=get_client_ip(request), details={"files": len(results), "accepted": len(accepted), "outcomes": outcomes})
             except Exception:
                 pass
+            if not accepted:
+                return render_template('internal/upload.html', document_types=document_types)
+            if async_ingest:
+                flash(f'{len(accepted)} de {len(results)} arquivo(s) recebido(s). A verificação continua em segundo plano; acompanhe o andamento na lista de pendentes.', 'success')
+            else:
+                flash(f'{len(accepted)} de {len(results)} arquivo(s) enviado(s) com sucesso! Aguardando assinatura do cliente.', 'success')
             return redirect(url_for('internal_pending_signatures'))
         
         return render_template('internal/upload.html', document_types=document_types)
@@ -2504,10 +2408,11 @@ def register_routes(app):
     def internal_pending_signatures():
         """Tela interna: Lista de assinaturas pendentes"""
         from models import SignatureSigner
-        # Busca assinaturas pendentes do usuário logado
-        pending_signatures = Signature.query.filter_by(
-            user_id=current_user.id,
-            status='pending'
+        expire_stale_ingests(current_user.id)
+        # Busca assinaturas pendentes do usuário logado (incluindo as ainda em verificação)
+        pending_signatures = Signature.query.filter(
+            Signature.user_id == current_user.id,
+            Signature.status.in_(['pending', 'ingesting'])
         ).order_by(Signature.timestamp.desc()).all()
         
         # Busca assinantes para cada assinatura
@@ -2535,6 +2440,82 @@ def register_routes(app):
         
         return render_template('internal/pending.html', clients=clients)
     
+    @app.route('/internal/signature/status')
+    @login_required
+    def internal_ingest_status():
+        """Tela interna: andamento da verificação dos uploads (JSON)
+
+        ids: identificadores separados por vírgula; sem ids, lista os
+        documentos do usuário ainda em verificação.
+        """
+        expire_stale_ingests(current_user.id)
+        query = Signature.query.filter(Signature.user_id == current_user.id)
+        ids = [value for value in request.args.get('ids', '').split(',') if value][:200]
+        if ids:
+            query = query.filter(Signature.id.in_(ids))
+        else:
+            query = query.filter(Signature.status == 'ingesting')
+        items = []
+        for signature in query.all():
+            analysis = signature.get_document_analysis() or {}
+            items.append({
+                'id': signature.id,
+                'filename': signature.original_filename,
+                'status': ingest_status(signature),
+                'message': signature.verification_notes if signature.verification_status == 'rejected' else None,
+                'pages': analysis.get('page_count'),
+                'size': signature.file_size
+            })
+        return jsonify({
+            'success': True,
+            'ingesting': sum(1 for item in items if item['status'] == 'ingesting'),
+            'signatures': items
+        })
+    
+    @app.route('/internal/uploads', methods=['POST'])
+    @login_required
+    def internal_resumable_create():
+        """Upload retomável: cria o upload (Upload-Length e Upload-Metadata com filename em base64)"""
+        try:
+            length = int(request.headers.get('Upload-Length', ''))
+        except ValueError:
+            return resumable_error('Upload-Length inválido', 400)
+        max_length = app.config.get('MAX_CONTENT_LENGTH')
+        if length <= 0 or (max_length and length > max_length):
+            return resumable_error(f'Arquivo excede o limite de {max_length // (1024 * 1024)} MB', 413)
+        filename = parse_upload_metadata(request.headers.get('Upload-Metadata', '')).get('filename', '')
+        if not filename.lower().endswith('.pdf'):
+            return resumable_error('Apenas arquivos PDF são permitidos', 400)
+        upload = resumable_uploads.create(current_user.id, filename, length)
+        response = jsonify({'success': True, 'id': upload['id'], 'offset': 0, 'length': length})
+        response.status_code = 201
+        response.headers['Location'] = url_for('internal_resumable_upload', upload_id=upload['id'])
+        return resumable_headers(response, upload)
+    
+    @app.route('/internal/uploads/<upload_id>', methods=['HEAD', 'PATCH', 'DELETE'])
+    @login_required
+    @app.limiter.limit("600 per minute")
+    def internal_resumable_upload(upload_id):
+        """Upload retomável: progresso (HEAD), próxima parte (PATCH) ou descarte (DELETE)"""
+        try:
+            if request.method == 'HEAD':
+                response = app.response_class(status=200)
+                response.headers['Cache-Control'] = 'no-store'
+                return resumable_headers(response, resumable_uploads.info(upload_id, current_user.id))
+            if request.method == 'DELETE':
+                resumable_uploads.delete(upload_id, current_user.id)
+                return resumable_headers(app.response_class(status=204))
+            if request.mimetype != 'application/offset+octet-stream':
+                return resumable_error('Content-Type deve ser application/offset+octet-stream', 415)
+            try:
+                offset = int(request.headers.get('Upload-Offset', ''))
+            except ValueError:
+                return resumable_error('Upload-Offset inválido', 400)
+            upload = resumable_uploads.append(upload_id, current_user.id, offset, request.stream)
+            return resumable_headers(app.response_class(status=204), upload)
+        except ResumableUploadError as e:
+            return resumable_error(str(e), e.status_code)
+    
     @app.route('/internal/signature/edit/<signature_id>', methods=['GET', 'POST'])
     @login_required
     def internal_edit_signature(signature_id):
@@ -2950,12 +2931,22 @@ def register_routes(app):
                             signature.status = 'completed'
                             signature.verification_status = 'verified'
                             signature.signature_method = 'drawing'
+                        except StampingUnavailable:
+                            raise
                         except Exception as pdf_err:
                             print(f"Erro ao processar PDF final: {pdf_err}")
                             # Continua mesmo se falhar processamento do PDF
                     else:
                         # Ainda há assinantes pendentes - mantém status pending
                         signature.status = 'pending'
+                        # Carimba este assinante agora (revisão incremental); a finalização
+                        # carimba quem faltar caso esta etapa falhe
+                        try:
+                            add_signer_stamp_revision(signature, signer)
+                        except StampingUnavailable:
+                            raise
+                        except Exception as stamp_err:
+                            print(f"Erro ao carimbar revisão do assinante: {stamp_err}")
                     
                     signature.updated_at = datetime.now()
                     
@@ -2973,8 +2964,16 @@ def register_routes(app):
                             pass
 
                     if os.path.exists(original_path):
-                        # Cria saída temporária de forma segura (evita race condition)
-                        fd, output_path = tempfile.mkstemp(suffix='.pdf')
+                        # Política de retenção
+                        keep_pdfs = get_store_pdfs_flag()
+                        retention_tag = 'KEEP' if keep_pdfs else 'TEMP'
+                        clean_final_filename = signature.original_filename.replace('.pdf', '_assinado.pdf')
+                        stored_final_filename = f"{signature.file_id}_{clean_final_filename.replace('.pdf', f'_{retention_tag}.pdf')}"
+                        final_path = os.path.join(PDF_SIGNED_DIR, stored_final_filename)
+                        
+                        # Cria saída temporária de forma segura (evita race condition) no
+                        # próprio diretório final, para ser renomeada sem cópia
+                        fd, output_path = tempfile.mkstemp(suffix='.pdf', dir=PDF_SIGNED_DIR)
                         os.close(fd)  # Fecha o descritor, mantém o arquivo para uso posterior
                         # Dados do cliente para inserir no PDF
                         client_info = {
@@ -2982,42 +2981,34 @@ def register_routes(app):
                             'cpf': signature.client_cpf,
                             'data_nascimento': signature.client_birth_date.isoformat() if getattr(signature, 'client_birth_date', None) else ''
                         }
-                        # Gera o PDF com a imagem da assinatura
-                        generated = add_signature_to_all_pages(
+                        # Metadados gravados na mesma passada do carimbo
+                        metadata = build_signature_metadata({
+                            'hash': signature.signature_hash,  # Usa o hash já calculado
+                            'timestamp': datetime.now().isoformat(),
+                            'algorithm': signature.signature_algorithm
+                        })
+                        # Gera o PDF com a imagem da assinatura, os metadados e o hash em uma única escrita
+                        stamp_stats = add_signature_to_all_pages(
                             original_path,
                             '',
                             output_path,
                             signature_image,
                             client_info,
-                            create_logo_image()
+                            create_logo_image(),
+                            metadata=metadata,
+                            placement=get_stamp_placement(signature),
+                            analysis=signature.get_document_analysis()
                         )
-                        if generated and os.path.exists(output_path):
-                            # Política de retenção
-                            keep_pdfs = get_store_pdfs_flag()
-                            retention_tag = 'KEEP' if keep_pdfs else 'TEMP'
-                            clean_final_filename = signature.original_filename.replace('.pdf', '_assinado.pdf')
-                            stored_final_filename = f"{signature.file_id}_{clean_final_filename.replace('.pdf', f'_{retention_tag}.pdf')}"
-                            final_path = os.path.join(PDF_SIGNED_DIR, stored_final_filename)
-                            shutil.move(output_path, final_path)
-                            
-                            # Lê o PDF final e recalcula o hash
-                            with open(final_path, 'rb') as f:
-                                final_content = f.read()
-                            
-                            # Embute metadados primeiro
-                            signature_info = {
-                                'hash': signature.signature_hash,  # Usa o hash já calculado
-                                'timestamp': datetime.now().isoformat(),
-                                'algorithm': signature.signature_algorithm
-                            }
-                            embed_signature_metadata(final_path, signature_info)
-                            
-                            # Lê o PDF final (com carimbo + metadados)
-                            with open(final_path, 'rb') as f:
-                                final_content = f.read()
+                        if not stamp_stats:
+                            try:
+                                os.remove(output_path)
+                            except Exception:
+                                pass
+                        if stamp_stats and os.path.exists(output_path):
+                            os.replace(output_path, final_path)
                             
-                            # Assina o PDF final usando o certificado X.509 do sistema
-                            signature_info = certificate_manager.sign_pdf_with_certificate(final_content)
+                            # Assina o digest calculado na escrita usando o certificado X.509 do sistema
+                            signature_info = certificate_manager.sign_pdf_digest(stamp_stats['sha256'])
                             if not signature_info:
                                 return jsonify({'success': False, 'message': 'Falha ao assinar com certificado do sistema.'})
                             
@@ -3040,7 +3031,7 @@ def register_routes(app):
                             signature.updated_at = datetime.now()
                             
                             # Atualiza no banco de dados
-                            signature.file_size = len(final_content)
+                            signature.file_size = stamp_stats['size']
                             
                             # Também atualiza o registro do SignatureSigner (compatibilidade)
                             try:
@@ -3108,6 +3099,10 @@ def register_routes(app):
                     'redirect': url_for('client_success')
                 })
                 
+            except StampingUnavailable as e:
+                # Desfaz a marcação do assinante para que ele possa tentar novamente
+                db.session.rollback()
+                return stamping_unavailable_response(e)
             except Exception as e:
                 return jsonify({'success': False, 'message': f'Erro ao assinar: {str(e)}'})
         
@@ -3232,26 +3227,25 @@ def register_routes(app):
                 # Salva arquivo temporariamente
                 fd, temp_path = tempfile.mkstemp(suffix='.pdf')
                 os.close(fd)
-                file.save(temp_path)
-                ok_pdf, msg_pdf = scan_pdf_safeness(temp_path)
+                # Grava calculando o hash na mesma passada (sem reler o arquivo)
+                received = upload_ingestor.receive(file, file.filename, '', temp_path)
+                if not received['ok']:
+                    flash(f"PDF rejeitado: {received['message']}", 'error')
+                    return render_template('validate.html')
+                ok_pdf, msg_pdf = scan_pdf_safeness(temp_path, digest=received['sha256'])
                 if not ok_pdf:
                     os.remove(temp_path)
                     flash(f'PDF rejeitado: {msg_pdf}', 'error')
                     return render_template('validate.html')
                 
-                # Tenta encontrar um registro de assinatura correspondente
-                # Procura por arquivos na pasta pdf_assinados que correspondam ao hash
-                with open(temp_path, 'rb') as f:
-                    pdf_content = f.read()
-                
-                from utils.crypto_utils import calculate_content_hash
-                current_hash = calculate_content_hash(pdf_content)
+                # Tenta encontrar um registro de assinatura correspondente pelo hash
+                current_hash = received['sha256']
                 
                 # Busca registro de assinatura com hash correspondente
                 signature_record = Signature.query.filter_by(signature_hash=current_hash).first()
                 
                 # Valida o PDF (com ou sem registro)
-                validation_result = pdf_validator.validate_pdf(temp_path, signature_record)
+                validation_result = pdf_validator.validate_pdf(temp_path, signature_record, digest=current_hash)
                 
                 # Limpa arquivo temporário
                 os.remove(temp_path)
@@ -3312,17 +3306,19 @@ def register_routes(app):
             if not file.filename.lower().endswith('.pdf'):
                 return jsonify({'error': 'Arquivo deve ser um PDF'}), 400
             
-            # Salva arquivo temporariamente
+            # Salva arquivo temporariamente (SHA-256 calculado durante a gravação)
             fd, temp_path = tempfile.mkstemp(suffix='.pdf')
             os.close(fd)
-            file.save(temp_path)
-            ok_pdf, msg_pdf = scan_pdf_safeness(temp_path)
+            received = upload_ingestor.receive(file, file.filename, '', temp_path)
+            if not received['ok']:
+                return jsonify({'error': f"PDF rejeitado: {received['message']}"}), 400
+            ok_pdf, msg_pdf = scan_pdf_safeness(temp_path, digest=received['sha256'])
             if not ok_pdf:
                 os.remove(temp_path)
                 return jsonify({'error': f'PDF rejeitado: {msg_pdf}'}), 400
             
             # Valida o PDF
-            validation_result = pdf_validator.validate_pdf(temp_path)
+            validation_result = pdf_validator.validate_pdf(temp_path, digest=received['sha256'])
             
             # Limpa arquivo temporário
             os.remove(temp_path)
@@ -3332,6 +3328,60 @@ def register_routes(app):
         except Exception as e:
             return jsonify({'error': f'Erro ao processar arquivo: {str(e)}'}), 500
 
+    @app.route('/validate/batch', methods=['POST'])
+    @login_required
+    @app.limiter.limit("10 per minute")
+    def validate_pdf_batch():
+        """Validação de vários PDFs num único envio, com resultados em NDJSON
+        
+        Aceita vários arquivos no campo pdf_files, um .zip no campo archive ou
+        o .zip como corpo (Content-Type: application/zip). Cada linha da
+        resposta é o resultado de um arquivo, na ordem em que terminam; a
+        última linha traz o resumo do lote (done: true).
+        """
+        # request.max_content_length já foi elevado em raise_batch_upload_limit
+        received = []
+        try:
+            if request.mimetype in ('application/zip', 'application/x-zip-compressed'):
+                received = batch_validator.receive_archive(
+                    request.stream, TEMP_DIR, upload_ingestor, app.config.get('MAX_CONTENT_LENGTH'))
+            elif request.files.get('archive') and request.files['archive'].filename:
+                received = batch_validator.receive_archive(
+                    request.files['archive'].stream, TEMP_DIR, upload_ingestor, app.config.get('MAX_CONTENT_LENGTH'))
+            else:
+                received = batch_validator.receive_files(request.files.getlist('pdf_files'), TEMP_DIR, upload_ingestor)
+            if not received:
+                return jsonify({'error': 'Nenhum arquivo fornecido'}), 400
+            
+            # Registros de todos os hashes do lote numa única consulta
+            records = signature_records_by_hash(item['sha256'] for item in received)
+        except BatchValidationError as e:
+            batch_validator.discard(received)
+            return jsonify({'error': str(e)}), e.status_code
+        except HTTPException:
+            # Envio acima do limite (413) ou interrompido
+            batch_validator.discard(received)
+            raise
+        except Exception as e:
+            batch_validator.discard(received)
+            return jsonify({'error': f'Erro ao processar lote: {str(e)}'}), 500
+        
+        log_validation_event(None, f'lote de {len(received)} arquivo(s)', ip_address=request.remote_addr)
+        
+        def generate():
+            summary = {'done': True, 'total': len(received), 'valid': 0, 'invalid': 0, 'errors': 0}
+            for result in batch_validator.run(received, records):
+                if result.get('error'):
+                    summary['errors'] += 1
+                elif result.get('valid'):
+                    summary['valid'] += 1
+                else:
+                    summary['invalid'] += 1
+                yield json.dumps(result, default=str) + '\n'
+            yield json.dumps(summary) + '\n'
+        
+        return app.response_class(generate(), mimetype='application/x-ndjson')
+
 # Diretório para arquivos temporários
 TEMP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp_files')
 if not os.path.exists(TEMP_DIR):
@@ -3541,6 +3591,12 @@ def run_daily_cleanup(app_instance, hour: int = 2, minute: int = 0, tz_name: str
             # Limpeza de arquivos temporários (1 hora)
             cleanup_temp_files()
             
+            # Uploads retomáveis abandonados (RESUMABLE_UPLOAD_RETENTION_HOURS)
+            cleanup_resumable_uploads()
+            
+            # Originais deduplicados sem registros pendentes que os referenciem
+            cleanup_original_blobs(app_instance=app_instance)
+            
             # Limpeza de PDFs temporários
             cleanup_signed_pdfs_temp()
             
@@ -3557,42 +3613,81 @@ def run_daily_cleanup(app_instance, hour: int = 2, minute: int = 0, tz_name: str
 
 SCHEDULER_STARTED = False
 
-def embed_signature_metadata(pdf_path, signature_info):
-    """Embute metadados de assinatura no PDF"""
+def cleanup_resumable_uploads():
+    """Remove uploads retomáveis sem atividade além do prazo configurado"""
     try:
-        # Lê o PDF
-        with open(pdf_path, 'rb') as f:
-            pdf_reader = PyPDF2.PdfReader(f)
-            pdf_writer = PyPDF2.PdfWriter()
-            
-            # Copia todas as páginas
-            for page in pdf_reader.pages:
-                pdf_writer.add_page(page)
-            
-            # Adiciona metadados de assinatura
-            metadata = pdf_reader.metadata or {}
-            metadata['/SignatureInfo'] = json.dumps(signature_info)
-            metadata['/SignatureDate'] = signature_info['timestamp']
-            metadata['/SignatureHash'] = signature_info['hash']
-            metadata['/SignatureAlgorithm'] = signature_info['algorithm']
-            pdf_writer.add_metadata(metadata)
-            
-            # Salva o PDF com metadados
-            with open(pdf_path, 'wb') as f:
-                pdf_writer.write(f)
-            
-            return True
+        removed = resumable_uploads.cleanup()
+        if removed:
+            print(f"Uploads em partes abandonados removidos: {removed}")
     except Exception as e:
-        print(f"Erro ao embutir metadados: {e}")
-        return False
+        print(f"Erro ao limpar uploads em partes: {e}")
+
+def parse_upload_metadata(value):
+    """Cabeçalho Upload-Metadata ('chave base64,chave base64') em dict"""
+    metadata = {}
+    for item in value.split(','):
+        parts = item.strip().split(' ', 1)
+        if not parts[0]:
+            continue
+        try:
+            metadata[parts[0]] = base64.b64decode(parts[1]).decode('utf-8') if len(parts) == 2 else ''
+        except (ValueError, UnicodeDecodeError):
+            continue
+    return metadata
+
+def resumable_headers(response, upload=None):
+    """Cabeçalhos do protocolo de upload retomável"""
+    response.headers['Tus-Resumable'] = '1.0.0'
+    if upload is not None:
+        response.headers['Upload-Offset'] = str(upload['offset'])
+        response.headers['Upload-Length'] = str(upload['length'])
+    return response
+
+def resumable_error(message, status_code):
+    response = jsonify({'success': False, 'error': message})
+    response.status_code = status_code
+    return resumable_headers(response)
+
+def signature_records_by_hash(digests):
+    """Registros de assinatura dos hashes informados, numa única consulta (IN)
+    
+    Devolve cópias com os campos usados na validação, para uso fora da sessão
+    do banco (threads da validação em lote).
+    
+    Returns:
+        dict: {signature_hash: registro}
+    """
+    digests = {digest for digest in digests if digest}
+    if not digests:
+        return {}
+    records = {}
+    rows = (Signature.query
+            .with_entities(Signature.id, Signature.file_id, Signature.signature_hash,
+                           Signature.signature_algorithm, Signature.signature_data)
+            .filter(Signature.signature_hash.in_(digests))
+            .all())
+    for row in rows:
+        records.setdefault(row.signature_hash, SimpleNamespace(
+            id=row.id, file_id=row.file_id, signature_hash=row.signature_hash,
+            signature_algorithm=row.signature_algorithm, signature_data=row.signature_data))
+    return records
+
+def build_signature_metadata(signature_info):
+    """Monta o dicionário /Info com os metadados de assinatura"""
+    return {
+        '/SignatureInfo': json.dumps(signature_info),
+        '/SignatureDate': signature_info['timestamp'],
+        '/SignatureHash': signature_info['hash'],
+        '/SignatureAlgorithm': signature_info['algorithm'],
+    }
 
 def extract_signature_metadata(pdf_path):
     """Extrai metadados de assinatura do PDF"""
     try:
-        with open(pdf_path, 'rb') as f:
-            pdf_reader = PyPDF2.PdfReader(f)
-            if pdf_reader.metadata and '/SignatureInfo' in pdf_reader.metadata:
-                return json.loads(pdf_reader.metadata['/SignatureInfo'])
+        with open_pdf(pdf_path) as document:
+            metadata = document.get_metadata()
+            if '/SignatureInfo' in metadata:
+                return json.loads(metadata['/SignatureInfo'])
     except Exception as e:
         print(f"Erro ao extrair metadados: {e}")
     return None
@@ -3632,24 +3727,231 @@ def create_logo_image():
     
     return logo_path
 
+# Chave do /Info com os assinantes já carimbados no PDF parcial ({id: posição})
+STAMPED_SIGNERS_KEY = '/AssinadorStampedSigners'
+
+# Políticas de posicionamento do carimbo exibidas no cadastro de tipos de documento
+STAMP_PLACEMENT_LABELS = {
+    'all': 'Todas as páginas',
+    'last': 'Última página',
+    'first_last': 'Primeira e última páginas',
+    'signature_page': 'Última página + página de assinaturas'
+}
+
+def get_stamp_placement(signature):
+    """Política de posicionamento do carimbo do tipo de documento da assinatura"""
+    document_type = getattr(signature, 'document_type', None)
+    return normalize_placement(document_type.stamp_placement if document_type else None)
+
+def resolve_original_pdf_path(signature):
+    """Resolve o caminho do PDF original de uma assinatura"""
+    original_path = signature.pdf_file_path or os.path.join(TEMP_DIR, f"{signature.file_id}_{signature.original_filename}")
+    if not os.path.exists(original_path):
+        # Tenta encontrar arquivo por file_id
+        try:
+            for name in os.listdir(TEMP_DIR):
+                if name.startswith(signature.file_id) and name.lower().endswith('.pdf'):
+                    original_path = os.path.join(TEMP_DIR, name)
+                    break
+        except Exception:
+            pass
+    return original_path
+
+def finish_upload_ingest(app, signature_id, temp_path, digest):
+    """Verificação e análise de um upload recebido no modo assíncrono (thread do upload_ingestor)
+
+    O registro sai de 'ingesting' para 'pending' (aprovado) ou 'cancelled' com
+    verification_status 'rejected' e o motivo em verification_notes.
+    """
+    from models import SignatureSigner
+    ok, message, analysis = upload_ingestor.analyze(temp_path, digest)
+    with app.app_context():
+        try:
+            signature = db.session.get(Signature, signature_id)
+            if signature is None or signature.status != 'ingesting':
+                # Removido ou expirado durante a verificação
+                if ok and (signature is None or signature.status == 'cancelled'):
+                    try:
+                        os.remove(temp_path)
+                    except OSError:
+                        pass
+                return
+            if ok:
+                signature.status = 'pending'
+                signature.set_document_analysis(analysis)
+                signature.pdf_file_path = store_original(temp_path, digest)
+            else:
+                reject_ingest(signature, message)
+                SignatureSigner.query.filter_by(signature_id=signature.id).update({'status': 'cancelled', 'updated_at': datetime.now()})
+            signature.updated_at = datetime.now()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Erro ao concluir verificação do upload {signature_id}: {e}")
+        finally:
+            db.session.remove()
+
+def reject_ingest(signature, message):
+    """Marca um upload como rejeitado na verificação (aparece entre os cancelados)"""
+    signature.status = 'cancelled'
+    signature.verification_status = 'rejected'
+    signature.verification_notes = message
+
+def ingest_status(signature):
+    """Estado de um upload para a consulta de andamento"""
+    if signature.status == 'cancelled' and signature.verification_status == 'rejected':
+        return 'rejected'
+    return signature.status
+
+def expire_stale_ingests(user_id):
+    """Rejeita uploads em 'ingesting' há mais de UPLOAD_INGEST_STALE_SECONDS
+
+    A verificação em segundo plano vive no processo que recebeu o envio; se ele
+    for reiniciado, o registro ficaria em 'ingesting' para sempre.
+    """
+    from models import SignatureSigner
+    limit = datetime.now() - timedelta(seconds=UPLOAD_INGEST_STALE_SECONDS)
+    stale = Signature.query.filter(
+        Signature.user_id == user_id,
+        Signature.status == 'ingesting',
+        Signature.updated_at < limit
+    ).all()
+    for signature in stale:
+        reject_ingest(signature, 'Verificação interrompida; envie o arquivo novamente')
+        SignatureSigner.query.filter_by(signature_id=signature.id).update({'status': 'cancelled', 'updated_at': datetime.now()})
+        if content_store.contains(signature.pdf_file_path):
+            continue  # Original compartilhado: removido pela limpeza quando não houver referências
+        try:
+            os.remove(signature.pdf_file_path)
+        except (OSError, TypeError):
+            pass
+    if stale:
+        db.session.commit()
+
+# Registros que ainda precisam do PDF original (referências aos originais deduplicados)
+ORIGINAL_REFERENCE_STATUSES = ('ingesting', 'pending')
+
+def store_original(temp_path, digest):
+    """Move um original aprovado para o armazenamento por conteúdo (services/content_store.py)
+
+    Retorna o caminho a gravar em Signature.pdf_file_path; em caso de falha o
+    arquivo continua em temp_path.
+    """
+    try:
+        return content_store.store(temp_path, digest)
+    except Exception as e:
+        print(f"Erro ao armazenar original {temp_path}: {e}")
+        return temp_path
+
+def original_references():
+    """{caminho do original deduplicado: registros que ainda o referenciam}"""
+    from sqlalchemy import func
+    rows = db.session.query(Signature.pdf_file_path, func.count(Signature.id)).filter(
+        Signature.status.in_(ORIGINAL_REFERENCE_STATUSES),
+        Signature.pdf_file_path.like(f"{content_store.directory}%")
+    ).group_by(Signature.pdf_file_path).all()
+    return {path: count for path, count in rows if content_store.contains(path)}
+
+def cleanup_original_blobs(app_instance=None):
+    """Remove os originais deduplicados que não são mais referenciados por nenhum registro"""
+    try:
+        if app_instance is None:
+            from flask import current_app
+            app_instance = current_app._get_current_object()
+        with app_instance.app_context():
+            removed, freed = content_store.collect(original_references())
+        if removed:
+            print(f"Originais sem referência removidos: {removed} ({freed / (1024 * 1024):.1f} MB)")
+    except Exception as e:
+        print(f"Erro ao limpar originais deduplicados: {e}")
+
+def get_partial_pdf_path(signature):
+    """Caminho do PDF parcial (revisões incrementais dos assinantes que já assinaram)
+
+    Não termina em .pdf para não ser confundido com o original; começa com o
+    file_id para ser removido pelas rotinas de limpeza junto com o original.
+    """
+    return os.path.join(TEMP_DIR, f"{signature.file_id}.parcial")
+
+def read_stamped_signers(pdf_path):
+    """Retorna {signer_id: posição} dos assinantes já carimbados no PDF parcial"""
+    try:
+        with open_pdf(pdf_path) as document:
+            metadata = document.get_metadata()
+            if STAMPED_SIGNERS_KEY in metadata:
+                return json.loads(metadata[STAMPED_SIGNERS_KEY])
+    except Exception as e:
+        print(f"Erro ao ler assinantes carimbados: {e}")
+    return {}
+
+def signer_stamp_data(signer, slot):
+    """Dados de um assinante para o carimbo, na posição (slot) da pilha"""
+    return {
+        'name': signer.signer_name,
+        'cpf': signer.signer_cpf,
+        'signature_image': signer.signature_image,
+        'signed_at': signer.signed_at.strftime("%d/%m/%Y %H:%M:%S") if signer.signed_at else None,
+        'slot': slot
+    }
+
+def assign_stamp_slots(signers, stamped, total_slots):
+    """Distribui os assinantes ainda não carimbados nas posições livres, em ordem de assinatura"""
+    free_slots = [slot for slot in range(total_slots) if slot not in set(stamped.values())]
+    pending = [signer for signer in signers if signer.id not in stamped]
+    return list(zip(pending, free_slots))
+
+def add_signer_stamp_revision(signature, signer):
+    """Carimba um assinante assim que ele assina (documentos com múltiplos assinantes)
+
+    O carimbo é acrescentado como revisão incremental ao PDF parcial, de modo
+    que a finalização precise carimbar apenas o último assinante.
+    """
+    partial_path = get_partial_pdf_path(signature)
+    analysis = None
+    if os.path.exists(partial_path):
+        base_path = partial_path
+        stamped = read_stamped_signers(partial_path)
+    else:
+        base_path = resolve_original_pdf_path(signature)
+        stamped = {}
+        if not os.path.exists(base_path):
+            raise Exception('Arquivo original não encontrado')
+        analysis = signature.get_document_analysis()
+
+    if signer.id in stamped:
+        return
+
+    total_slots = max(signature.total_signers or 0, len(stamped) + 1)
+    assigned = assign_stamp_slots([signer], stamped, total_slots)
+    if not assigned:
+        return
+    stamped[signer.id] = assigned[0][1]
+
+    fd, temp_output = tempfile.mkstemp(prefix=f"{signature.file_id}_", suffix='.tmp', dir=TEMP_DIR)
+    os.close(fd)
+    try:
+        # Processo separado (pool limitado); levanta StampingUnavailable (fila cheia, timeout)
+        stamping_engine.run(
+            stamp_multi_signer, base_path, temp_output,
+            [signer_stamp_data(signer, stamped[signer.id])], create_logo_image(),
+            metadata={STAMPED_SIGNERS_KEY: json.dumps(stamped)}, total_slots=total_slots,
+            placement=get_stamp_placement(signature), analysis=analysis
+        )
+        os.replace(temp_output, partial_path)
+    except Exception:
+        os.remove(temp_output)
+        raise
+
 def add_all_signatures_to_pdf(signature):
-    """Processa PDF final com todas as assinaturas quando todos os assinantes assinaram"""
+    """Processa PDF final com todas as assinaturas quando todos os assinantes assinaram
+
+    Parte do PDF parcial (assinantes anteriores já carimbados em revisões
+    incrementais) e carimba apenas quem falta, normalmente o último assinante.
+    """
     from models import SignatureSigner
-    import hashlib
     
     try:
-        # Resolve caminho do PDF original
-        original_path = signature.pdf_file_path or os.path.join(TEMP_DIR, f"{signature.file_id}_{signature.original_filename}")
-        if not os.path.exists(original_path):
-            # Tenta encontrar arquivo por file_id
-            try:
-                for name in os.listdir(TEMP_DIR):
-                    if name.startswith(signature.file_id) and name.lower().endswith('.pdf'):
-                        original_path = os.path.join(TEMP_DIR, name)
-                        break
-            except Exception:
-                pass
-        
+        original_path = resolve_original_pdf_path(signature)
         if not os.path.exists(original_path):
             raise Exception('Arquivo original não encontrado')
         
@@ -3662,314 +3964,127 @@ def add_all_signatures_to_pdf(signature):
         if not signers:
             raise Exception('Nenhum assinante encontrado')
         
-        # Lê o PDF original
-        with open(original_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            pdf_writer = PyPDF2.PdfWriter()
-            temp_page_buffers = []
-            
-            # Cria logo se não existir
-            logo_path = create_logo_image()
-            
-            # Para cada página do PDF
-            for page_num, page in enumerate(pdf_reader.pages):
-                # Cria um PDF temporário para a página atual
-                temp_buffer = io.BytesIO()
-                
-                # Usa o tamanho REAL da página
-                try:
-                    page_width = float(page.mediabox.width)
-                    page_height = float(page.mediabox.height)
-                except Exception:
-                    page_width, page_height = A4
-                
-                # Cria um canvas com o tamanho da página original
-                c = canvas.Canvas(temp_buffer, pagesize=(page_width, page_height))
-                width, height = page_width, page_height
-                
-                # Define margem e espaçamento entre assinaturas
-                margin_cm = 1.2*cm
-                signature_height = 1.6*cm
-                spacing_cm = 0.5*cm  # Espaçamento entre assinaturas
-                
-                # Calcula posições iniciais (assinaturas empilhadas verticalmente no canto direito)
-                base_x = max(margin_cm, width - (8*cm))
-                current_y = margin_cm
-                
-                # Adiciona cada assinatura (da primeira à última)
-                for idx, signer in enumerate(signers):
-                    if signer.signature_image:
-                        try:
-                            # Salva a imagem da assinatura temporariamente
-                            fd, signature_temp = tempfile.mkstemp(suffix='.png')
-                            os.close(fd)
-                            with open(signature_temp, 'wb') as f:
-                                f.write(base64.b64decode(signer.signature_image.split(',')[1]))
-                            
-                            # Adiciona a assinatura desenhada
-                            signature_img = RLImage(signature_temp)
-                            signature_img.drawHeight = signature_height
-                            signature_img.drawWidth = 2.5*cm
-                            
-                            # Calcula posição Y (empilhado de baixo para cima)
-                            signature_y = current_y + (len(signers) - idx - 1) * (signature_height + spacing_cm + 1.5*cm)
-                            
-                            # Logo e dados do assinante
-                            logo_height = signature_height
-                            logo_width = logo_height * 1.5
-                            logo_x = base_x
-                            logo_y = signature_y
-                            
-                            # Adiciona logo
-                            if os.path.exists(logo_path):
-                                try:
-                                    logo_img = RLImage(logo_path)
-                                    logo_img.drawHeight = logo_height
-                                    logo_img.drawWidth = logo_width
-                                    logo_img.drawOn(c, logo_x, logo_y)
-                                except:
-                                    pass
-                            
-                            # Adiciona informações do assinante
-                            info_x = logo_x + logo_width + 0.3*cm
-                            info_y = logo_y + 0.9*cm
-                            c.setFont("Helvetica-Bold", 8)
-                            c.setFillColor(colors.darkblue)
-                            
-                            if signer.signer_name:
-                                c.drawString(info_x, info_y, f"Nome: {signer.signer_name}")
-                                info_y -= 0.3*cm
-                            if signer.signer_cpf:
-                                c.drawString(info_x, info_y, f"CPF: {signer.signer_cpf}")
-                                info_y -= 0.3*cm
-                            
-                            # Adiciona a assinatura
-                            signature_img_x = base_x + logo_width + 1*cm
-                            signature_img_y = signature_y + 1.7*cm
-                            signature_img.drawOn(c, signature_img_x, signature_img_y)
-                            
-                            # Adiciona timestamp da assinatura
-                            if signer.signed_at:
-                                timestamp = signer.signed_at.strftime("%d/%m/%Y %H:%M:%S")
-                                c.setFont("Helvetica", 6)
-                                c.setFillColor(colors.grey)
-                                c.drawString(base_x, signature_y - 0.5*cm, f"Assinado em: {timestamp}")
-                            
-                            # Limpa arquivo temporário
-                            os.remove(signature_temp)
-                        except Exception as e:
-                            print(f"Erro ao adicionar assinatura do assinante {signer.signer_name}: {e}")
-                
-                c.save()
-                
-                # Garante que o buffer esteja no início para leitura
-                temp_buffer.seek(0)
-                temp_reader = PyPDF2.PdfReader(temp_buffer)
-                temp_page = temp_reader.pages[0]
-                
-                # Mescla a página original com as assinaturas
-                page.merge_page(temp_page)
-                pdf_writer.add_page(page)
-                
-                # Mantém o buffer vivo até terminar a escrita do PDF final
-                temp_page_buffers.append(temp_buffer)
-            
-            # Salva PDF intermediário temporário de forma segura (evita race condition)
-            fd, temp_output = tempfile.mkstemp(suffix='.pdf')
-            os.close(fd)  # Fecha o descritor, mantém o arquivo para uso posterior
-            with open(temp_output, 'wb') as output_file:
-                pdf_writer.write(output_file)
-            
-            # Libera buffers
-            for b in temp_page_buffers:
-                try:
-                    b.close()
-                except:
-                    pass
-            
-            # Política de retenção
-            from models import AppSetting
-            setting = AppSetting.query.filter_by(key='store_pdfs').first()
-            keep_pdfs = setting and setting.value.lower() == 'true'
-            retention_tag = 'KEEP' if keep_pdfs else 'TEMP'
-            clean_final_filename = signature.original_filename.replace('.pdf', '_assinado.pdf')
-            stored_final_filename = f"{signature.file_id}_{clean_final_filename.replace('.pdf', f'_{retention_tag}.pdf')}"
-            final_path = os.path.join(PDF_SIGNED_DIR, stored_final_filename)
-            
-            # Move arquivo temporário para local final
-            shutil.move(temp_output, final_path)
-            
-            # Lê o PDF final
-            with open(final_path, 'rb') as f:
-                final_content = f.read()
-            
-            # Embute metadados
-            signature_info = {
-                'hash': '',  # Será calculado depois
-                'timestamp': datetime.now().isoformat(),
-                'algorithm': 'PENDING'
-            }
-            embed_signature_metadata(final_path, signature_info)
-            
-            # Lê o PDF final (com metadados)
-            with open(final_path, 'rb') as f:
-                final_content = f.read()
-            
-            # Assina o PDF final usando o certificado X.509 do sistema
-            signature_info = certificate_manager.sign_pdf_with_certificate(final_content)
-            if not signature_info:
-                raise Exception('Falha ao assinar com certificado do sistema')
-            
-            # Atualiza o registro com dados da assinatura via certificado
-            signature.signature_hash = signature_info.get('hash')
-            signature.signature_algorithm = signature_info.get('signature_format', 'RSA-SHA256')
-            signature.signature_data = signature_info.get('signature_data')
-            signature.signature_valid = True
-            signature.file_size = len(final_content)
-            
-            print(f"PDF final gerado com {len(signers)} assinatura(s): {final_path}")
-            
+        # Revisões já aplicadas por assinante (se houver)
+        partial_path = get_partial_pdf_path(signature)
+        if os.path.exists(partial_path):
+            base_path = partial_path
+            stamped = read_stamped_signers(partial_path)
+            analysis = None
+        else:
+            base_path = original_path
+            stamped = {}
+            analysis = signature.get_document_analysis()
+        
+        # Assinantes que faltam carimbar, nas posições livres (da primeira à última assinatura)
+        total_slots = max(signature.total_signers or 0, len(signers), len(stamped))
+        signers_data = []
+        for signer, slot in assign_stamp_slots(signers, stamped, total_slots):
+            stamped[signer.id] = slot
+            signers_data.append(signer_stamp_data(signer, slot))
+        
+        # Cria logo se não existir
+        logo_path = create_logo_image()
+        
+        # Política de retenção
+        from models import AppSetting
+        setting = AppSetting.query.filter_by(key='store_pdfs').first()
+        keep_pdfs = setting and setting.value.lower() == 'true'
+        retention_tag = 'KEEP' if keep_pdfs else 'TEMP'
+        clean_final_filename = signature.original_filename.replace('.pdf', '_assinado.pdf')
+        stored_final_filename = f"{signature.file_id}_{clean_final_filename.replace('.pdf', f'_{retention_tag}.pdf')}"
+        final_path = os.path.join(PDF_SIGNED_DIR, stored_final_filename)
+        
+        # Metadados gravados na mesma passada do carimbo
+        metadata = build_signature_metadata({
+            'hash': '',  # Calculado durante a escrita
+            'timestamp': datetime.now().isoformat(),
+            'algorithm': 'PENDING'
+        })
+        metadata[STAMPED_SIGNERS_KEY] = json.dumps(stamped)
+        
+        # Carimba, embute metadados e calcula o hash em uma única escrita (arquivo
+        # temporário no próprio diretório final, renomeado de forma atômica)
+        fd, temp_output = tempfile.mkstemp(suffix='.pdf', dir=PDF_SIGNED_DIR)
+        os.close(fd)
+        try:
+            # Processo separado (pool limitado); levanta StampingUnavailable (fila cheia, timeout)
+            stamp_stats = stamping_engine.run(
+                stamp_multi_signer, base_path, temp_output, signers_data, logo_path,
+                metadata=metadata, total_slots=total_slots, placement=get_stamp_placement(signature),
+                analysis=analysis
+            )
+            os.replace(temp_output, final_path)
+        except Exception:
+            os.remove(temp_output)
+            raise
+        
+        # Assina o digest calculado na escrita usando o certificado X.509 do sistema
+        signature_info = certificate_manager.sign_pdf_digest(stamp_stats['sha256'])
+        if not signature_info:
+            raise Exception('Falha ao assinar com certificado do sistema')
+        
+        # Atualiza o registro com dados da assinatura via certificado
+        signature.signature_hash = signature_info.get('hash')
+        signature.signature_algorithm = signature_info.get('signature_format', 'RSA-SHA256')
+        signature.signature_data = signature_info.get('signature_data')
+        signature.signature_valid = True
+        signature.file_size = stamp_stats['size']
+        
+        # O PDF parcial não é mais necessário
+        if base_path == partial_path:
+            try:
+                os.remove(partial_path)
+            except Exception:
+                pass
+        
+        print(f"PDF final gerado com {len(signers)} assinatura(s) ({len(signers_data)} carimbada(s) na finalização): {final_path}")
+        
     except Exception as e:
         print(f"Erro ao processar PDF final com múltiplas assinaturas: {e}")
         raise
 
-def add_signature_to_all_pages(pdf_file, signature_text, output_path, signature_image=None, personal_info=None, logo_path=None):
-    """Adiciona assinatura digital a todas as páginas do PDF no canto inferior direito"""
-    try:
-        # Lê o PDF original
-        with open(pdf_file, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            pdf_writer = PyPDF2.PdfWriter()
-            temp_page_buffers = []  # Mantém buffers abertos até finalizar a escrita
-            
-            # Cria logo se não existir
-            if not logo_path:
-                logo_path = create_logo_image()
-            
-            # Para cada página do PDF
-            for page_num, page in enumerate(pdf_reader.pages):
-                # Cria um PDF temporário para a página atual em memória
-                temp_buffer = io.BytesIO()
-                
-                # Usa o tamanho REAL da página como base (evita problemas de corte/posição)
-                try:
-                    page_width = float(page.mediabox.width)
-                    page_height = float(page.mediabox.height)
-                except Exception:
-                    page_width, page_height = A4
+def add_signature_to_all_pages(pdf_file, signature_text, output_path, signature_image=None, personal_info=None, logo_path=None, metadata=None, placement=None, analysis=None):
+    """Adiciona assinatura digital ao PDF no canto inferior direito
 
-                # Cria um canvas com o tamanho da página original
-                c = canvas.Canvas(temp_buffer, pagesize=(page_width, page_height))
-                width, height = page_width, page_height
-                
-                # Define a posição da assinatura no canto inferior direito (margem segura)
-                margin_cm = 1.2*cm
-                signature_x = max(margin_cm, width - (8*cm))
-                signature_y = margin_cm
-                
-                # Calcula altura da assinatura para redimensionar o logo proporcionalmente
-                signature_height = 1.6*cm  # ligeiramente maior para melhor visibilidade
-                logo_height = signature_height  # Logo na mesma altura da assinatura
-                logo_width = logo_height * 1.5  # Reduzida proporção para 1.5:1
-                
-                # Adiciona a assinatura desenhada PRIMEIRO (em cima)
-                if signature_image:
-                    try:
-                        # Salva a imagem da assinatura temporariamente
-                        fd, signature_temp = tempfile.mkstemp(suffix='.png')
-                        os.close(fd)
-                        with open(signature_temp, 'wb') as f:
-                            f.write(base64.b64decode(signature_image.split(',')[1]))
-                        
-                        # Adiciona a assinatura desenhada
-                        signature_img = RLImage(signature_temp)
-                        signature_img.drawHeight = signature_height
-                        signature_img.drawWidth = 2.5*cm  # Largura fixa para a assinatura
-                        
-                        # Posiciona a assinatura ACIMA do logo e dados
-                        signature_img_x = signature_x + logo_width + 1*cm  # Centraliza a rubrica
-                        signature_img_y = signature_y + 1.7*cm  # Posiciona acima dos dados
-                        signature_img.drawOn(c, signature_img_x, signature_img_y)
-                        
-                        # Limpa arquivo temporário
-                        os.remove(signature_temp)
-                    except Exception as e:
-                        print(f"Erro ao adicionar assinatura desenhada: {e}")
-                
-                # Adiciona o logo (redimensionado proporcionalmente à assinatura)
-                if os.path.exists(logo_path):
-                    try:
-                        logo_img = RLImage(logo_path)
-                        logo_img.drawHeight = logo_height
-                        logo_img.drawWidth = logo_width
-                        logo_img.drawOn(c, signature_x, signature_y)  # Logo alinhado na base
-                    except:
-                        pass
-                
-                # Adiciona informações pessoais ao lado do logo (alinhadas com o logo)
-                if personal_info:
-                    info_x = signature_x + logo_width + 0.3*cm  # Posição após o logo (mais próximo)
-                    info_y = signature_y + 0.9*cm  # Alinhado com o logo (mesma altura)
-                    c.setFont("Helvetica-Bold", 8)
-                    c.setFillColor(colors.darkblue)
-                    
-                    if personal_info.get('nome'):
-                        c.drawString(info_x, info_y, f"Nome: {personal_info['nome']}")
-                        info_y -= 0.3*cm
-                    if personal_info.get('cpf'):
-                        c.drawString(info_x, info_y, f"CPF: {personal_info['cpf']}")
-                        info_y -= 0.3*cm
-                    if personal_info.get('data_nascimento'):
-                        c.drawString(info_x, info_y, f"Data: {personal_info['data_nascimento']}")
-                
-                # Adiciona timestamp
-                timestamp = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-                c.setFont("Helvetica", 6)
-                c.setFillColor(colors.grey)
-                c.drawString(signature_x, signature_y - 0.5*cm, f"Assinado em: {timestamp}")
-                
-                c.save()
-                
-                # Garante que o buffer esteja no início para leitura
-                temp_buffer.seek(0)
-                temp_reader = PyPDF2.PdfReader(temp_buffer)
-                temp_page = temp_reader.pages[0]
-                
-                # Mescla a página original com a assinatura
-                page.merge_page(temp_page)
-                pdf_writer.add_page(page)
-                
-                # Mantém o buffer vivo até terminar a escrita do PDF final
-                temp_page_buffers.append(temp_buffer)
-            
-            # Salva o PDF final
-            with open(output_path, 'wb') as output_file:
-                pdf_writer.write(output_file)
-            
-            # Libera buffers
-            for b in temp_page_buffers:
-                try:
-                    b.close()
-                except:
-                    pass
-            
-            # Verifica se o arquivo foi criado corretamente
-            if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-                # Validação leve: checa cabeçalho %PDF
-                try:
-                    with open(output_path, 'rb') as test_file:
-                        header = test_file.read(4)
-                    if header == b'%PDF':
-                        return True
-                    else:
-                        print("Assinado, mas cabeçalho inesperado; prosseguindo mesmo assim.")
-                        return True
-                except Exception as e:
-                    print(f"Assinado, mas falha ao validar cabeçalho: {e}; prosseguindo.")
-                    return True
-            else:
-                print("Falha ao criar arquivo PDF")
-                return False
+    As páginas carimbadas seguem placement (ver pdf_stamper.STAMP_PLACEMENTS;
+    padrão: todas). Se metadata for informado, os metadados são gravados na
+    mesma passada de escrita. analysis é a análise registrada no upload
+    (ver pdf_scanner.analyze_document).
+    Retorna as estatísticas do carimbo (incluindo 'sha256' e 'size' do arquivo
+    gravado) ou False em caso de falha.
+    """
+    try:
+        # Cria logo se não existir
+        if not logo_path:
+            logo_path = create_logo_image()
+        
+        # Timestamp único para todas as páginas do documento
+        timestamp = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+        
+        # Carimba em processo separado (pool limitado); levanta StampingUnavailable (fila cheia, timeout)
+        stamp_stats = stamping_engine.run(stamp_single_signer, pdf_file, output_path, signature_image, personal_info, logo_path, timestamp, metadata=metadata, placement=placement, analysis=analysis)
+        
+        # Verifica se o arquivo foi criado corretamente
+        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            # Validação leve: checa cabeçalho %PDF
+            try:
+                with open(output_path, 'rb') as test_file:
+                    header = test_file.read(4)
+                if header != b'%PDF':
+                    print("Assinado, mas cabeçalho inesperado; prosseguindo mesmo assim.")
+            except Exception as e:
+                print(f"Assinado, mas falha ao validar cabeçalho: {e}; prosseguindo.")
+            return stamp_stats
+        else:
+            print("Falha ao criar arquivo PDF")
+            return False
+    except StampingUnavailable:
+        # Nada foi gerado; descarta a saída reservada pelo chamador e propaga (429/503/504)
+        try:
+            os.remove(output_path)
+        except Exception:
+            pass
+        raise
     except Exception as e:
         print(f"Erro ao processar PDF: {e}")
         return False
@@ -1,6 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
+import json
 import bcrypt
 from ulid import ULID
 
@@ -92,6 +93,7 @@ class Signature(db.Model):
     # Novos campos para otimização
     pdf_hash_cached = db.Column(db.String(64), index=True)  # Cache do hash para evitar recalcular
     pdf_file_path = db.Column(db.String(500))  # Caminho do PDF no filesystem
+    document_analysis = db.Column(db.Text)  # Análise do PDF no upload (JSON, ver pdf_scanner.analyze_document)
     
     # Tipo de Documento
     document_type_id = db.Column(db.String(26), db.ForeignKey('document_types.id'))
@@ -142,6 +144,19 @@ class Signature(db.Model):
     # Relacionamento com assinantes
     signers = db.relationship('SignatureSigner', backref='signature', lazy='dynamic', cascade='all, delete-orphan')
     
+    def get_document_analysis(self):
+        """Análise do PDF registrada no upload (dict) ou None"""
+        if not self.document_analysis:
+            return None
+        try:
+            return json.loads(self.document_analysis)
+        except ValueError:
+            return None
+    
+    def set_document_analysis(self, analysis):
+        """Registra a análise do PDF (dict) calculada no upload"""
+        self.document_analysis = json.dumps(analysis) if analysis else None
+    
     def __repr__(self):
         return f'<Signature {self.file_id} by {self.client_name}>'
 
@@ -197,6 +212,8 @@ class DocumentType(db.Model):
     name = db.Column(db.String(120), unique=True, nullable=False)
     description = db.Column(db.String(255))
     active = db.Column(db.Boolean, default=True)
+    # Páginas que recebem o carimbo: all, last, first_last ou signature_page (pdf_stamper.STAMP_PLACEMENTS)
+    stamp_placement = db.Column(db.String(20), nullable=False, default='all', server_default='all')
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
 
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Camada de backend de PDF
+Isola a biblioteca de manipulação de PDF atrás de uma interface pequena
+(abrir, iterar páginas, aplicar overlay, metadados e gravar), para que o
+carimbo, a validação e o download não dependam diretamente do PyPDF2.
+
+Backends (variável de ambiente PDF_BACKEND):
+    pypdf2:  implementação em Python puro (padrão)
+    pikepdf: baseado na libqpdf (C++), opcional; se não estiver instalado
+             o backend pypdf2 é usado
+
+A atualização incremental (pdf_incremental) continua no PyPDF2: a libqpdf
+não grava revisões incrementais, apenas reescreve o documento.
+"""
+
+import io
+import os
+import PyPDF2
+from PyPDF2.generic import (
+    ArrayObject, BooleanObject, DecodedStreamObject, DictionaryObject, FloatObject, IndirectObject,
+    NameObject
+)
+from reportlab.lib.pagesizes import A4
+
+try:
+    import pikepdf
+except ImportError:  # pragma: no cover - dependência opcional
+    pikepdf = None
+
+PDF_BACKENDS = ('pypdf2', 'pikepdf')
+PDF_BACKEND = os.environ.get('PDF_BACKEND', 'pypdf2').strip().lower()
+if PDF_BACKEND not in PDF_BACKENDS:
+    PDF_BACKEND = 'pypdf2'
+
+# Marca a página de assinaturas acrescentada, para não duplicá-la em revisões seguintes
+MANIFEST_PAGE_KEY = '/AssinadorManifest'
+
+
+def get_page_geometry(page):
+    """Retorna (largura, altura, rotação) REAIS de uma página do PyPDF2"""
+    try:
+        page_width = float(page.mediabox.width)
+        page_height = float(page.mediabox.height)
+    except Exception:
+        page_width, page_height = A4
+    try:
+        rotation = int(page.get('/Rotate', 0) or 0) % 360
+    except Exception:
+        rotation = 0
+    return page_width, page_height, rotation
+
+
+def stamp_name(content_key, index):
+    """Nome do Form XObject do carimbo no dicionário de recursos da página
+
+    O prefixo do conteúdo evita colisão com carimbos de revisões anteriores.
+    """
+    return f"/AssinadorStamp{content_key[:12]}_{index}"
+
+
+class StampXObjectWriter:
+    """Grava cada overlay do cache como um Form XObject compartilhado (PyPDF2)
+
+    O conteúdo do carimbo, o logo e a rubrica ficam uma única vez no arquivo;
+    cada página recebe apenas uma referência (/AssinadorStampN Do) no seu
+    dicionário de recursos e um fluxo de conteúdo compartilhado que a desenha.
+    """
+
+    def __init__(self, pdf_writer, overlay_cache):
+        self.pdf_writer = pdf_writer
+        self.overlay_cache = overlay_cache
+        self._forms = {}
+        # Isola o estado gráfico do conteúdo original (equivalente ao merge_page)
+        self._push_ref = self._add_stream(b"q\n")
+
+    def _add_stream(self, data):
+        stream = DecodedStreamObject()
+        stream.set_data(data)
+        return self.pdf_writer._add_object(stream)
+
+    def _get_form(self, page_width, page_height, rotation):
+        """Retorna (nome, referência do fluxo que desenha o XObject) para a geometria"""
+        key = (round(page_width, 2), round(page_height, 2), rotation)
+        form = self._forms.get(key)
+        if form is not None:
+            # O overlay da geometria é reaproveitado via XObject; contabiliza no cache
+            self.overlay_cache.hits += 1
+            return form
+
+        overlay = self.overlay_cache.get_overlay(page_width, page_height, rotation)
+        xobject = DecodedStreamObject()
+        contents = overlay.get_contents()
+        xobject.set_data(contents.get_data() if contents is not None else b"")
+        xobject.update({
+            NameObject('/Type'): NameObject('/XObject'),
+            NameObject('/Subtype'): NameObject('/Form'),
+            NameObject('/BBox'): ArrayObject([
+                FloatObject(0), FloatObject(0), FloatObject(page_width), FloatObject(page_height)
+            ]),
+        })
+        if '/Resources' in overlay:
+            # Copia recursos (fontes e imagens) para o writer uma única vez
+            xobject[NameObject('/Resources')] = self._import_resources(overlay['/Resources'].get_object())
+        xobject_ref = self.pdf_writer._add_object(xobject)
+
+        name = NameObject(stamp_name(self.overlay_cache.content_key, len(self._forms)))
+        draw_ref = self._add_stream(f"Q\nq {name} Do Q\n".encode('ascii'))
+        form = (name, xobject_ref, draw_ref)
+        self._forms[key] = form
+        return form
+
+    def _import_resources(self, resources):
+        return resources.clone(self.pdf_writer)
+
+    def _mutable(self, container, key):
+        """Retorna o objeto em container[key] para ser alterado"""
+        return container[key].get_object()
+
+    def _resolve_contents(self, contents):
+        """Resolve /Contents da página (fluxo ou array de fluxos)"""
+        return contents.get_object()
+
+    def stamp_page(self, page, page_width, page_height, rotation=0):
+        """Referencia o carimbo na página (já adicionada ao writer)"""
+        name, xobject_ref, draw_ref = self._get_form(page_width, page_height, rotation)
+
+        # Registra o XObject nos recursos da página
+        if '/Resources' in page:
+            resources = self._mutable(page, '/Resources')
+        else:
+            resources = DictionaryObject()
+            page[NameObject('/Resources')] = resources
+        if '/XObject' in resources:
+            xobjects = self._mutable(resources, '/XObject')
+        else:
+            xobjects = DictionaryObject()
+            resources[NameObject('/XObject')] = xobjects
+        xobjects[name] = xobject_ref
+
+        # Conteúdo: q + conteúdo original + Q + desenho do carimbo
+        parts = ArrayObject([self._push_ref])
+        contents = page.raw_get('/Contents') if '/Contents' in page else None
+        if contents is not None:
+            contents_obj = self._resolve_contents(contents)
+            if isinstance(contents_obj, ArrayObject):
+                parts.extend(contents_obj)
+            elif isinstance(contents, IndirectObject):
+                parts.append(contents)
+            else:
+                parts.append(self.pdf_writer._add_object(contents_obj))
+        parts.append(draw_ref)
+        page[NameObject('/Contents')] = parts
+
+
+class PdfDocument:
+    """Interface de um documento aberto por um backend
+
+    Os índices de página começam em 0. Overlays vêm de um OverlayCache
+    (pdf_stamper), que renderiza cada geometria uma única vez.
+    """
+
+    backend = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    @property
+    def page_count(self):
+        raise NotImplementedError
+
+    @property
+    def is_encrypted(self):
+        raise NotImplementedError
+
+    def page_geometry(self, index):
+        """Retorna (largura, altura, rotação) da página"""
+        raise NotImplementedError
+
+    def iter_pages(self):
+        """Itera (índice, (largura, altura, rotação)) das páginas"""
+        for index in range(self.page_count):
+            yield index, self.page_geometry(index)
+
+    def is_manifest_page(self, index):
+        """Indica se a página é a página de assinaturas acrescentada pelo carimbo"""
+        raise NotImplementedError
+
+    def annotation_contents(self, index):
+        """Textos (/Contents) das anotações da página"""
+        raise NotImplementedError
+
+    def get_metadata(self):
+        """Metadados (/Info) como {chave: texto}"""
+        raise NotImplementedError
+
+    def set_metadata(self, metadata):
+        """Atualiza o /Info (mantendo as entradas existentes)"""
+        raise NotImplementedError
+
+    def stamp_page(self, index, overlay_cache, merge=False):
+        """Desenha o overlay da geometria da página por cima do conteúdo
+
+        Com merge=False o overlay é gravado uma única vez como Form XObject e
+        referenciado pelas páginas da mesma geometria.
+        """
+        raise NotImplementedError
+
+    def append_page(self, page_pdf, manifest=False):
+        """Acrescenta ao fim a primeira página do PDF em bytes; retorna o índice"""
+        raise NotImplementedError
+
+    def write(self, stream):
+        """Grava o documento (reescrito) em um fluxo binário"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PyPDF2Document(PdfDocument):
+    """Documento do backend pypdf2 (PdfReader para leitura, PdfWriter ao alterar)"""
+
+    backend = 'pypdf2'
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        try:
+            self.reader = PyPDF2.PdfReader(self._file)
+        except Exception:
+            self._file.close()
+            raise
+        self._writer = None
+        self._xobject_writer = None
+        self._sources = []
+
+    @property
+    def writer(self):
+        """PdfWriter com as páginas do documento, criado na primeira alteração"""
+        if self._writer is None:
+            self._writer = PyPDF2.PdfWriter()
+            for page in self.reader.pages:
+                self._writer.add_page(page)
+            # Mantém o /Info original (como o pikepdf e a atualização incremental)
+            if self.reader.metadata:
+                self._writer.add_metadata({
+                    key: value for key, value in self.reader.metadata.items() if not isinstance(value, IndirectObject)
+                })
+        return self._writer
+
+    def _pages(self):
+        return self._writer.pages if self._writer is not None else self.reader.pages
+
+    @property
+    def page_count(self):
+        return len(self._pages())
+
+    @property
+    def is_encrypted(self):
+        return self.reader.is_encrypted
+
+    def page_geometry(self, index):
+        return get_page_geometry(self._pages()[index])
+
+    def is_manifest_page(self, index):
+        return MANIFEST_PAGE_KEY in self._pages()[index]
+
+    def annotation_contents(self, index):
+        page = self._pages()[index]
+        contents = []
+        for annot in page.get('/Annots') or []:
+            annot_obj = annot.get_object()
+            if '/Contents' in annot_obj:
+                contents.append(str(annot_obj['/Contents']))
+        return contents
+
+    def get_metadata(self):
+        metadata = self.reader.metadata
+        return {str(key): str(value) for key, value in metadata.items()} if metadata else {}
+
+    def set_metadata(self, metadata):
+        self.writer.add_metadata(metadata)
+
+    def stamp_page(self, index, overlay_cache, merge=False):
+        page = self.writer.pages[index]
+        page_width, page_height, rotation = get_page_geometry(page)
+        if merge:
+            # Mescla o overlay no conteúdo da página
+            page.merge_page(overlay_cache.get_overlay(page_width, page_height, rotation))
+            # O PyPDF2 grava o fluxo mesclado direto no dicionário da página, o que
+            # gera um PDF inválido; fluxos precisam ser objetos indiretos
+            contents = page.raw_get('/Contents')
+            if not isinstance(contents, IndirectObject):
+                page[NameObject('/Contents')] = self.writer._add_object(contents)
+            return
+        if self._xobject_writer is None or self._xobject_writer.overlay_cache is not overlay_cache:
+            self._xobject_writer = StampXObjectWriter(self.writer, overlay_cache)
+        self._xobject_writer.stamp_page(page, page_width, page_height, rotation)
+
+    def append_page(self, page_pdf, manifest=False):
+        source = io.BytesIO(page_pdf)
+        self._sources.append(source)
+        page = PyPDF2.PdfReader(source).pages[0]
+        if manifest:
+            page[NameObject(MANIFEST_PAGE_KEY)] = BooleanObject(True)
+        self.writer.add_page(page)
+        return len(self.writer.pages) - 1
+
+    def write(self, stream):
+        self.writer.write(stream)
+
+    def close(self):
+        self._file.close()
+        self._sources = []
+
+
+class PikepdfDocument(PdfDocument):
+    """Documento do backend pikepdf (libqpdf)"""
+
+    backend = 'pikepdf'
+
+    def __init__(self, path):
+        self.pdf = pikepdf.open(path)
+        self._forms = {}
+        self._sources = []
+        self._push = None
+
+    @property
+    def page_count(self):
+        return len(self.pdf.pages)
+
+    @property
+    def is_encrypted(self):
+        return self.pdf.is_encrypted
+
+    def page_geometry(self, index):
+        page = self.pdf.pages[index]
+        try:
+            box = [float(value) for value in page.mediabox]
+            page_width, page_height = box[2] - box[0], box[3] - box[1]
+        except Exception:
+            page_width, page_height = A4
+        try:
+            rotation = int(page.rotation or 0) % 360
+        except Exception:
+            rotation = 0
+        return page_width, page_height, rotation
+
+    def is_manifest_page(self, index):
+        return MANIFEST_PAGE_KEY in self.pdf.pages[index].obj
+
+    def annotation_contents(self, index):
+        contents = []
+        for annot in self.pdf.pages[index].obj.get('/Annots') or []:
+            if '/Contents' in annot:
+                contents.append(str(annot['/Contents']))
+        return contents
+
+    def get_metadata(self):
+        return {str(key): str(value) for key, value in self.pdf.docinfo.items()}
+
+    def set_metadata(self, metadata):
+        for key, value in metadata.items():
+            self.pdf.docinfo[pikepdf.Name(key)] = pikepdf.String(value) if isinstance(value, str) else value
+
+    def _get_form(self, overlay_cache, page_width, page_height, rotation):
+        """Retorna (nome, Form XObject, fluxo que o desenha) para a geometria"""
+        key = (id(overlay_cache), round(page_width, 2), round(page_height, 2), rotation)
+        form = self._forms.get(key)
+        if form is not None:
+            overlay_cache.hits += 1
+            return form
+        source = pikepdf.open(io.BytesIO(overlay_cache.render(page_width, page_height, rotation)))
+        self._sources.append(source)
+        # BBox do tamanho da página; sem /Rotate, como no backend pypdf2
+        xobject = self.pdf.copy_foreign(source.pages[0].as_form_xobject())
+        xobject.BBox = pikepdf.Array([0, 0, page_width, page_height])
+        name = pikepdf.Name(stamp_name(overlay_cache.content_key, len(self._forms)))
+        draw = self.pdf.make_indirect(pikepdf.Stream(self.pdf, f"Q\nq {name} Do Q\n".encode('ascii')))
+        form = (name, xobject, draw)
+        self._forms[key] = form
+        return form
+
+    def stamp_page(self, index, overlay_cache, merge=False):
+        # A libqpdf não mescla fluxos de conteúdo: o overlay é sempre um Form XObject
+        page = self.pdf.pages[index]
+        page_width, page_height, rotation = self.page_geometry(index)
+        name, xobject, draw = self._get_form(overlay_cache, page_width, page_height, rotation)
+        page.add_resource(xobject, pikepdf.Name.XObject, name)
+
+        if self._push is None:
+            self._push = self.pdf.make_indirect(pikepdf.Stream(self.pdf, b"q\n"))
+        contents = page.obj.get('/Contents')
+        if isinstance(contents, pikepdf.Array):
+            parts = list(contents)
+        elif contents is not None:
+            parts = [contents if contents.is_indirect else self.pdf.make_indirect(contents)]
+        else:
+            parts = []
+        page.obj.Contents = pikepdf.Array([self._push] + parts + [draw])
+
+    def append_page(self, page_pdf, manifest=False):
+        source = pikepdf.open(io.BytesIO(page_pdf))
+        self._sources.append(source)
+        self.pdf.pages.append(source.pages[0])
+        if manifest:
+            self.pdf.pages[-1].obj[pikepdf.Name(MANIFEST_PAGE_KEY)] = True
+        return len(self.pdf.pages) - 1
+
+    def write(self, stream):
+        # Copia os fluxos como estão: por padrão a libqpdf recomprime imagens com
+        # filtros como /ASCII85Decode (PDFs escaneados ficam ~40x mais lentos)
+        self.pdf.save(stream, compress_streams=False, stream_decode_level=pikepdf.StreamDecodeLevel.none)
+
+    def close(self):
+        self.pdf.close()
+        for source in self._sources:
+            source.close()
+        self._sources = []
+
+
+def available_backends():
+    """Backends instalados neste ambiente"""
+    return [name for name in PDF_BACKENDS if name != 'pikepdf' or pikepdf is not None]
+
+
+def open_pdf(path, backend=None):
+    """Abre um PDF com o backend informado (padrão: PDF_BACKEND)
+
+    Returns:
+        PdfDocument (usar como gerenciador de contexto)
+    """
+    backend = (backend or PDF_BACKEND).strip().lower()
+    if backend == 'pikepdf' and pikepdf is not None:
+        return PikepdfDocument(path)
+    return PyPDF2Document(path)
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Atualização incremental de PDFs (ISO 32000-1, seção 7.5.6)
+Em vez de re-serializar o documento inteiro, copia os bytes originais sem
+alteração e acrescenta após o %%EOF apenas os objetos novos ou alterados,
+uma nova seção de referência cruzada e um trailer com /Prev apontando para a
+anterior. O custo de escrita passa a depender do tamanho do carimbo, não do
+documento (imagens de PDFs escaneados não são reprocessadas).
+
+Para documentos grandes, flush() grava os objetos já prontos e os libera da
+memória; a revisão é escrita em blocos e só a tabela xref fica até o fim.
+"""
+
+import re
+from PyPDF2.generic import (
+    ArrayObject, ByteStringObject, DictionaryObject, IndirectObject, NameObject, NumberObject,
+    StreamObject, DecodedStreamObject, EncodedStreamObject, TextStringObject, create_string_object
+)
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class IncrementalUpdateError(Exception):
+    """O documento não pode receber uma atualização incremental"""
+    pass
+
+
+def find_startxref(stream):
+    """Retorna o deslocamento da última seção xref (valor de startxref)"""
+    stream.seek(0, 2)
+    size = stream.tell()
+    stream.seek(max(0, size - 2048))
+    tail = stream.read()
+    matches = re.findall(rb'startxref\s+(\d+)', tail)
+    if not matches:
+        raise IncrementalUpdateError('startxref não encontrado')
+    return int(matches[-1])
+
+
+def original_size(reader):
+    """Valor de /Size do documento (maior número de objeto + 1)
+
+    Para PDFs com fluxo xref o PyPDF2 não expõe /Size no trailer; calcula a
+    partir das tabelas lidas.
+    """
+    if '/Size' in reader.trailer:
+        return int(reader.trailer['/Size'])
+    numbers = [number for table in reader.xref.values() for number in table]
+    numbers.extend(reader.xref_objStm)
+    return max(numbers, default=0) + 1
+
+
+class IncrementalPdfWriter:
+    """Acumula objetos novos/alterados sobre um PdfReader e grava a revisão
+
+    Objetos do documento original mantêm o seu número; objetos vindos de
+    outros PDFs (ex.: overlay do reportlab) são importados com numeração nova.
+    A interface _add_object espelha a do PyPDF2.PdfWriter.
+    """
+
+    def __init__(self, reader, original):
+        """
+        Args:
+            reader: PdfReader do documento original
+            original: arquivo do PDF original (binário, com seek)
+
+        Raises:
+            IncrementalUpdateError: PDF criptografado ou sem startxref legível
+        """
+        if reader.is_encrypted:
+            raise IncrementalUpdateError('PDF criptografado')
+        self.reader = reader
+        self.original = original
+        self._prev_xref = find_startxref(original)
+        original.seek(self._prev_xref)
+        # Revisões seguem o formato da última seção xref (tabela ou fluxo, PDF 1.5+)
+        self._xref_stream = not original.read(4).startswith(b'xref')
+        self.trailer = reader.trailer
+        self._next_number = original_size(reader)
+        self._objects = {}  # número -> (geração, objeto) ainda não gravados
+        self._offsets = {}  # número -> (deslocamento, geração) dos objetos gravados
+        self._imported = {}  # (id do pdf de origem, número) -> IndirectObject
+        self._info = None
+        self._original_copied = False
+
+    def _add_object(self, obj):
+        """Registra um objeto novo e retorna a referência indireta"""
+        number = self._next_number
+        self._next_number += 1
+        self._objects[number] = (0, obj)
+        return IndirectObject(number, 0, self)
+
+    def get_object(self, ref):
+        """Resolve referências criadas por este writer (usado por IndirectObject)"""
+        if ref.idnum not in self._objects:
+            raise IncrementalUpdateError(f'Objeto {ref.idnum} já foi gravado (flush)')
+        return self._objects[ref.idnum][1]
+
+    def mark_updated(self, ref, obj=None):
+        """Marca um objeto do documento original para ser regravado com o mesmo número
+
+        Um objeto marcado de novo após o flush é gravado outra vez; a seção xref
+        aponta para a última cópia.
+        """
+        if obj is None:
+            obj = ref.get_object()
+        if ref.idnum not in self._objects:
+            self._objects[ref.idnum] = (ref.generation, obj)
+        return obj
+
+    def release(self, ref):
+        """Descarta do cache do PdfReader um objeto original já usado (ex.: fluxo de conteúdo)"""
+        self.reader.resolved_objects.pop((ref.generation, ref.idnum), None)
+
+    def import_object(self, obj):
+        """Copia um objeto de outro PDF, renumerando as referências indiretas"""
+        if isinstance(obj, IndirectObject):
+            if obj.pdf is self:
+                return obj
+            key = (id(obj.pdf), obj.idnum)
+            ref = self._imported.get(key)
+            if ref is None:
+                ref = self._add_object(None)
+                self._imported[key] = ref
+                self._objects[ref.idnum] = (0, self.import_object(obj.get_object()))
+            return ref
+        if isinstance(obj, StreamObject):
+            copy = EncodedStreamObject() if not isinstance(obj, DecodedStreamObject) else DecodedStreamObject()
+            copy._data = obj._data
+            for key, value in obj.items():
+                copy[NameObject(key)] = self.import_object(value)
+            return copy
+        if isinstance(obj, DictionaryObject):
+            copy = DictionaryObject()
+            for key, value in obj.items():
+                copy[NameObject(key)] = self.import_object(value)
+            return copy
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self.import_object(value) for value in obj)
+        return obj
+
+    def add_metadata(self, infos):
+        """Atualiza o dicionário /Info (mantendo as entradas originais)"""
+        if self._info is None:
+            self._info = DictionaryObject()
+            if '/Info' in self.trailer:
+                self._info.update(self.trailer['/Info'].get_object())
+        for key, value in infos.items():
+            self._info[NameObject(key)] = create_string_object(value) if isinstance(value, str) else value
+
+    def _copy_original(self, stream):
+        """Copia os bytes originais integralmente, em blocos"""
+        original = self.original
+        original.seek(0)
+        last_byte = b''
+        while True:
+            chunk = original.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            stream.write(chunk)
+            last_byte = chunk[-1:]
+        if last_byte not in (b'\n', b'\r'):
+            stream.write(b'\n')
+        self._original_copied = True
+
+    def flush(self, stream):
+        """Grava os objetos pendentes e os libera da memória
+
+        Na primeira chamada copia antes o PDF original. Deve receber sempre o
+        mesmo destino, que também é passado a write() no final.
+        """
+        if not self._original_copied:
+            self._copy_original(stream)
+        for number in sorted(self._objects):
+            generation, obj = self._objects[number]
+            self._offsets[number] = (stream.tell(), generation)
+            stream.write(f"{number} {generation} obj\n".encode('ascii'))
+            obj.write_to_stream(stream, None)
+            stream.write(b"\nendobj\n")
+        self._objects = {}
+
+    def write(self, stream):
+        """Copia o PDF original (se ainda não copiado) e conclui a revisão incremental
+
+        Args:
+            stream: destino com write() e tell() (ex.: HashingWriter)
+        """
+        if self._info is not None:
+            info_ref = self.trailer.get('/Info')
+            if isinstance(info_ref, IndirectObject):
+                self._objects[info_ref.idnum] = (info_ref.generation, self._info)
+            else:
+                info_ref = self._add_object(self._info)
+        else:
+            info_ref = self.trailer.get('/Info')
+
+        self.flush(stream)
+        offsets = dict(self._offsets)
+
+        trailer = DictionaryObject()
+        trailer[NameObject('/Root')] = self.trailer['/Root']
+        if info_ref is not None:
+            trailer[NameObject('/Info')] = info_ref
+        if '/ID' in self.trailer:
+            # Mantém os bytes originais do identificador (o PyPDF2 pode decodificá-lo como texto)
+            trailer[NameObject('/ID')] = ArrayObject(
+                ByteStringObject(part.get_original_bytes()) if isinstance(part, TextStringObject) else part
+                for part in self.trailer['/ID']
+            )
+        trailer[NameObject('/Prev')] = NumberObject(self._prev_xref)
+
+        if self._xref_stream:
+            xref_location = self._write_xref_stream(stream, offsets, trailer)
+        else:
+            xref_location = self._write_xref_table(stream, offsets, trailer)
+        stream.write(f"startxref\n{xref_location}\n%%EOF\n".encode('ascii'))
+
+    @staticmethod
+    def _subsections(numbers):
+        """Agrupa números de objeto consecutivos: [(primeiro, quantidade), ...]"""
+        sections = []
+        for number in sorted(numbers):
+            if sections and sections[-1][0] + sections[-1][1] == number:
+                sections[-1][1] += 1
+            else:
+                sections.append([number, 1])
+        return sections
+
+    def _write_xref_table(self, stream, offsets, trailer):
+        xref_location = stream.tell()
+        stream.write(b"xref\n")
+        for first, count in self._subsections(offsets):
+            stream.write(f"{first} {count}\n".encode('ascii'))
+            for number in range(first, first + count):
+                offset, generation = offsets[number]
+                stream.write(f"{offset:010d} {generation:05d} n\r\n".encode('ascii'))
+        trailer[NameObject('/Size')] = NumberObject(self._next_number)
+        stream.write(b"trailer\n")
+        trailer.write_to_stream(stream, None)
+        stream.write(b"\n")
+        return xref_location
+
+    def _write_xref_stream(self, stream, offsets, trailer):
+        # O próprio fluxo xref recebe um número e entra na tabela
+        xref_number = self._next_number
+        self._next_number += 1
+        xref_location = stream.tell()
+        offsets[xref_number] = (xref_location, 0)
+
+        index = ArrayObject()
+        data = bytearray()
+        for first, count in self._subsections(offsets):
+            index.extend([NumberObject(first), NumberObject(count)])
+            for number in range(first, first + count):
+                offset, generation = offsets[number]
+                data += b'\x01' + offset.to_bytes(4, 'big') + generation.to_bytes(2, 'big')
+
+        xref = DecodedStreamObject()
+        xref.set_data(bytes(data))
+        xref.update(trailer)
+        xref.update({
+            NameObject('/Type'): NameObject('/XRef'),
+            NameObject('/Size'): NumberObject(self._next_number),
+            NameObject('/W'): ArrayObject([NumberObject(1), NumberObject(4), NumberObject(2)]),
+            NameObject('/Index'): index,
+        })
+        stream.write(f"{xref_number} 0 obj\n".encode('ascii'))
+        xref.write_to_stream(stream, None)
+        stream.write(b"\nendobj\n")
+        return xref_location
@@ -0,0 +1,638 @@
+#!/usr/bin/env python3
+"""
+Verificação de segurança de PDFs enviados (JavaScript, ações perigosas e
+arquivos embutidos)
+
+A verificação tem duas etapas:
+    1. Pré-varredura em bytes (prescan_pdf): o arquivo é mapeado em memória e
+       percorrido por uma única expressão regular com todos os tokens e padrões
+       perigosos; os fluxos de objetos (/ObjStm) são descompactados e
+       percorridos da mesma forma.
+    2. Varredura estrutural: percorre o grafo de objetos do PyPDF2. Só é
+       executada quando a pré-varredura encontra alguma ocorrência; documentos
+       sem ocorrências (a maioria) são aprovados sem ela.
+
+Na mesma leitura, analyze_pdf_upload registra a análise do documento enviado
+(páginas, dimensões, rotação, criptografia e integridade da xref), guardada no
+banco para que as etapas seguintes não precisem abrir o arquivo de novo.
+
+A verificação roda num pool de processos pré-iniciados (StampingEngine, com
+instância própria): cada varredura tem limite de tempo de CPU (RLIMIT_CPU) e de
+espaço de endereçamento (RLIMIT_AS), e o processo é morto e recriado ao estourar
+o tempo limite, em vez de uma thread que continuaria consumindo CPU e memória.
+
+Configuração (variáveis de ambiente):
+    SCANNER_WORKERS:        varreduras simultâneas na máquina (0 executa inline, sem pool nem limites)
+    SCANNER_MAX_QUEUE:      varreduras aguardando vaga antes de recusar o envio
+    SCANNER_TIMEOUT:        tempo máximo de uma varredura, em segundos
+    SCANNER_QUEUE_TIMEOUT:  tempo máximo aguardando vaga, em segundos
+    SCANNER_CPU_SECONDS:    tempo de CPU por varredura (RLIMIT_CPU)
+    SCANNER_MEMORY_LIMIT_MB: espaço de endereçamento do processo (RLIMIT_AS) e RSS máximo
+    SCANNER_LOCK_DIR:       diretório dos arquivos de lock (padrão: <tmp>/assinador_scanning)
+    SCANNER_PRESTART:       inicia os processos junto com a aplicação (padrão: true)
+"""
+
+import os
+import re
+import json
+import mmap
+import math
+import atexit
+import hashlib
+import tempfile
+import threading
+from bisect import bisect_left, bisect_right
+
+import PyPDF2
+from PyPDF2.generic import IndirectObject
+
+from pdf_backend import get_page_geometry
+from pdf_incremental import IncrementalUpdateError, find_startxref
+
+try:
+    import resource
+except ImportError:  # Windows: sem rlimits, valem o timeout e o teto de RSS do pool
+    resource = None
+
+# Limites de segurança para prevenir DoS
+MAX_PAGES = 1000  # Limite máximo de páginas processadas
+TIMEOUT_SECONDS = float(os.environ.get('SCANNER_TIMEOUT', '30'))  # Timeout para processamento
+CPU_SECONDS = int(os.environ.get('SCANNER_CPU_SECONDS', str(int(TIMEOUT_SECONDS))))
+MEMORY_LIMIT_MB = int(os.environ.get('SCANNER_MEMORY_LIMIT_MB', '1024'))
+MAX_SCAN_NODES = 200000  # Limite de nós (dicionários, listas, nomes, strings) na varredura estrutural
+
+# SECURITY: Lista expandida de tokens perigosos em PDFs
+# Nota: /S, /AcroForm e /OpenAction foram removidos pois são comuns em PDFs legítimos
+# Serão detectados apenas em contexto de JavaScript ou ações de execução
+DANGEROUS_TOKENS = [
+    # JavaScript e scripts (completos)
+    '/JavaScript', '/JS',
+    # Ações automáticas perigosas (sem contexto)
+    '/AA', '/XFA',
+    # Ações de execução (sempre perigosas)
+    '/Launch', '/GoToR', '/GoToE', '/URI', '/SubmitForm', '/ImportData',
+    # RichMedia e embedded content
+    '/RichMedia', '/EmbeddedFiles', '/EmbeddedFile', '/FileAttachment',
+    # Ações de formulário perigosas
+    '/ResetForm', '/ImportData', '/ExportData',
+    # Annotations perigosas
+    '/Movie', '/Sound', '/3D', '/RichMediaAnnotation',
+    # Outros vetores
+    '/JavaScript ', '/JS ', '/XFAForm'
+]
+
+# Tokens que só são perigosos em contexto específico
+CONTEXT_DANGEROUS_TOKENS = {
+    '/S': ['/JavaScript', '/JS'],  # /S só é perigoso quando relacionado a JavaScript
+    '/AcroForm': ['/JavaScript', '/JS', '/AA', '/OpenAction', '/XFA'],  # /AcroForm só é perigoso quando tem JavaScript ou ações automáticas
+    '/OpenAction': ['/JavaScript', '/JS', '/Launch', '/URI', '/SubmitForm'],  # /OpenAction só é perigoso quando tem JavaScript ou ações de execução
+}
+
+# Padrões de JavaScript (comparados sem diferenciar maiúsculas)
+JS_PATTERNS = [
+    'javascript:', 'js:', 'eval(', 'unescape(', 'fromCharCode(',
+    'app.alert', 'app.execMenuItem', 'this.', 'event.',
+    'AFSimple_Calculate', 'AFDate_Format', 'AFTime_Format'
+]
+
+
+def _prescan_tokens():
+    """Tokens procurados pela pré-varredura e pares de contexto
+
+    Tokens de contexto cujo contexto já é um token perigoso (ex.: /S com /JS)
+    não precisam ser procurados; os demais (/AcroForm com /OpenAction) só
+    contam quando os dois aparecem no documento.
+    """
+    tokens = {token.strip() for token in DANGEROUS_TOKENS}
+    context_pairs = []
+    for token, contexts in CONTEXT_DANGEROUS_TOKENS.items():
+        for ctx in contexts:
+            if ctx not in tokens:
+                context_pairs.append((token, ctx))
+    return tokens, context_pairs
+
+
+PRESCAN_TOKENS, PRESCAN_CONTEXT_PAIRS = _prescan_tokens()
+PRESCAN_CONTEXT_NAMES = {name for pair in PRESCAN_CONTEXT_PAIRS for name in pair} - PRESCAN_TOKENS
+
+
+def _build_prescan_pattern():
+    """Expressão única (multi-padrão) da pré-varredura
+
+    Grupos:
+        token:   nomes perigosos e de contexto (diferencia maiúsculas)
+        js:      padrões de JavaScript, em ASCII e em UTF-16BE
+        escaped: nomes com escapes #xx, decodificados e verificados de novo
+        hexstr:  strings hexadecimais, decodificadas e verificadas de novo
+    """
+    names = PRESCAN_TOKENS | PRESCAN_CONTEXT_NAMES
+    token_alternatives = b'|'.join(re.escape(name.encode()) for name in sorted(names, key=len, reverse=True))
+    js_alternatives = []
+    for pattern in JS_PATTERNS:
+        js_alternatives.append(re.escape(pattern.encode()))
+        js_alternatives.append(b'\\x00'.join(re.escape(ch.encode()) for ch in pattern))
+    name_char = rb'[^\s/<>\[\](){}%]'
+    return re.compile(
+        b'(?P<token>' + token_alternatives + b')'
+        + b'|(?P<js>(?i:' + b'|'.join(js_alternatives) + b'))'
+        + b'|(?P<escaped>/' + name_char + b'*#[0-9A-Fa-f]{2}' + name_char + b'*)'
+        + rb'|(?P<hexstr>(?<!<)<[0-9A-Fa-f\s]+>)'
+    )
+
+
+PRESCAN_PATTERN = _build_prescan_pattern()
+_NAME_ESCAPE = re.compile(rb'#([0-9A-Fa-f]{2})')
+_STREAM_START = re.compile(rb'>>\s*stream(?:\r\n|\n|\r)')
+_STREAM_LENGTH = re.compile(rb'/Length\s+(\d+)(?:\s+(\d+)\s+R)?')
+# Maior cabeçalho de fluxo (do "N G obj" até "stream") aceito para pular os dados
+MAX_STREAM_HEADER = 64 * 1024
+
+
+def _decode_hex_string(match):
+    """Bytes de uma string hexadecimal <...>, em UTF-8 quando for UTF-16BE"""
+    digits = re.sub(rb'\s', b'', match[1:-1])
+    if len(digits) % 2:
+        digits += b'0'
+    data = bytes.fromhex(digits.decode('ascii'))
+    if data.startswith(b'\xfe\xff'):
+        data = data[2:].decode('utf-16-be', 'replace').encode('utf-8', 'replace')
+    return data
+
+
+def _scan_bytes(data, hits, nested=False):
+    """Acumula em hits as ocorrências da expressão da pré-varredura em data"""
+    for match in PRESCAN_PATTERN.finditer(data):
+        group = match.lastgroup
+        if group in ('token', 'js'):
+            hits.add(match.group().replace(b'\x00', b'').decode('latin-1'))
+        elif nested:
+            continue
+        elif group == 'escaped':
+            _scan_bytes(_NAME_ESCAPE.sub(lambda m: bytes.fromhex(m.group(1).decode('ascii')), match.group()),
+                        hits, nested=True)
+        elif group == 'hexstr':
+            _scan_bytes(_decode_hex_string(match.group()), hits, nested=True)
+
+
+def _stream_data_end(data, match, offsets, reader):
+    """Fim dos dados de um fluxo que podem ser pulados, ou None
+
+    Os dados só são pulados quando o PyPDF2 também os lê como dados de fluxo:
+    o cabeçalho começa num objeto da tabela xref, não tem strings, comentários
+    nem outro objeto antes de "stream", o tamanho vem de /Length e nenhum
+    objeto da xref começa dentro do trecho pulado.
+    """
+    index = bisect_right(offsets, match.start()) - 1
+    if index < 0 or match.start() - offsets[index] > MAX_STREAM_HEADER:
+        return None
+    header = data[offsets[index]:match.start()]
+    if b'(' in header or b'%' in header or b'endobj' in header or b'stream' in header:
+        return None
+    lengths = []
+    for number, generation in _STREAM_LENGTH.findall(header):
+        if generation:
+            try:
+                lengths.append(int(reader.get_object(IndirectObject(int(number), int(generation), reader))))
+            except Exception:
+                return None
+        else:
+            lengths.append(int(number))
+    if not lengths:
+        return None
+    start = match.end()
+    end = start + min(lengths)
+    if end > len(data) or bisect_left(offsets, start) != bisect_left(offsets, end):
+        return None
+    return end
+
+
+def _structure_ranges(data, reader):
+    """Trechos (início, fim) do arquivo fora dos dados de fluxos"""
+    offsets = sorted(offset for objects in reader.xref.values() for offset in objects.values()
+                     if isinstance(offset, int))
+    start = search_from = 0
+    while True:
+        match = _STREAM_START.search(data, search_from)
+        if match is None:
+            break
+        search_from = match.end()
+        end = _stream_data_end(data, match, offsets, reader)
+        if end is not None:
+            yield start, match.end()
+            start = search_from = end
+    yield start, len(data)
+
+
+def _is_suspicious(hits):
+    """Se as ocorrências exigem a varredura estrutural"""
+    if hits - PRESCAN_CONTEXT_NAMES:
+        return True
+    return any(token in hits and ctx in hits for token, ctx in PRESCAN_CONTEXT_PAIRS)
+
+
+def prescan_pdf(file_path, reader=None):
+    """Pré-varredura em bytes do PDF
+
+    Percorre com PRESCAN_PATTERN os bytes do arquivo fora dos dados de fluxos
+    (conteúdo de página, imagens e fontes não são objetos do PDF e ruído
+    binário geraria falsos positivos) e os fluxos de objetos (/ObjStm)
+    decodificados pelo PyPDF2: os objetos guardados neles não aparecem em
+    texto no arquivo. Nomes com #xx e strings hexadecimais são decodificados
+    antes da comparação.
+
+    A pré-varredura é conservadora: em caso de dúvida os dados do fluxo são
+    percorridos também, e qualquer ocorrência apenas encaminha o documento para
+    a varredura estrutural.
+    Escapes octais em strings literais não são decodificados; eles só afetam os
+    padrões de JavaScript, pois uma ação executável exige um nome perigoso.
+
+    Returns:
+        (suspeito, ocorrências): suspeito=True quando a varredura estrutural
+        precisa ser executada
+    """
+    hits = set()
+    with open(file_path, 'rb') as f:
+        if reader is None:
+            reader = PyPDF2.PdfReader(f)
+        if reader.is_encrypted:
+            # Strings e fluxos cifrados não podem ser verificados em bytes
+            return True, {'/Encrypt'}
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for start, end in _structure_ranges(data, reader):
+                _scan_bytes(data[start:end], hits)
+        finally:
+            data.close()
+
+        for stream_number in sorted({stmnum for stmnum, _idx in reader.xref_objStm.values()}):
+            try:
+                stream = reader.get_object(IndirectObject(stream_number, 0, reader))
+                _scan_bytes(stream.get_data(), hits)
+            except Exception:
+                hits.add('<ObjStm ilegível>')
+                return True, hits
+
+    return _is_suspicious(hits), hits
+
+
+# Versão da lógica do verificador: incremente ao mudar o código da varredura.
+# As regras (listas de tokens e limites) entram no hash de SCANNER_VERSION_TAG
+# automaticamente, invalidando os veredictos em cache.
+SCANNER_VERSION = 1
+
+
+def _scanner_version_tag():
+    rules = json.dumps([DANGEROUS_TOKENS, CONTEXT_DANGEROUS_TOKENS, JS_PATTERNS, MAX_PAGES,
+                        MAX_SCAN_NODES, MEMORY_LIMIT_MB], sort_keys=True)
+    return f"v{SCANNER_VERSION}-{hashlib.sha256(rules.encode('utf-8')).hexdigest()[:12]}"
+
+
+SCANNER_VERSION_TAG = _scanner_version_tag()
+
+_DANGEROUS_TOKEN_RE = re.compile('|'.join(re.escape(token) for token in sorted(set(DANGEROUS_TOKENS), key=len, reverse=True)))
+_JS_PATTERN_RE = re.compile('|'.join(re.escape(pattern) for pattern in JS_PATTERNS), re.IGNORECASE)
+_JS_PATTERN_NAMES = {pattern.lower(): pattern for pattern in JS_PATTERNS}
+_CONTEXT_NAMES = sorted(set(CONTEXT_DANGEROUS_TOKENS) | {ctx for ctxs in CONTEXT_DANGEROUS_TOKENS.values() for ctx in ctxs})
+
+
+class ObjectWalker:
+    """Percurso iterativo do grafo de objetos do PyPDF2 para a varredura estrutural
+
+    Cada objeto indireto é visitado uma única vez (conjunto de visitados
+    compartilhado entre as chamadas de check) e apenas chaves, nomes e strings
+    são comparados com os tokens, sem converter subárvores inteiras em texto.
+    Os tokens de contexto (ex.: /AcroForm com /OpenAction) são avaliados por
+    objeto indireto, incluindo seus objetos diretos aninhados. O total de nós
+    é limitado por max_nodes.
+    """
+
+    def __init__(self, max_nodes=MAX_SCAN_NODES):
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.visited = set()
+
+    def check(self, root):
+        """Verifica os objetos alcançáveis a partir de root ainda não visitados
+
+        Returns:
+            (perigoso, motivo)
+        """
+        pending = [root]
+        while pending:
+            obj = pending.pop()
+            if isinstance(obj, IndirectObject):
+                key = (obj.idnum, obj.generation)
+                if key in self.visited:
+                    continue
+                self.visited.add(key)
+                try:
+                    obj = obj.get_object()
+                except Exception:
+                    continue
+            is_dangerous, reason = self._check_unit(obj, pending)
+            if is_dangerous:
+                return True, reason
+        return False, None
+
+    def _check_unit(self, unit, pending):
+        """Verifica um objeto e seus objetos diretos; referências vão para pending"""
+        context_found = set()
+        stack = [unit]
+        while stack:
+            obj = stack.pop()
+            self.nodes += 1
+            if self.nodes > self.max_nodes:
+                return True, f'Limite de {self.max_nodes} objetos verificados excedido'
+            if isinstance(obj, IndirectObject):
+                pending.append(obj)
+            elif isinstance(obj, dict):
+                for key, value in obj.items():
+                    is_dangerous, reason = self._check_text(key, context_found)
+                    if is_dangerous:
+                        return True, reason
+                    stack.append(value)
+            elif isinstance(obj, (list, tuple)):
+                stack.extend(obj)
+            elif isinstance(obj, (str, bytes)):
+                is_dangerous, reason = self._check_text(obj, context_found)
+                if is_dangerous:
+                    return True, reason
+
+        # Tokens que só são perigosos em contexto específico
+        for token, required_contexts in CONTEXT_DANGEROUS_TOKENS.items():
+            if token in context_found:
+                for ctx in required_contexts:
+                    if ctx in context_found:
+                        return True, f'Token perigoso encontrado: {token} (em contexto de {ctx})'
+        return False, None
+
+    def _check_text(self, value, context_found):
+        """Compara um nome, chave ou string com os tokens e padrões perigosos"""
+        text = value.decode('latin-1') if isinstance(value, bytes) else str(value)
+        match = _DANGEROUS_TOKEN_RE.search(text)
+        if match:
+            return True, f'Token perigoso encontrado: {match.group()}'
+        match = _JS_PATTERN_RE.search(text)
+        if match:
+            return True, f'Padrão JavaScript suspeito: {_JS_PATTERN_NAMES[match.group().lower()]}'
+        for name in _CONTEXT_NAMES:
+            if name in text:
+                context_found.add(name)
+        return False, None
+
+
+# Versão do formato da análise (analyze_document); faz parte da chave do cache
+ANALYSIS_VERSION = 1
+_XREF_START = re.compile(rb'\s*(?:xref|\d+\s+\d+\s+obj)')
+
+
+def _xref_ok(file_path):
+    """startxref aponta para uma tabela xref ou para um objeto (fluxo xref)"""
+    try:
+        with open(file_path, 'rb') as f:
+            f.seek(find_startxref(f))
+            return bool(_XREF_START.match(f.read(64)))
+    except (OSError, ValueError, IncrementalUpdateError):
+        return False
+
+
+def analyze_document(reader, file_path):
+    """Análise de um PDF já aberto, guardada com o upload
+
+    As dimensões das páginas ficam agrupadas em sequências
+    [quantidade, largura, altura, rotação] (documentos costumam ter um único
+    formato). 'incremental' indica se o carimbo pode ser gravado como revisão
+    incremental (sem criptografia e com xref íntegra).
+    """
+    page_boxes = []
+    for page in reader.pages:
+        width, height, rotation = get_page_geometry(page)
+        box = [round(width, 2), round(height, 2), rotation]
+        if page_boxes and page_boxes[-1][1:] == box:
+            page_boxes[-1][0] += 1
+        else:
+            page_boxes.append([1] + box)
+    encrypted = bool(reader.is_encrypted)
+    xref_ok = _xref_ok(file_path)
+    return {
+        'version': ANALYSIS_VERSION,
+        'page_count': len(reader.pages),
+        'page_boxes': page_boxes,
+        'encrypted': encrypted,
+        'xref_ok': xref_ok,
+        'xref_entries': sum(len(table) for table in reader.xref.values()) + len(reader.xref_objStm),
+        'incremental': not encrypted and xref_ok,
+        'size': os.path.getsize(file_path)
+    }
+
+
+def page_box(analysis, index):
+    """(largura, altura, rotação) da página index a partir da análise, ou None"""
+    if not analysis:
+        return None
+    for count, width, height, rotation in analysis.get('page_boxes', []):
+        if index < count:
+            return width, height, rotation
+        index -= count
+    return None
+
+
+def _scan_reader(reader, file_path, prescan):
+    num_pages = 0
+    try:
+        num_pages = len(reader.pages)
+    except Exception:
+        pass
+
+    if num_pages == 0:
+        return False, 'PDF sem páginas'
+
+    # SECURITY: Limita número de páginas processadas para prevenir DoS
+    if num_pages > MAX_PAGES:
+        return False, f'PDF excede limite de {MAX_PAGES} páginas (encontrado: {num_pages})'
+
+    # Pré-varredura em bytes: sem ocorrências, dispensa o percurso dos objetos
+    if prescan:
+        suspicious, _hits = prescan_pdf(file_path, reader)
+        if not suspicious:
+            return True, 'OK'
+
+    # Varredura estrutural: cada objeto indireto é verificado uma única vez,
+    # mesmo quando compartilhado (fontes, imagens, /Parent)
+    walker = ObjectWalker()
+    roots = [
+        (lambda: reader.trailer, 'no trailer'),
+        (lambda: reader.trailer.get('/Root'), 'no catalog'),
+        (lambda: reader.metadata, 'nos metadados'),
+    ]
+    for get_root, where in roots:
+        try:
+            root = get_root()
+        except Exception:
+            continue
+        is_dangerous, reason = walker.check(root)
+        if is_dangerous:
+            return False, f'PDF contém conteúdo perigoso {where}: {reason}'
+
+    # Varre páginas (limitado a MAX_PAGES)
+    try:
+        pages_to_check = min(num_pages, MAX_PAGES)
+        for i, page in enumerate(reader.pages[:pages_to_check]):
+            is_dangerous, reason = walker.check(page.indirect_reference or page)
+            if is_dangerous:
+                return False, f'PDF contém conteúdo perigoso na página {i+1}: {reason}'
+    except Exception as e:
+        # Se houver erro ao processar páginas, rejeita por segurança
+        return False, f'Erro ao processar páginas: {str(e)}'
+
+    return True, 'OK'
+
+
+def scan_pdf_file(file_path, prescan=True, analyze=False):
+    """Varredura de um PDF no processo atual
+
+    Retorna (ok, mensagem) ou, com analyze, (ok, mensagem, análise), com a
+    análise do documento (analyze_document) calculada sobre a mesma leitura;
+    a análise é None para PDFs rejeitados. Função de nível de módulo
+    (serializável) executada nos processos do pool por scan_pdf_safeness e
+    analyze_pdf_upload.
+    Usa o PyPDF2 diretamente (e não pdf_backend): a varredura estrutural
+    percorre o grafo de objetos do PyPDF2 (ObjectWalker).
+    """
+    analysis = None
+    try:
+        with open(file_path, 'rb') as f:
+            reader = PyPDF2.PdfReader(f)
+            ok, message = _scan_reader(reader, file_path, prescan)
+            if ok and analyze:
+                analysis = analyze_document(reader, file_path)
+    except MemoryError:
+        ok, message = False, f'PDF excede o limite de memória da verificação ({MEMORY_LIMIT_MB} MB)'
+    except Exception as e:
+        ok, message = False, f'Falha ao abrir PDF: {e}'
+    return (ok, message, analysis) if analyze else (ok, message)
+
+
+def limit_process_memory(memory_mb):
+    """Inicializador dos processos do pool: limita o espaço de endereçamento"""
+    if resource is None or not memory_mb:
+        return
+    limit = memory_mb * 1024 * 1024
+    _soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def run_with_cpu_limit(cpu_seconds, func, *args):
+    """Executa func(*args) com no máximo cpu_seconds de CPU a partir de agora
+
+    O RLIMIT_CPU é acumulado pelo processo, então o limite flexível é movido a
+    cada job; ao estourar, o sistema envia SIGXCPU e o processo morre (o pool o
+    recria).
+    """
+    if resource is not None and cpu_seconds:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        limit = int(math.ceil(usage.ru_utime + usage.ru_stime)) + cpu_seconds
+        _soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+    return func(*args)
+
+
+def create_scanner_engine(**overrides):
+    """Cria o pool de processos de varredura a partir das variáveis SCANNER_*"""
+    # Import tardio: os processos filhos importam este módulo e não precisam do
+    # pacote services (LDAP, certificados etc.)
+    from services.stamping_engine import StampingEngine
+
+    options = {
+        'max_workers': int(os.environ.get('SCANNER_WORKERS', str(min(2, os.cpu_count() or 1)))),
+        'max_queue': int(os.environ.get('SCANNER_MAX_QUEUE', '8')),
+        'job_timeout': TIMEOUT_SECONDS,
+        'queue_timeout': float(os.environ.get('SCANNER_QUEUE_TIMEOUT', '10')),
+        'lock_dir': os.environ.get('SCANNER_LOCK_DIR') or os.path.join(tempfile.gettempdir(), 'assinador_scanning'),
+        'memory_limit_mb': MEMORY_LIMIT_MB,
+        'initializer': limit_process_memory,
+        'initargs': (MEMORY_LIMIT_MB,),
+    }
+    options.update(overrides)
+    return StampingEngine(**options)
+
+
+_scanner_engine = None
+_scanner_engine_lock = threading.Lock()
+
+
+def get_scanner_engine():
+    """Pool global de processos de varredura (criado no primeiro uso)"""
+    global _scanner_engine
+    with _scanner_engine_lock:
+        if _scanner_engine is None:
+            _scanner_engine = create_scanner_engine()
+            atexit.register(_scanner_engine.shutdown)
+        return _scanner_engine
+
+
+def _run_scan(file_path, prescan, use_cache, analyze, digest=None):
+    """Executa scan_pdf_file no pool, com o cache de veredictos e as mensagens de falha"""
+    from services.scan_cache import scan_verdict_cache
+    from services.stamping_engine import StampingQueueFull, StampingTimeout, StampingUnavailable
+    from utils.crypto_utils import calculate_pdf_hash
+
+    def failure(message):
+        return (False, message, None) if analyze else (False, message)
+
+    version = f"{SCANNER_VERSION_TAG}-a{ANALYSIS_VERSION}" if analyze else SCANNER_VERSION_TAG
+    if not (use_cache and scan_verdict_cache.enabled):
+        digest = None
+    else:
+        if digest is None:
+            try:
+                digest = calculate_pdf_hash(file_path)
+            except OSError as e:
+                return failure(f'Falha ao abrir PDF: {e}')
+        cached = scan_verdict_cache.get(digest, version)
+        if cached is not None:
+            return cached
+
+    engine = get_scanner_engine()
+    try:
+        verdict = engine.run(run_with_cpu_limit, CPU_SECONDS, scan_pdf_file, file_path, prescan, analyze)
+        if digest is not None:
+            scan_verdict_cache.put(digest, version, verdict)
+        return verdict
+    except StampingTimeout:
+        return failure(f'Timeout ao processar PDF (limite: {engine.job_timeout:g}s)')
+    except StampingQueueFull:
+        return failure('Servidor ocupado verificando outros documentos. Tente novamente em instantes.')
+    except StampingUnavailable:
+        # Processo morto por RLIMIT_CPU/memória ou teto de RSS do pool
+        return failure('PDF excede os limites de processamento da verificação')
+    except Exception as e:
+        return failure(f'Falha ao processar PDF: {e}')
+
+
+def scan_pdf_safeness(file_path: str, prescan=True, use_cache=True, digest=None):
+    """
+    Retorna (ok, mensagem). Bloqueia PDFs com JavaScript/ações perigosas.
+    SECURITY: Implementa limites de páginas, tempo, CPU e memória para prevenir DoS.
+    Detecta múltiplos vetores de ataque incluindo scripts, ações maliciosas e embedded files.
+    Com prescan (padrão), documentos sem ocorrências na pré-varredura em bytes
+    dispensam a varredura estrutural. Com use_cache, o veredicto é reaproveitado
+    pelo SHA-256 do arquivo (services.scan_cache); falhas de execução (timeout,
+    fila cheia, limites) não são guardadas. digest: SHA-256 já calculado no
+    recebimento do arquivo (evita relê-lo para a chave do cache).
+    """
+    return _run_scan(file_path, prescan, use_cache, analyze=False, digest=digest)
+
+
+def analyze_pdf_upload(file_path: str, prescan=True, use_cache=True, digest=None):
+    """Verificação de segurança e análise do documento enviado numa única leitura
+
+    Retorna (ok, mensagem, análise); ver scan_pdf_safeness e analyze_document.
+    A análise é None quando o PDF é rejeitado ou a verificação falha.
+    digest: SHA-256 já calculado na gravação do upload (evita reler o arquivo)
+    """
+    return _run_scan(file_path, prescan, use_cache, analyze=True, digest=digest)
@@ -0,0 +1,578 @@
+#!/usr/bin/env python3
+"""
+Carimbo visual de assinatura em PDFs
+Renderiza o overlay (logo, rubrica e dados do assinante) uma única vez por
+geometria de página e reaproveita o resultado em todas as páginas equivalentes
+
+Modos de carimbo (variável de ambiente STAMP_MODE):
+    incremental: como xobject, mas gravado como atualização incremental após o
+                 %%EOF original; os bytes originais são preservados e nada do
+                 documento é re-serializado (padrão)
+    xobject:     o carimbo é gravado uma única vez como Form XObject e cada
+                 página apenas o referencia; o documento é reescrito
+    merge:       o overlay é mesclado no conteúdo de cada página (page.merge_page)
+Os modos xobject e merge usam o backend de PDF configurado (pdf_backend).
+
+Políticas de posicionamento (por tipo de documento, ver STAMP_PLACEMENTS):
+    all:            todas as páginas (padrão)
+    last:           apenas a última página
+    first_last:     primeira e última páginas
+    signature_page: última página e uma página de assinaturas acrescentada ao fim
+As páginas não carimbadas são copiadas sem renderização nem mesclagem.
+
+Fica fora do pacote services de propósito: os processos do motor de carimbo
+importam este módulo ao receber um job, e ele depende apenas de PyPDF2,
+reportlab e pdf_backend (sem banco, LDAP ou geração de certificados na
+inicialização).
+"""
+
+import io
+import os
+import json
+import base64
+import hashlib
+import PyPDF2
+from PyPDF2.generic import BooleanObject, DictionaryObject, IndirectObject, NameObject, NumberObject
+from reportlab.pdfgen import canvas
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.lib.utils import ImageReader
+from pdf_backend import MANIFEST_PAGE_KEY, StampXObjectWriter, get_page_geometry, open_pdf
+from pdf_incremental import IncrementalPdfWriter, IncrementalUpdateError
+
+STAMP_MODES = ('incremental', 'xobject', 'merge')
+STAMP_MODE = os.environ.get('STAMP_MODE', 'incremental').strip().lower()
+if STAMP_MODE not in STAMP_MODES:
+    STAMP_MODE = 'incremental'
+
+# Páginas carimbadas por bloco no modo incremental: a cada bloco os objetos
+# alterados são gravados e liberados da memória
+STAMP_CHUNK_PAGES = max(1, int(os.environ.get('STAMP_CHUNK_PAGES', '50')))
+
+STAMP_PLACEMENTS = ('all', 'last', 'first_last', 'signature_page')
+DEFAULT_STAMP_PLACEMENT = 'all'
+
+
+def stamp_content_key(*parts):
+    """Gera uma chave estável (SHA-256) para o conteúdo do carimbo"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def normalize_placement(placement):
+    """Retorna a política de posicionamento válida (padrão: todas as páginas)"""
+    placement = (placement or '').strip().lower()
+    return placement if placement in STAMP_PLACEMENTS else DEFAULT_STAMP_PLACEMENT
+
+
+def pages_to_stamp(page_count, placement):
+    """Índices das páginas do documento que recebem o carimbo
+
+    Args:
+        page_count: Número de páginas do documento (sem a página de assinaturas)
+        placement: Política de posicionamento (ver STAMP_PLACEMENTS)
+    """
+    if page_count <= 0:
+        return set()
+    last = page_count - 1
+    if placement == 'all':
+        return set(range(page_count))
+    if placement == 'first_last':
+        return {0, last}
+    # 'last' e 'signature_page'
+    return {last}
+
+
+def render_manifest_page(page_count):
+    """Renderiza a página de assinaturas (A4) acrescentada ao fim do documento
+
+    Returns:
+        bytes: PDF de uma página
+    """
+    width, height = A4
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    c.setFont("Helvetica-Bold", 16)
+    c.setFillColor(colors.darkblue)
+    c.drawString(2*cm, height - 3*cm, "Página de assinaturas")
+    c.setFont("Helvetica", 10)
+    c.setFillColor(colors.black)
+    c.drawString(2*cm, height - 4*cm, f"Documento original com {page_count} página(s).")
+    c.drawString(2*cm, height - 4.6*cm, "As assinaturas abaixo referem-se a todo o documento.")
+    c.save()
+    return buffer.getvalue()
+
+
+class StampImageCache:
+    """Cache em memória das imagens do carimbo (rubricas e logo)
+
+    Cada rubrica (data URL base64) é decodificada uma única vez por documento
+    em um ImageReader do reportlab, sem passar por arquivos temporários, e
+    reutilizada em todas as geometrias de página e assinantes.
+    """
+
+    def __init__(self):
+        self._signatures = {}
+        self._logos = {}
+        self.decodes = 0
+
+    def get_signature(self, signature_image):
+        """Retorna o ImageReader da rubrica (data URL ou base64 puro)"""
+        image = self._signatures.get(signature_image)
+        if image is None:
+            encoded = signature_image.split(',', 1)[1] if ',' in signature_image else signature_image
+            image = ImageReader(io.BytesIO(base64.b64decode(encoded)))
+            self._signatures[signature_image] = image
+            self.decodes += 1
+        return image
+
+    def get_logo(self, logo_path):
+        """Retorna o ImageReader do logo (lido do disco uma única vez)"""
+        image = self._logos.get(logo_path)
+        if image is None:
+            with open(logo_path, 'rb') as f:
+                image = ImageReader(io.BytesIO(f.read()))
+            self._logos[logo_path] = image
+        return image
+
+
+def draw_single_signer_stamp(c, width, height, signature_image=None, personal_info=None, logo_path=None, timestamp=None, image_cache=None):
+    """Desenha o carimbo de um único assinante no canto inferior direito"""
+    if image_cache is None:
+        image_cache = StampImageCache()
+
+    # Define a posição da assinatura no canto inferior direito (margem segura)
+    margin_cm = 1.2*cm
+    signature_x = max(margin_cm, width - (8*cm))
+    signature_y = margin_cm
+
+    # Calcula altura da assinatura para redimensionar o logo proporcionalmente
+    signature_height = 1.6*cm  # ligeiramente maior para melhor visibilidade
+    logo_height = signature_height  # Logo na mesma altura da assinatura
+    logo_width = logo_height * 1.5  # Reduzida proporção para 1.5:1
+
+    # Adiciona a assinatura desenhada PRIMEIRO (em cima)
+    if signature_image:
+        try:
+            # Posiciona a assinatura ACIMA do logo e dados
+            signature_img_x = signature_x + logo_width + 1*cm  # Centraliza a rubrica
+            signature_img_y = signature_y + 1.7*cm  # Posiciona acima dos dados
+            c.drawImage(image_cache.get_signature(signature_image), signature_img_x, signature_img_y,
+                        width=2.5*cm, height=signature_height, mask='auto')
+        except Exception as e:
+            print(f"Erro ao adicionar assinatura desenhada: {e}")
+
+    # Adiciona o logo (redimensionado proporcionalmente à assinatura)
+    if logo_path and os.path.exists(logo_path):
+        try:
+            # Logo alinhado na base
+            c.drawImage(image_cache.get_logo(logo_path), signature_x, signature_y,
+                        width=logo_width, height=logo_height, mask='auto')
+        except Exception:
+            pass
+
+    # Adiciona informações pessoais ao lado do logo (alinhadas com o logo)
+    if personal_info:
+        info_x = signature_x + logo_width + 0.3*cm  # Posição após o logo (mais próximo)
+        info_y = signature_y + 0.9*cm  # Alinhado com o logo (mesma altura)
+        c.setFont("Helvetica-Bold", 8)
+        c.setFillColor(colors.darkblue)
+
+        if personal_info.get('nome'):
+            c.drawString(info_x, info_y, f"Nome: {personal_info['nome']}")
+            info_y -= 0.3*cm
+        if personal_info.get('cpf'):
+            c.drawString(info_x, info_y, f"CPF: {personal_info['cpf']}")
+            info_y -= 0.3*cm
+        if personal_info.get('data_nascimento'):
+            c.drawString(info_x, info_y, f"Data: {personal_info['data_nascimento']}")
+
+    # Adiciona timestamp
+    if timestamp:
+        c.setFont("Helvetica", 6)
+        c.setFillColor(colors.grey)
+        c.drawString(signature_x, signature_y - 0.5*cm, f"Assinado em: {timestamp}")
+
+
+def draw_multi_signer_stamp(c, width, height, signers, logo_path=None, image_cache=None, total_slots=None):
+    """Desenha os carimbos de vários assinantes empilhados no canto inferior direito
+
+    Args:
+        signers: Lista de dicts com name, cpf, signature_image e signed_at (já formatado);
+                 'slot' opcional fixa a posição do assinante na pilha (padrão: índice)
+        image_cache: StampImageCache compartilhado entre as páginas do documento
+        total_slots: Total de posições da pilha (padrão: len(signers)); permite
+                     carimbar um assinante por vez na posição final
+    """
+    if image_cache is None:
+        image_cache = StampImageCache()
+
+    # Define margem e espaçamento entre assinaturas
+    margin_cm = 1.2*cm
+    signature_height = 1.6*cm
+    spacing_cm = 0.5*cm  # Espaçamento entre assinaturas
+
+    # Calcula posições iniciais (assinaturas empilhadas verticalmente no canto direito)
+    base_x = max(margin_cm, width - (8*cm))
+    current_y = margin_cm
+
+    total_slots = total_slots or len(signers)
+
+    # Adiciona cada assinatura (da primeira à última)
+    for idx, signer in enumerate(signers):
+        if not signer.get('signature_image'):
+            continue
+        try:
+            # Calcula posição Y (empilhado de baixo para cima)
+            slot = signer.get('slot', idx)
+            signature_y = current_y + (total_slots - slot - 1) * (signature_height + spacing_cm + 1.5*cm)
+
+            # Logo e dados do assinante
+            logo_height = signature_height
+            logo_width = logo_height * 1.5
+            logo_x = base_x
+            logo_y = signature_y
+
+            # Adiciona logo
+            if logo_path and os.path.exists(logo_path):
+                try:
+                    c.drawImage(image_cache.get_logo(logo_path), logo_x, logo_y,
+                                width=logo_width, height=logo_height, mask='auto')
+                except Exception:
+                    pass
+
+            # Adiciona informações do assinante
+            info_x = logo_x + logo_width + 0.3*cm
+            info_y = logo_y + 0.9*cm
+            c.setFont("Helvetica-Bold", 8)
+            c.setFillColor(colors.darkblue)
+
+            if signer.get('name'):
+                c.drawString(info_x, info_y, f"Nome: {signer['name']}")
+                info_y -= 0.3*cm
+            if signer.get('cpf'):
+                c.drawString(info_x, info_y, f"CPF: {signer['cpf']}")
+                info_y -= 0.3*cm
+
+            # Adiciona a assinatura
+            signature_img_x = base_x + logo_width + 1*cm
+            signature_img_y = signature_y + 1.7*cm
+            c.drawImage(image_cache.get_signature(signer['signature_image']), signature_img_x, signature_img_y,
+                        width=2.5*cm, height=signature_height, mask='auto')
+
+            # Adiciona timestamp da assinatura
+            if signer.get('signed_at'):
+                c.setFont("Helvetica", 6)
+                c.setFillColor(colors.grey)
+                c.drawString(base_x, signature_y - 0.5*cm, f"Assinado em: {signer['signed_at']}")
+        except Exception as e:
+            print(f"Erro ao adicionar assinatura do assinante {signer.get('name')}: {e}")
+
+
+class OverlayCache:
+    """Cache de overlays de carimbo por (largura, altura, rotação, conteúdo)
+
+    Cada geometria distinta de página é renderizada pelo reportlab (e parseada
+    pelo backend) uma única vez; as demais páginas reutilizam o mesmo overlay.
+    """
+
+    def __init__(self, draw_func, content_key=''):
+        """
+        Args:
+            draw_func: Função draw_func(canvas, largura, altura) que desenha o carimbo
+            content_key: Identificador do conteúdo do carimbo (ver stamp_content_key)
+        """
+        self.draw_func = draw_func
+        self.content_key = content_key
+        self._rendered = {}
+        self._overlays = {}
+        self._buffers = []  # Mantém buffers abertos até finalizar a escrita
+        self.renders = 0
+        self.hits = 0
+
+    def render(self, page_width, page_height, rotation=0):
+        """Retorna o PDF (bytes) de uma página com o carimbo para a geometria informada"""
+        key = (round(page_width, 2), round(page_height, 2), rotation, self.content_key)
+        data = self._rendered.get(key)
+        if data is None:
+            # Cria um canvas com o tamanho da página original
+            temp_buffer = io.BytesIO()
+            c = canvas.Canvas(temp_buffer, pagesize=(page_width, page_height))
+            self.draw_func(c, page_width, page_height)
+            c.save()
+            data = temp_buffer.getvalue()
+            self._rendered[key] = data
+            self.renders += 1
+        return data
+
+    def get_overlay(self, page_width, page_height, rotation=0):
+        """Retorna a página de overlay (PyPDF2) para a geometria informada"""
+        key = (round(page_width, 2), round(page_height, 2), rotation, self.content_key)
+        overlay = self._overlays.get(key)
+        if overlay is not None:
+            self.hits += 1
+            return overlay
+
+        temp_buffer = io.BytesIO(self.render(page_width, page_height, rotation))
+        overlay = PyPDF2.PdfReader(temp_buffer).pages[0]
+
+        self._overlays[key] = overlay
+        self._buffers.append(temp_buffer)
+        return overlay
+
+    def close(self):
+        """Libera os buffers dos overlays"""
+        for b in self._buffers:
+            try:
+                b.close()
+            except Exception:
+                pass
+        self._buffers = []
+        self._overlays = {}
+        self._rendered = {}
+
+
+class IncrementalStampWriter(StampXObjectWriter):
+    """StampXObjectWriter sobre um IncrementalPdfWriter
+
+    As páginas são as do próprio PdfReader; cada página e cada dicionário de
+    recursos indireto alterado é marcado para ser regravado na revisão.
+    """
+
+    def _import_resources(self, resources):
+        return self.pdf_writer.import_object(resources)
+
+    def _mutable(self, container, key):
+        value = container[key]
+        if isinstance(value, IndirectObject):
+            return self.pdf_writer.mark_updated(value)
+        return value
+
+    def _resolve_contents(self, contents):
+        contents_obj = contents.get_object()
+        if isinstance(contents, IndirectObject) and contents.pdf is self.pdf_writer.reader:
+            # A revisão só referencia o fluxo original: não o mantém no cache do PdfReader
+            self.pdf_writer.release(contents)
+        return contents_obj
+
+    def stamp_page(self, page, page_width, page_height, rotation=0):
+        super().stamp_page(page, page_width, page_height, rotation)
+        self.pdf_writer.mark_updated(page.indirect_reference, page)
+
+    def append_page(self, page_pdf, manifest=False):
+        """Acrescenta a primeira página do PDF em bytes ao fim da árvore de páginas raiz
+
+        Returns:
+            A página importada (já registrada na revisão)
+        """
+        page = PyPDF2.PdfReader(io.BytesIO(page_pdf)).pages[0]
+        writer = self.pdf_writer
+        pages_ref = writer.trailer['/Root'].get_object().raw_get('/Pages')
+        pages = writer.mark_updated(pages_ref)
+
+        new_page = DictionaryObject()
+        for key, value in page.items():
+            if key != '/Parent':
+                new_page[NameObject(key)] = writer.import_object(value)
+        new_page[NameObject('/Parent')] = pages_ref
+        if manifest:
+            new_page[NameObject(MANIFEST_PAGE_KEY)] = BooleanObject(True)
+        new_page.indirect_reference = writer._add_object(new_page)
+
+        self._mutable(pages, '/Kids').append(new_page.indirect_reference)
+        pages[NameObject('/Count')] = NumberObject(int(pages['/Count']) + 1)
+        return new_page
+
+
+class HashingWriter(io.RawIOBase):
+    """Arquivo de saída que calcula o SHA-256 dos bytes à medida que são gravados
+
+    Evita reler o PDF final do disco apenas para calcular o hash. Herda de
+    io.RawIOBase porque o pikepdf só grava em objetos de arquivo.
+    """
+
+    def __init__(self, file):
+        super().__init__()
+        self.file = file
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.hasher.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def tell(self):
+        return self.file.tell()
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+
+def stamp_pdf(pdf_file, output_path, draw_func, content_key='', mode=None, metadata=None, placement=None, backend=None,
+              analysis=None):
+    """Aplica o carimbo desenhado por draw_func nas páginas definidas pela política
+
+    Args:
+        pdf_file: Caminho do PDF original
+        output_path: Caminho do PDF de saída
+        draw_func: Função draw_func(canvas, largura, altura) que desenha o carimbo
+        content_key: Identificador do conteúdo do carimbo
+        mode: 'incremental', 'xobject' ou 'merge' (padrão: STAMP_MODE)
+        metadata: Metadados (/Info) gravados na mesma passada de escrita
+        placement: Política de posicionamento (ver STAMP_PLACEMENTS; padrão: 'all')
+        backend: Backend de PDF dos modos que reescrevem o documento (padrão: PDF_BACKEND)
+        analysis: Análise do upload (pdf_scanner.analyze_document); documentos
+                  que não aceitam revisão incremental vão direto para 'xobject',
+                  sem abrir o arquivo duas vezes
+
+    Returns:
+        dict: Estatísticas (páginas, páginas carimbadas, overlays renderizados e
+              reaproveitados), SHA-256 e tamanho do PDF gravado
+    """
+    mode = mode or STAMP_MODE
+    placement = normalize_placement(placement)
+    if mode == 'incremental' and analysis and not analysis.get('incremental', True):
+        mode = 'xobject'
+    overlay_cache = OverlayCache(draw_func, content_key)
+    try:
+        if mode == 'incremental':
+            with open(pdf_file, 'rb') as file:
+                pdf_reader = PyPDF2.PdfReader(file)
+                try:
+                    incremental_writer = IncrementalPdfWriter(pdf_reader, file)
+                except IncrementalUpdateError as e:
+                    # PDF criptografado ou sem startxref legível: reescreve o documento
+                    print(f"Atualização incremental indisponível ({e}); reescrevendo o PDF")
+                    mode = 'xobject'
+                else:
+                    return _stamp_incremental(pdf_reader, incremental_writer, output_path, overlay_cache, metadata, placement)
+
+        with open_pdf(pdf_file, backend) as document:
+            page_count = document.page_count
+            stamped, manifest = _placement_plan(page_count, page_count and document.is_manifest_page(page_count - 1), placement)
+            for index in sorted(stamped):
+                document.stamp_page(index, overlay_cache, merge=(mode == 'merge'))
+            if manifest:
+                index = document.append_page(render_manifest_page(page_count), manifest=True)
+                document.stamp_page(index, overlay_cache, merge=(mode == 'merge'))
+
+            if metadata:
+                document.set_metadata(metadata)
+
+            # Salva o PDF final calculando o hash durante a escrita
+            with open(output_path, 'wb') as output_file:
+                hashing_writer = HashingWriter(output_file)
+                document.write(hashing_writer)
+
+            stats = _stamp_stats(document.page_count, mode, placement, stamped, manifest, overlay_cache, hashing_writer)
+            stats['backend'] = document.backend
+            return stats
+    finally:
+        overlay_cache.close()
+
+
+def _placement_plan(page_count, has_manifest, placement):
+    """Páginas a carimbar e se a página de assinaturas deve ser acrescentada
+
+    Args:
+        page_count: Número de páginas do PDF
+        has_manifest: A última página é a página de assinaturas de uma revisão anterior
+
+    Returns:
+        (índices a carimbar, acrescentar página de assinaturas)
+        A página de assinaturas já existente é incluída nos índices a carimbar.
+    """
+    if has_manifest:
+        # Documentos que já receberam a página de assinaturas a carimbam sempre
+        stamped = pages_to_stamp(page_count - 1, placement)
+        stamped.add(page_count - 1)
+        return stamped, False
+    return pages_to_stamp(page_count, placement), placement == 'signature_page'
+
+
+def _stamp_stats(page_count, mode, placement, stamped, manifest, overlay_cache, hashing_writer):
+    return {
+        'pages': page_count,
+        'stamped_pages': len(stamped) + (1 if manifest else 0),
+        'mode': mode,
+        'placement': placement,
+        'overlays_rendered': overlay_cache.renders,
+        'overlays_reused': overlay_cache.hits,
+        'sha256': hashing_writer.hexdigest(),
+        'size': hashing_writer.size
+    }
+
+
+def _stamp_incremental(pdf_reader, incremental_writer, output_path, overlay_cache, metadata=None,
+                       placement=DEFAULT_STAMP_PLACEMENT, chunk_pages=None):
+    """Carimba acrescentando uma revisão incremental ao PDF original
+
+    Páginas fora da política não são tocadas: continuam apenas nos bytes
+    originais. As páginas carimbadas são gravadas em blocos de chunk_pages
+    (padrão: STAMP_CHUNK_PAGES), com memória limitada para documentos grandes.
+    """
+    chunk_pages = chunk_pages or STAMP_CHUNK_PAGES
+    stamp_writer = IncrementalStampWriter(incremental_writer, overlay_cache)
+    pages = pdf_reader.pages
+    page_count = len(pages)
+    stamped, manifest = _placement_plan(page_count, page_count and MANIFEST_PAGE_KEY in pages[-1], placement)
+
+    with open(output_path, 'wb') as output_file:
+        hashing_writer = HashingWriter(output_file)
+        for position, index in enumerate(sorted(stamped), 1):
+            page = pages[index]
+            page_width, page_height, rotation = get_page_geometry(page)
+            stamp_writer.stamp_page(page, page_width, page_height, rotation)
+            if position % chunk_pages == 0:
+                incremental_writer.flush(hashing_writer)
+        if manifest:
+            page = stamp_writer.append_page(render_manifest_page(page_count), manifest=True)
+            page_width, page_height, rotation = get_page_geometry(page)
+            stamp_writer.stamp_page(page, page_width, page_height, rotation)
+
+        if metadata:
+            incremental_writer.add_metadata(metadata)
+        incremental_writer.write(hashing_writer)
+
+    stats = _stamp_stats(page_count + (1 if manifest else 0), 'incremental', placement, stamped, manifest, overlay_cache, hashing_writer)
+    stats['backend'] = 'pypdf2'
+    return stats
+
+
+def stamp_single_signer(pdf_file, output_path, signature_image=None, personal_info=None, logo_path=None, timestamp=None, mode=None, metadata=None, placement=None, analysis=None):
+    """Carimba as páginas da política de posicionamento com os dados de um único assinante
+
+    Função de nível de módulo (serializável) para execução no StampingEngine.
+    """
+    image_cache = StampImageCache()
+
+    def draw_stamp(c, width, height):
+        draw_single_signer_stamp(c, width, height, signature_image, personal_info, logo_path, timestamp, image_cache)
+
+    content_key = stamp_content_key(signature_image, personal_info, logo_path, timestamp)
+    return stamp_pdf(pdf_file, output_path, draw_stamp, content_key, mode=mode, metadata=metadata, placement=placement,
+                     analysis=analysis)
+
+
+def stamp_multi_signer(pdf_file, output_path, signers, logo_path=None, mode=None, metadata=None, total_slots=None, placement=None, analysis=None):
+    """Carimba as páginas da política de posicionamento com os dados de vários assinantes
+
+    Função de nível de módulo (serializável) para execução no StampingEngine.
+    Com total_slots e 'slot' em cada assinante, carimba apenas os assinantes
+    informados nas suas posições finais (revisão por assinante).
+    """
+    image_cache = StampImageCache()
+
+    def draw_stamp(c, width, height):
+        draw_multi_signer_stamp(c, width, height, signers, logo_path, image_cache, total_slots)
+
+    content_key = stamp_content_key(signers, logo_path, total_slots)
+    return stamp_pdf(pdf_file, output_path, draw_stamp, content_key, mode=mode, metadata=metadata, placement=placement,
+                     analysis=analysis)
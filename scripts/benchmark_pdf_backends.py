@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark dos backends de PDF (pdf_backend.py) no mesmo documento sintético.
+Mede, para cada backend instalado: abrir e iterar as páginas, ler os
+metadados e carimbar todas as páginas reescrevendo o documento (modo xobject).
+Uso: python scripts/benchmark_pdf_backends.py [--scanned] [paginas ...]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_backend import available_backends, open_pdf
+from pdf_stamper import stamp_pdf
+from scripts.benchmark_stamping import make_synthetic_pdf
+
+DEFAULT_PAGE_COUNTS = [50, 200, 500]
+REPEAT = 3
+
+
+def draw_stamp(c, width, height):
+    c.drawString(width - 200, 20, "Assinado digitalmente")
+
+
+def best_of(func):
+    """Menor tempo de REPEAT execuções (s)"""
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def open_and_iterate(path, backend):
+    with open_pdf(path, backend) as document:
+        for _index, _geometry in document.iter_pages():
+            pass
+
+
+def read_metadata(path, backend):
+    with open_pdf(path, backend) as document:
+        document.get_metadata()
+
+
+def run(page_counts, scanned=False):
+    backends = available_backends()
+    print(f"{'backend':>8} {'páginas':>8} {'abrir+iterar (s)':>17} {'metadados (s)':>14} {'carimbar (s)':>13} {'ms/página':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for num_pages in page_counts:
+            input_path = os.path.join(tmp, f"in_{num_pages}.pdf")
+            output_path = os.path.join(tmp, f"out_{num_pages}.pdf")
+            make_synthetic_pdf(input_path, num_pages, scanned)
+
+            for backend in backends:
+                iterate = best_of(lambda: open_and_iterate(input_path, backend))
+                metadata = best_of(lambda: read_metadata(input_path, backend))
+                stamp = best_of(lambda: stamp_pdf(input_path, output_path, draw_stamp, 'benchmark',
+                                                  mode='xobject', backend=backend))
+                print(f"{backend:>8} {num_pages:>8} {iterate:>17.3f} {metadata:>14.3f} {stamp:>13.3f} "
+                      f"{stamp * 1000 / num_pages:>10.2f}")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    scanned = '--scanned' in args
+    counts = [int(arg) for arg in args if arg != '--scanned'] or DEFAULT_PAGE_COUNTS
+    run(counts, scanned)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark da verificação de segurança de PDFs (pdf_scanner.py) num corpus
+sintético: documentos de texto, escaneados (imagens incompressíveis) e, com
+pikepdf instalado, com fluxos de objetos (/ObjStm).
+Mostra o tempo da pré-varredura em bytes e da verificação completa por MB.
+Com --walk, mede também a varredura estrutural sem pré-varredura (limitada
+por TIMEOUT_SECONDS).
+Uso: python scripts/benchmark_pdf_scan.py [--walk] [paginas ...]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_scanner import prescan_pdf, scan_pdf_safeness
+from scripts.benchmark_stamping import make_synthetic_pdf
+
+try:
+    import pikepdf
+except ImportError:
+    pikepdf = None
+
+DEFAULT_PAGE_COUNTS = [10, 100, 500]
+
+
+def make_corpus(tmp, num_pages):
+    """Documentos do corpus para num_pages: [(nome, caminho)]"""
+    corpus = []
+    for name, scanned in (('texto', False), ('escaneado', True)):
+        path = os.path.join(tmp, f"{name}_{num_pages}.pdf")
+        make_synthetic_pdf(path, num_pages, scanned)
+        corpus.append((name, path))
+    if pikepdf is not None:
+        path = os.path.join(tmp, f"objstm_{num_pages}.pdf")
+        with pikepdf.open(corpus[0][1]) as pdf:
+            pdf.save(path, object_stream_mode=pikepdf.ObjectStreamMode.generate)
+        corpus.append(('objstm', path))
+    return corpus
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run(page_counts, walk=False):
+    header = f"{'documento':>10} {'páginas':>8} {'MB':>7} {'pré-varredura (ms)':>19} {'verificação (ms)':>17} {'ms/MB':>8}"
+    if walk:
+        header += f" {'só estrutural (ms)':>19}"
+    print(header)
+    with tempfile.TemporaryDirectory() as tmp:
+        for num_pages in page_counts:
+            for name, path in make_corpus(tmp, num_pages):
+                size_mb = os.path.getsize(path) / (1024 * 1024)
+                (suspicious, _hits), prescan_time = timed(prescan_pdf, path)
+                (ok, _message), scan_time = timed(scan_pdf_safeness, path, use_cache=False)
+                line = (f"{name:>10} {num_pages:>8} {size_mb:>7.2f} {prescan_time * 1000:>19.1f} "
+                        f"{scan_time * 1000:>17.1f} {scan_time * 1000 / size_mb:>8.1f}")
+                if walk:
+                    (_ok, message), walk_time = timed(scan_pdf_safeness, path, prescan=False, use_cache=False)
+                    line += f" {walk_time * 1000:>19.1f}"
+                    if message.startswith('Timeout'):
+                        line += ' (timeout)'
+                if suspicious:
+                    line += ' [suspeito]'
+                print(line)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    counts = [int(arg) for arg in args if not arg.startswith('--')] or DEFAULT_PAGE_COUNTS
+    run(counts, walk='--walk' in args)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark da assinatura e verificação com o certificado do sistema
+(services/certificate_manager.py) para cada algoritmo de chave: RSA-2048,
+Ed25519 e ECDSA P-256. Mede assinaturas e verificações por segundo sobre o
+digest SHA-256 do documento e o tamanho da assinatura gravada em
+Signature.signature_data (base64).
+Uso: python scripts/benchmark_signing.py [iterações]
+"""
+
+import os
+import sys
+import time
+import base64
+import hashlib
+import tempfile
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.certificate_manager import CertificateManager, KEY_ALGORITHMS
+from utils.key_cache import KeyMaterialCache
+
+DEFAULT_ITERATIONS = 500
+
+
+def throughput(func, iterations):
+    """Operações por segundo de func() em iterations chamadas"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return iterations / (time.perf_counter() - start)
+
+
+def run(iterations):
+    digest = hashlib.sha256(b'%PDF-1.4 documento de teste').digest()
+    with tempfile.TemporaryDirectory() as tmp:
+        # Gera as chaves antes da tabela (a geração imprime o progresso)
+        managers = [CertificateManager(certs_dir=os.path.join(tmp, algorithm.lower()),
+                                       key_cache=KeyMaterialCache(), key_algorithm=algorithm)
+                    for algorithm in KEY_ALGORITHMS]
+        print(f"{'algoritmo':>12} {'formato':>18} {'assinaturas/s':>14} {'verificações/s':>15} "
+              f"{'bytes':>6} {'base64':>7}")
+        for manager in managers:
+            info = manager.sign_pdf_digest(digest)
+            assert manager.verify_pdf_digest(digest, info)[0]
+
+            signs = throughput(lambda: manager.sign_pdf_digest(digest), iterations)
+            verifies = throughput(lambda: manager.verify_pdf_digest(digest, info), iterations)
+            print(f"{manager.key_algorithm:>12} {info['signature_format']:>18} {signs:>14.0f} {verifies:>15.0f} "
+                  f"{len(base64.b64decode(info['signature_data'])):>6} {len(info['signature_data']):>7}")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    run(int(args[0]) if args else DEFAULT_ITERATIONS)
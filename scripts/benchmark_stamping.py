@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark do carimbo de assinatura em PDFs sintéticos.
+Mostra o tempo por página à medida que o número de páginas cresce,
+para cada modo de carimbo (incremental, xobject e merge).
+Com --scanned, cada página recebe uma imagem incompressível (~360 KB),
+simulando documentos escaneados. Com --placement=all,last,... compara as
+políticas de posicionamento do carimbo (padrão: all).
+Uso: python scripts/benchmark_stamping.py [--scanned] [--placement=p1,p2] [paginas ...]
+"""
+
+import io
+import os
+import sys
+import time
+import base64
+import tempfile
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+from reportlab.pdfgen import canvas
+from reportlab.lib.utils import ImageReader
+from reportlab.lib.pagesizes import A4, landscape
+from pdf_stamper import STAMP_MODES, STAMP_PLACEMENTS, StampImageCache, stamp_pdf, stamp_content_key, draw_single_signer_stamp
+
+DEFAULT_PAGE_COUNTS = [10, 50, 100, 200, 400]
+LOGO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static', 'images', 'logo.png')
+
+
+def make_synthetic_pdf(path, num_pages, scanned=False):
+    """Gera um PDF com páginas A4 retrato e, a cada 10, paisagem"""
+    c = canvas.Canvas(path, pagesize=A4)
+    for i in range(num_pages):
+        c.setPageSize(landscape(A4) if i % 10 == 9 else A4)
+        if scanned:
+            # Ruído aleatório: não comprime, como uma digitalização
+            scan = Image.frombytes('RGB', (300, 400), os.urandom(300 * 400 * 3))
+            c.drawImage(ImageReader(scan), 36, 36, width=500, height=700)
+        c.drawString(72, 720, f"Página {i + 1} - documento sintético de benchmark")
+        c.showPage()
+    c.save()
+
+
+def make_signature_image():
+    """Gera uma rubrica PNG em data URL, como enviada pelo tablet"""
+    img = Image.new('RGBA', (400, 150), (255, 255, 255, 0))
+    draw = ImageDraw.Draw(img)
+    draw.line((20, 120, 120, 30, 220, 110, 380, 40), fill='black', width=4)
+    buffer = io.BytesIO()
+    img.save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+def run(page_counts, scanned=False, placements=('all',)):
+    signature_image = make_signature_image()
+    personal_info = {'nome': 'Cliente Benchmark', 'cpf': '00000000000'}
+    timestamp = time.strftime("%d/%m/%Y %H:%M:%S")
+    image_cache = StampImageCache()
+
+    def draw_stamp(c, width, height):
+        draw_single_signer_stamp(c, width, height, signature_image, personal_info, LOGO_PATH, timestamp, image_cache)
+
+    content_key = stamp_content_key(signature_image, personal_info, LOGO_PATH, timestamp)
+
+    print(f"{'modo':>11} {'posição':>14} {'páginas':>8} {'entrada (KB)':>13} {'total (s)':>10} {'ms/página':>10} {'overlays':>9} {'saída (KB)':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for num_pages in page_counts:
+            input_path = os.path.join(tmp, f"in_{num_pages}.pdf")
+            output_path = os.path.join(tmp, f"out_{num_pages}.pdf")
+            make_synthetic_pdf(input_path, num_pages, scanned)
+            input_kb = os.path.getsize(input_path) / 1024
+
+            for mode in STAMP_MODES:
+                for placement in placements:
+                    start = time.perf_counter()
+                    stats = stamp_pdf(input_path, output_path, draw_stamp, content_key, mode=mode, placement=placement)
+                    elapsed = time.perf_counter() - start
+
+                    print(f"{mode:>11} {placement:>14} {num_pages:>8} {input_kb:>13.1f} {elapsed:>10.3f} {elapsed * 1000 / num_pages:>10.2f} "
+                          f"{stats['overlays_rendered']:>9} {os.path.getsize(output_path) / 1024:>11.1f}")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    scanned = '--scanned' in args
+    placements = ('all',)
+    for arg in args:
+        if arg.startswith('--placement='):
+            placements = [p for p in arg.split('=', 1)[1].split(',') if p in STAMP_PLACEMENTS] or placements
+    counts = [int(arg) for arg in args if not arg.startswith('--')] or DEFAULT_PAGE_COUNTS
+    run(counts, scanned, placements)
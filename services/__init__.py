@@ -5,12 +5,36 @@ from .ldap_service import LDAPAuthenticator, LDAPAuthenticationError
 from .ad_sync_service import ADSyncService
 from .pdf_validator import pdf_validator
 from .certificate_manager import certificate_manager
+from .stamping_engine import (
+    stamping_engine, StampingUnavailable, StampingQueueFull, StampingTimeout, StampingWorkerLost,
+    StampingMemoryExceeded
+)
+from .scan_cache import scan_verdict_cache
+from .upload_ingest import upload_ingestor
+from .resumable_upload import resumable_uploads, ResumableUploadError
+from .content_store import content_store
+from .batch_validation import batch_validator, BatchValidationError
+from .validation_cache import validation_cache
 
 __all__ = [
     'LDAPAuthenticator',
     'LDAPAuthenticationError',
     'ADSyncService',
     'pdf_validator',
-    'certificate_manager'
+    'certificate_manager',
+    'stamping_engine',
+    'StampingUnavailable',
+    'StampingQueueFull',
+    'StampingTimeout',
+    'StampingWorkerLost',
+    'StampingMemoryExceeded',
+    'scan_verdict_cache',
+    'upload_ingestor',
+    'resumable_uploads',
+    'ResumableUploadError',
+    'content_store',
+    'batch_validator',
+    'BatchValidationError',
+    'validation_cache'
 ]
 
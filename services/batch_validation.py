@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Validação em lote de PDFs assinados (POST /validate/batch)
+O setor de arquivo revalida centenas de documentos de uma vez. Os arquivos
+chegam num único envio (vários pdf_files no multipart, um .zip no campo
+archive ou o .zip como corpo da requisição) e são gravados com o SHA-256
+calculado durante a gravação (upload_ingest). Os registros de assinatura de
+todos os hashes são buscados numa única consulta pela aplicação, e cada
+arquivo passa pela verificação de segurança e pela validação num pool de
+threads limitado. Os resultados são devolvidos um por linha (NDJSON) à medida
+que cada arquivo termina, não na ordem do envio (o campo index identifica o
+arquivo).
+
+VALIDATE_BATCH_WORKERS não deve passar de SCANNER_WORKERS + SCANNER_MAX_QUEUE,
+senão os arquivos excedentes são recusados com "Servidor ocupado".
+
+Configuração (variáveis de ambiente):
+    VALIDATE_BATCH_WORKERS:   arquivos validados ao mesmo tempo por processo (padrão: 4)
+    VALIDATE_BATCH_MAX_FILES: arquivos por lote (padrão: 500)
+    VALIDATE_BATCH_MAX_MB:    tamanho do envio e do .zip descompactado (padrão: 500)
+"""
+
+import os
+import shutil
+import logging
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from werkzeug.datastructures import FileStorage
+
+from services.upload_ingest import COPY_CHUNK_SIZE, _remove
+
+logger = logging.getLogger(__name__)
+
+
+class BatchValidationError(Exception):
+    """Lote recusado antes da validação; status_code é a resposta HTTP"""
+    status_code = 400
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        if status_code is not None:
+            self.status_code = status_code
+
+
+def _temp_pdf(temp_dir):
+    fd, path = tempfile.mkstemp(suffix='.pdf', dir=temp_dir)
+    os.close(fd)
+    return path
+
+
+class BatchValidator:
+    """Recebe os arquivos de um lote e os valida em paralelo (pool de threads limitado)"""
+
+    def __init__(self, max_workers=None, max_files=None, max_bytes=None, scan_func=None, validate_func=None):
+        if max_workers is None:
+            max_workers = int(os.environ.get('VALIDATE_BATCH_WORKERS', '4'))
+        if max_files is None:
+            max_files = int(os.environ.get('VALIDATE_BATCH_MAX_FILES', '500'))
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get('VALIDATE_BATCH_MAX_MB', '500')) * 1024 * 1024)
+        self.max_workers = max(1, max_workers)
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self._scan_func = scan_func
+        self._validate_func = validate_func
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='validate-batch')
+            return self._executor
+
+    def _scan(self, path, digest):
+        if self._scan_func is not None:
+            return self._scan_func(path, digest=digest)
+        from pdf_scanner import scan_pdf_safeness
+        return scan_pdf_safeness(path, digest=digest)
+
+    def _validate(self, path, record, digest):
+        if self._validate_func is not None:
+            return self._validate_func(path, record, digest=digest)
+        from services.pdf_validator import pdf_validator
+        return pdf_validator.validate_pdf(path, record, digest=digest)
+
+    def _check_count(self, count):
+        if count > self.max_files:
+            raise BatchValidationError(f'Lote excede o limite de {self.max_files} arquivos', 413)
+
+    def receive_files(self, files, temp_dir, ingestor):
+        """Grava os arquivos do multipart (FileStorage)
+
+        Returns:
+            list[dict]: resultado de ingestor.receive para cada arquivo, com index
+        """
+        files = [file for file in files if file and file.filename]
+        self._check_count(len(files))
+        received = []
+        for index, file in enumerate(files):
+            if not file.filename.lower().endswith('.pdf'):
+                item = {'filename': file.filename, 'temp_path': None, 'ok': False,
+                        'message': 'Arquivo deve ser um PDF', 'sha256': None, 'size': 0}
+            else:
+                item = ingestor.receive(file, file.filename, '', _temp_pdf(temp_dir))
+            item['index'] = index
+            received.append(item)
+        return received
+
+    def receive_archive(self, stream, temp_dir, ingestor, max_file_bytes=None):
+        """Grava os PDFs de um .zip (entradas que não terminam em .pdf são ignoradas)
+
+        O tamanho declarado de cada entrada é conferido antes da extração; o
+        zipfile não lê além dele e confere o CRC, de modo que um arquivo
+        compactado malicioso não passa do limite do lote.
+
+        Returns:
+            list[dict]: ver receive_files
+        """
+        fd, archive_path = tempfile.mkstemp(suffix='.zip', dir=temp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                shutil.copyfileobj(stream, output, COPY_CHUNK_SIZE)
+            try:
+                archive = zipfile.ZipFile(archive_path)
+            except zipfile.BadZipFile:
+                raise BatchValidationError('Arquivo .zip inválido')
+            with archive:
+                members = [info for info in archive.infolist()
+                           if not info.is_dir() and info.filename.lower().endswith('.pdf')]
+                self._check_count(len(members))
+                if sum(info.file_size for info in members) > self.max_bytes:
+                    raise BatchValidationError(
+                        f'Conteúdo do .zip excede o limite de {self.max_bytes // (1024 * 1024)} MB', 413)
+                received = []
+                for index, info in enumerate(members):
+                    if max_file_bytes and info.file_size > max_file_bytes:
+                        item = {'filename': info.filename, 'temp_path': None, 'ok': False, 'sha256': None,
+                                'size': info.file_size,
+                                'message': f'Arquivo excede o limite de {max_file_bytes // (1024 * 1024)} MB'}
+                    else:
+                        with archive.open(info) as member:
+                            item = ingestor.receive(FileStorage(stream=member, filename=info.filename),
+                                                    info.filename, '', _temp_pdf(temp_dir))
+                    item['index'] = index
+                    received.append(item)
+                return received
+        finally:
+            _remove(archive_path)
+
+    def validate_one(self, item, record):
+        """Verificação de segurança e validação de um arquivo recebido; remove o arquivo
+
+        Returns:
+            dict: index, filename, sha256, size, valid, file_id (do registro
+                  encontrado) e o resultado de validate_pdf ou error
+        """
+        result = {'index': item['index'], 'filename': item['filename'], 'sha256': item['sha256'],
+                  'size': item['size'], 'valid': False, 'file_id': getattr(record, 'file_id', None)}
+        try:
+            if not item['ok']:
+                result['error'] = item['message']
+                return result
+            ok, message = self._scan(item['temp_path'], item['sha256'])
+            if not ok:
+                result['error'] = f'PDF rejeitado: {message}'
+                return result
+            result.update(self._validate(item['temp_path'], record, item['sha256']))
+        except Exception as e:
+            logger.warning(f"Falha ao validar {item['filename']}: {e}")
+            result['error'] = f'Erro ao processar arquivo: {e}'
+        finally:
+            if item.get('temp_path'):
+                _remove(item['temp_path'])
+        return result
+
+    def run(self, received, records):
+        """Valida os arquivos recebidos em paralelo
+
+        records: {sha256: registro} (consulta única feita pela aplicação)
+
+        Yields:
+            dict (ver validate_one) de cada arquivo, na ordem em que terminam.
+            Se o consumidor parar antes do fim (cliente desconectado), os
+            arquivos ainda não iniciados são descartados.
+        """
+        executor = self._get_executor()
+        futures = {executor.submit(self.validate_one, item, records.get(item['sha256'])): item for item in received}
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            for future, item in futures.items():
+                if future.cancel() and item.get('temp_path'):
+                    _remove(item['temp_path'])
+
+    def discard(self, received):
+        """Remove os arquivos de um lote que não chegou a ser validado"""
+        for item in received:
+            if item.get('temp_path'):
+                _remove(item['temp_path'])
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+# Instância global da validação em lote
+batch_validator = BatchValidator()
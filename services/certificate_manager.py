@@ -12,20 +12,53 @@ from datetime import datetime, timedelta
 from cryptography import x509
 from cryptography.x509.oid import NameOID
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
-from cryptography.hazmat.primitives.serialization import load_pem_private_key
+from cryptography.hazmat.primitives.asymmetric import rsa, ec, ed25519, padding, utils
 from cryptography.hazmat.backends import default_backend
 from cryptography.exceptions import InvalidSignature
 from cryptography.hazmat.primitives.serialization import pkcs7
 import tempfile
+from utils.key_cache import key_material_cache
+
+# Algoritmos da chave do sistema: formato gravado em Signature.signature_algorithm
+# e sufixo dos arquivos em certs_dir. RSA mantém os nomes originais dos arquivos.
+KEY_ALGORITHMS = {
+    'RSA': {'format': 'RSA-SHA256', 'suffix': ''},
+    'ED25519': {'format': 'Ed25519-SHA256', 'suffix': '_ed25519'},
+    'ECDSA-P256': {'format': 'ECDSA-P256-SHA256', 'suffix': '_ecdsa_p256'},
+}
+SIGNATURE_FORMATS = {info['format']: algorithm for algorithm, info in KEY_ALGORITHMS.items()}
+
+
+def algorithm_for_format(signature_format):
+    """Algoritmo da chave que produziu a assinatura no formato informado
+    
+    Registros antigos (sem formato ou com outro rótulo) foram assinados com RSA.
+    """
+    return SIGNATURE_FORMATS.get(signature_format or '', 'RSA')
+
 
 class CertificateManager:
-    def __init__(self, certs_dir="certificates"):
-        """Inicializa o gerenciador de certificados"""
+    def __init__(self, certs_dir="certificates", key_cache=None, key_algorithm=None):
+        """Inicializa o gerenciador de certificados
+        
+        key_cache: cache das chaves e certificados interpretados
+        (padrão: utils.key_cache.key_material_cache, compartilhado pelo processo)
+        key_algorithm: RSA, ED25519 ou ECDSA-P256 para as novas assinaturas
+        (padrão: CERTIFICATE_KEY_ALGORITHM ou RSA). As assinaturas existentes
+        continuam verificáveis com a chave do algoritmo em que foram feitas.
+        """
+        if key_algorithm is None:
+            key_algorithm = os.environ.get('CERTIFICATE_KEY_ALGORITHM', 'RSA')
+        key_algorithm = key_algorithm.strip().upper()
+        if key_algorithm not in KEY_ALGORITHMS:
+            raise ValueError(f"Algoritmo de chave não suportado: {key_algorithm} "
+                             f"(use {', '.join(KEY_ALGORITHMS)})")
+        
         self.certs_dir = certs_dir
-        self.private_key_path = os.path.join(certs_dir, "private_key.pem")
-        self.certificate_path = os.path.join(certs_dir, "certificate.pem")
-        self.certificate_chain_path = os.path.join(certs_dir, "certificate_chain.pem")
+        self.key_cache = key_cache or key_material_cache
+        self.key_algorithm = key_algorithm
+        self.signature_format = KEY_ALGORITHMS[key_algorithm]['format']
+        self.private_key_path, self.certificate_path, self.certificate_chain_path = self._paths(key_algorithm)
         
         # Cria diretório se não existir
         if not os.path.exists(certs_dir):
@@ -35,6 +68,26 @@ class CertificateManager:
         if not self._certificate_exists():
             self._generate_self_signed_certificate()
     
+    def _paths(self, key_algorithm):
+        """Chave privada, certificado e cadeia do algoritmo informado"""
+        suffix = KEY_ALGORITHMS[key_algorithm]['suffix']
+        return (os.path.join(self.certs_dir, f"private_key{suffix}.pem"),
+                os.path.join(self.certs_dir, f"certificate{suffix}.pem"),
+                os.path.join(self.certs_dir, f"certificate_chain{suffix}.pem"))
+    
+    def _load_certificate(self, key_algorithm=None):
+        """Certificado X.509 (carregado uma vez; recarregado se o arquivo mudar)
+        
+        key_algorithm: certificado de outro algoritmo (verificação de assinaturas antigas)
+        """
+        if key_algorithm is None or key_algorithm == self.key_algorithm:
+            return self.key_cache.certificate(self.certificate_path)
+        return self.key_cache.certificate(self._paths(key_algorithm)[1])
+    
+    def _load_private_key(self):
+        """Chave privada (carregada uma vez; recarregada se o arquivo mudar)"""
+        return self.key_cache.private_key(self.private_key_path)
+    
     def _certificate_exists(self):
         """Verifica se o certificado já existe"""
         return (os.path.exists(self.private_key_path) and 
@@ -42,14 +95,19 @@ class CertificateManager:
     
     def _generate_self_signed_certificate(self):
         """Gera um certificado auto-assinado X.509"""
-        print("🔐 Gerando certificado digital X.509...")
+        print(f"🔐 Gerando certificado digital X.509 ({self.key_algorithm})...")
         
-        # Gera chave privada RSA-2048
-        private_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=2048,
-            backend=default_backend()
-        )
+        # Gera a chave privada (RSA-2048, Ed25519 ou ECDSA P-256)
+        if self.key_algorithm == 'ED25519':
+            private_key = ed25519.Ed25519PrivateKey.generate()
+        elif self.key_algorithm == 'ECDSA-P256':
+            private_key = ec.generate_private_key(ec.SECP256R1(), default_backend())
+        else:
+            private_key = rsa.generate_private_key(
+                public_exponent=65537,
+                key_size=2048,
+                backend=default_backend()
+            )
         
         # Salva chave privada
         with open(self.private_key_path, "wb") as f:
@@ -106,7 +164,7 @@ class CertificateManager:
                 x509.oid.ExtendedKeyUsageOID.SERVER_AUTH,
             ]),
             critical=False,
-        ).sign(private_key, hashes.SHA256(), default_backend())
+        ).sign(private_key, None if self.key_algorithm == 'ED25519' else hashes.SHA256(), default_backend())
         
         # Salva certificado
         with open(self.certificate_path, "wb") as f:
@@ -124,10 +182,7 @@ class CertificateManager:
     def get_certificate_info(self):
         """Retorna informações do certificado"""
         try:
-            with open(self.certificate_path, "rb") as f:
-                cert_data = f.read()
-            
-            cert = x509.load_pem_x509_certificate(cert_data, default_backend())
+            cert = self._load_certificate()
             
             return {
                 'subject': self._format_name(cert.subject),
@@ -137,6 +192,8 @@ class CertificateManager:
                 'not_valid_after': cert.not_valid_after.isoformat(),
                 'fingerprint_sha256': cert.fingerprint(hashes.SHA256()).hex(),
                 'fingerprint_sha1': cert.fingerprint(hashes.SHA1()).hex(),
+                'key_algorithm': self.key_algorithm,
+                'signature_format': self.signature_format,
             }
         except Exception as e:
             return {'error': str(e)}
@@ -167,37 +224,37 @@ class CertificateManager:
     
     def sign_pdf_with_certificate(self, pdf_content):
         """Assina o conteúdo do PDF usando certificado X.509 e PKCS#7"""
+        return self.sign_pdf_digest(hashlib.sha256(pdf_content).digest())
+    
+    def sign_pdf_digest(self, digest):
+        """Assina o SHA-256 já calculado do PDF (sem reler o conteúdo)
+        
+        A assinatura RSA PKCS#1 v1.5 sobre o digest pré-calculado é idêntica à
+        assinatura sobre o conteúdo completo, portanto continua verificável por
+        verify_signature_with_certificate. Com Ed25519 a mensagem assinada é o
+        próprio digest; com ECDSA P-256 o digest é usado como pré-calculado.
+        """
         try:
-            # Carrega chave privada
-            with open(self.private_key_path, "rb") as f:
-                private_key = load_pem_private_key(f.read(), password=None, backend=default_backend())
-            
-            # Carrega certificado
-            with open(self.certificate_path, "rb") as f:
-                cert_data = f.read()
-            
-            cert = x509.load_pem_x509_certificate(cert_data, default_backend())
+            if isinstance(digest, str):
+                digest = bytes.fromhex(digest)
             
-            # Calcula hash do conteúdo
-            content_hash = hashlib.sha256(pdf_content).hexdigest()
+            # Chave privada e certificado já interpretados (cache do processo)
+            private_key = self._load_private_key()
+            cert = self._load_certificate()
             
             # Assina o hash com a chave privada
-            signature = private_key.sign(
-                pdf_content,
-                padding.PKCS1v15(),
-                hashes.SHA256()
-            )
+            signature = self._sign_digest(private_key, digest)
             
             # Informações da assinatura
             signature_info = {
-                'hash': content_hash,
+                'hash': digest.hex(),
                 'timestamp': datetime.now().isoformat(),
                 'algorithm': 'SHA256',
                 'certificate_subject': str(cert.subject),
                 'certificate_issuer': str(cert.issuer),
                 'certificate_serial': str(cert.serial_number),
                 'certificate_fingerprint': cert.fingerprint(hashes.SHA256()).hex(),
-                'signature_format': 'RSA-SHA256',
+                'signature_format': self.signature_format,
                 'signature_data': base64.b64encode(signature).decode('utf-8')
             }
             
@@ -207,29 +264,61 @@ class CertificateManager:
             print(f"Erro ao assinar com certificado: {e}")
             return None
     
+    def _sign_digest(self, private_key, digest):
+        """Assinatura do digest SHA-256 com a chave do algoritmo configurado"""
+        if self.key_algorithm == 'ED25519':
+            return private_key.sign(digest)
+        if self.key_algorithm == 'ECDSA-P256':
+            return private_key.sign(digest, ec.ECDSA(utils.Prehashed(hashes.SHA256())))
+        return private_key.sign(digest, padding.PKCS1v15(), utils.Prehashed(hashes.SHA256()))
+    
+    @staticmethod
+    def _verify_digest(key_algorithm, public_key, signature, digest):
+        """Verifica a assinatura do digest; levanta InvalidSignature se não conferir"""
+        if key_algorithm == 'ED25519':
+            public_key.verify(signature, digest)
+        elif key_algorithm == 'ECDSA-P256':
+            public_key.verify(signature, digest, ec.ECDSA(utils.Prehashed(hashes.SHA256())))
+        else:
+            public_key.verify(signature, digest, padding.PKCS1v15(), utils.Prehashed(hashes.SHA256()))
+    
     def verify_signature_with_certificate(self, pdf_content, signature_info):
         """Verifica assinatura usando certificado X.509"""
+        return self.verify_pdf_digest(hashlib.sha256(pdf_content).digest(), signature_info)
+    
+    def verify_pdf_file(self, pdf_path, signature_info):
+        """Verifica a assinatura de um PDF em disco, calculando o SHA-256 durante a leitura"""
+        from utils.crypto_utils import calculate_pdf_hash
         try:
-            # Carrega certificado
-            with open(self.certificate_path, "rb") as f:
-                cert_data = f.read()
+            digest = calculate_pdf_hash(pdf_path)
+        except OSError as e:
+            return False, f"Erro na verificação: {str(e)}"
+        return self.verify_pdf_digest(digest, signature_info)
+    
+    def verify_pdf_digest(self, digest, signature_info):
+        """Verifica a assinatura a partir do SHA-256 já calculado do PDF (bytes ou hex)
+        
+        Assinaturas RSA PKCS#1 v1.5 feitas sobre o conteúdo completo ou sobre o
+        digest (sign_pdf_digest) são equivalentes e ambas são aceitas. A chave
+        usada segue signature_info['signature_format'] (RSA quando ausente),
+        independentemente do algoritmo configurado para as novas assinaturas.
+        """
+        try:
+            if isinstance(digest, str):
+                digest = bytes.fromhex(digest)
             
-            cert = x509.load_pem_x509_certificate(cert_data, default_backend())
+            # Carrega o certificado do algoritmo em que a assinatura foi feita
+            key_algorithm = algorithm_for_format(signature_info.get('signature_format'))
+            cert = self._load_certificate(key_algorithm)
             
             # Decodifica dados da assinatura
             signature_data = base64.b64decode(signature_info['signature_data'])
             
-            # Verifica assinatura RSA
-            public_key = cert.public_key()
-            public_key.verify(
-                signature_data,
-                pdf_content,
-                padding.PKCS1v15(),
-                hashes.SHA256()
-            )
+            # Verifica a assinatura sobre o digest (sem recalcular o hash do conteúdo)
+            self._verify_digest(key_algorithm, cert.public_key(), signature_data, digest)
             
             # Verifica se o hash do conteúdo atual corresponde ao original
-            current_hash = hashlib.sha256(pdf_content).hexdigest()
+            current_hash = digest.hex()
             original_hash = signature_info['hash']
             
             if current_hash != original_hash:
@@ -247,6 +336,10 @@ class CertificateManager:
         except Exception as e:
             return False, f"Erro na verificação: {str(e)}"
     
+    def certificate_fingerprint(self, key_algorithm=None):
+        """Impressão digital SHA-256 (hex) do certificado do algoritmo informado (padrão: o configurado)"""
+        return self._load_certificate(key_algorithm).fingerprint(hashes.SHA256()).hex()
+    
     def export_certificate_pem(self):
         """Exporta certificado em formato PEM"""
         try:
@@ -258,10 +351,7 @@ class CertificateManager:
     def export_certificate_der(self):
         """Exporta certificado em formato DER"""
         try:
-            with open(self.certificate_path, "rb") as f:
-                cert_data = f.read()
-            
-            cert = x509.load_pem_x509_certificate(cert_data, default_backend())
+            cert = self._load_certificate()
             return cert.public_bytes(serialization.Encoding.DER)
         except Exception as e:
             return f"Erro ao exportar certificado DER: {str(e)}"
@@ -269,10 +359,7 @@ class CertificateManager:
     def get_certificate_status(self):
         """Verifica status do certificado"""
         try:
-            with open(self.certificate_path, "rb") as f:
-                cert_data = f.read()
-            
-            cert = x509.load_pem_x509_certificate(cert_data, default_backend())
+            cert = self._load_certificate()
             now = datetime.utcnow()
             
             if now < cert.not_valid_before:
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Armazenamento dos PDFs originais endereçado pelo conteúdo
+O mesmo modelo de contrato costuma ser enviado para dezenas de clientes. Cada
+original aprovado na verificação é guardado uma única vez, em
+<diretório>/<sha256[:2]>/<sha256>.pdf; envios idênticos passam a apontar
+(Signature.pdf_file_path) para o mesmo arquivo. O veredicto da verificação já
+é compartilhado pela mesma chave SHA-256 (services/scan_cache.py).
+
+As referências são os registros que ainda precisam do original (em
+verificação ou pendentes de assinatura) e são contadas no banco; um arquivo
+só é removido pela limpeza quando não resta nenhuma referência e ele não foi
+reaproveitado nos últimos CONTENT_STORE_GRACE_SECONDS (envios ainda não
+gravados no banco).
+
+Configuração (variáveis de ambiente):
+    CONTENT_STORE_DIR:           diretório dos originais (padrão: temp_files/originais)
+    CONTENT_STORE_GRACE_SECONDS: idade mínima de um original sem referências
+                                 para ser removido (padrão: 900)
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'temp_files', 'originais')
+DIGEST_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class ContentStore:
+    """Originais deduplicados pelo SHA-256 do conteúdo"""
+
+    def __init__(self, directory=None, grace_seconds=None):
+        if directory is None:
+            directory = os.environ.get('CONTENT_STORE_DIR') or DEFAULT_DIRECTORY
+        if grace_seconds is None:
+            grace_seconds = int(os.environ.get('CONTENT_STORE_GRACE_SECONDS', '900'))
+        self.directory = os.path.abspath(directory)
+        self.grace_seconds = grace_seconds
+        self._lock = threading.Lock()
+        self._metrics = {'stored': 0, 'deduplicated': 0, 'deduplicated_bytes': 0}
+
+    def path_for(self, digest):
+        """Caminho do original com este SHA-256"""
+        if not DIGEST_PATTERN.match(digest or ''):
+            raise ValueError(f'SHA-256 inválido: {digest!r}')
+        return os.path.join(self.directory, digest[:2], f"{digest}.pdf")
+
+    def contains(self, path):
+        """True se path é um original deste armazenamento"""
+        return bool(path) and os.path.dirname(os.path.dirname(os.path.abspath(path))) == self.directory
+
+    def store(self, path, digest):
+        """Guarda o arquivo de path (já verificado) sob o seu SHA-256
+
+        Se o conteúdo já estiver armazenado, path é removido e o original
+        existente é reaproveitado.
+
+        Returns:
+            caminho do original no armazenamento
+        """
+        blob_path = self.path_for(digest)
+        size = os.path.getsize(path)
+        if os.path.exists(blob_path):
+            # Renova a data: protege o original da limpeza até o registro ser gravado
+            os.utime(blob_path)
+            os.remove(path)
+            with self._lock:
+                self._metrics['deduplicated'] += 1
+                self._metrics['deduplicated_bytes'] += size
+            return blob_path
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        os.replace(path, blob_path)
+        with self._lock:
+            self._metrics['stored'] += 1
+        return blob_path
+
+    def _blobs(self):
+        if not os.path.isdir(self.directory):
+            return
+        for prefix in os.listdir(self.directory):
+            folder = os.path.join(self.directory, prefix)
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                if name.endswith('.pdf'):
+                    yield os.path.join(folder, name)
+
+    def collect(self, referenced, grace_seconds=None):
+        """Remove os originais sem referências
+
+        Args:
+            referenced: caminhos ainda referenciados por algum registro
+            grace_seconds: idade mínima (mtime) para a remoção (padrão: configurado)
+
+        Returns:
+            (originais removidos, bytes liberados)
+        """
+        if grace_seconds is None:
+            grace_seconds = self.grace_seconds
+        referenced = {os.path.abspath(path) for path in referenced if path}
+        cutoff = time.time() - grace_seconds
+        removed = freed = 0
+        for blob_path in list(self._blobs()):
+            if blob_path in referenced:
+                continue
+            try:
+                stat = os.stat(blob_path)
+                if stat.st_mtime >= cutoff:
+                    continue
+                os.remove(blob_path)
+                removed += 1
+                freed += stat.st_size
+            except OSError as e:
+                logger.warning(f"Falha ao remover original {blob_path}: {e}")
+        return removed, freed
+
+    def usage(self, references):
+        """Relatório de uso de disco e da economia da deduplicação
+
+        Args:
+            references: {caminho: quantidade de registros que o referenciam}
+
+        Returns:
+            dict: originais armazenados e seus bytes, referências, bytes que
+                  as referências ocupariam sem deduplicação, bytes economizados
+                  e originais sem referência
+        """
+        references = {os.path.abspath(path): count for path, count in references.items() if path}
+        blobs = stored_bytes = referenced_bytes = logical_bytes = reference_count = unreferenced = 0
+        for blob_path in self._blobs():
+            try:
+                size = os.path.getsize(blob_path)
+            except OSError:
+                continue
+            count = references.get(blob_path, 0)
+            blobs += 1
+            stored_bytes += size
+            logical_bytes += size * count
+            reference_count += count
+            if count:
+                referenced_bytes += size
+            else:
+                unreferenced += 1
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics.update({
+            'blobs': blobs,
+            'stored_bytes': stored_bytes,
+            'references': reference_count,
+            'logical_bytes': logical_bytes,
+            'saved_bytes': max(0, logical_bytes - referenced_bytes),
+            'unreferenced_blobs': unreferenced,
+        })
+        return metrics
+
+
+# Instância global do armazenamento de originais
+content_store = ContentStore()
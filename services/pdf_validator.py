@@ -10,7 +10,7 @@ from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.backends import default_backend
 from cryptography import x509
 import base64
-from PyPDF2 import PdfReader
+from pdf_backend import open_pdf
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.utils import ImageReader
@@ -34,30 +34,18 @@ class PDFValidator:
     def extract_signature_metadata(self, pdf_path):
         """Extrai metadados de assinatura do PDF"""
         try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PdfReader(file)
-                
-                # Procura por metadados de assinatura
+            with open_pdf(pdf_path) as document:
+                # Procura por metadados de assinatura (/SignatureInfo, /SignatureHash...)
                 metadata = {}
-                if pdf_reader.metadata:
-                    # Verifica se há metadados customizados
-                    custom_metadata = pdf_reader.metadata.get('/Custom', {})
-                    if custom_metadata:
-                        # Tenta extrair informações de assinatura
-                        for key, value in custom_metadata.items():
-                            if isinstance(key, str) and 'signature' in key.lower():
-                                metadata[key] = value
+                for key, value in document.get_metadata().items():
+                    if 'signature' in key.lower():
+                        metadata[key] = value
                 
                 # Procura por anotações ou campos de assinatura
-                for page_num, page in enumerate(pdf_reader.pages):
-                    if '/Annots' in page:
-                        annotations = page['/Annots']
-                        for annot in annotations:
-                            annot_obj = annot.get_object()
-                            if '/Contents' in annot_obj:
-                                content = annot_obj['/Contents']
-                                if isinstance(content, str) and 'signature' in content.lower():
-                                    metadata[f'annotation_page_{page_num}'] = content
+                for page_num in range(document.page_count):
+                    for content in document.annotation_contents(page_num):
+                        if 'signature' in content.lower():
+                            metadata[f'annotation_page_{page_num}'] = content
                 
                 return metadata
         except Exception as e:
@@ -73,12 +61,17 @@ class PDFValidator:
         """Verifica a assinatura digital do PDF
         Tenta primeiro com o certificado X.509 do sistema; se falhar, usa a chave pública legacy.
         """
+        return self.verify_digital_signature_digest(self.calculate_pdf_hash(pdf_content), signature_info)
+    
+    def verify_digital_signature_digest(self, pdf_hash, signature_info):
+        """Como verify_digital_signature, a partir do SHA-256 (hex) já calculado do PDF"""
         # Tentativa 1: verificar com o certificado X.509
         try:
             from services.certificate_manager import certificate_manager
-            ok, _msg = certificate_manager.verify_signature_with_certificate(pdf_content, {
+            ok, _msg = certificate_manager.verify_pdf_digest(pdf_hash, {
                 'hash': signature_info.get('hash'),
-                'signature_data': signature_info.get('signature') or signature_info.get('signature_data')
+                'signature_data': signature_info.get('signature') or signature_info.get('signature_data'),
+                'signature_format': signature_info.get('algorithm')
             })
             if ok:
                 return True
@@ -86,13 +79,13 @@ class PDFValidator:
             pass
         # Tentativa 2: fallback legacy com chave pública
         try:
-            from utils.crypto_utils import verify_pdf_signature_unified
+            from utils.crypto_utils import verify_pdf_digest_unified
             # Normaliza o formato para o verificador legacy
             legacy_sig = {
                 'hash': signature_info.get('hash'),
                 'signature': signature_info.get('signature') or signature_info.get('signature_data')
             }
-            return verify_pdf_signature_unified(pdf_content, legacy_sig, self.public_key_path)
+            return verify_pdf_digest_unified(pdf_hash, legacy_sig, self.public_key_path)
         except Exception:
             return False
     
@@ -101,25 +94,71 @@ class PDFValidator:
         from utils.crypto_utils import verify_pdf_signature_unified
         return verify_pdf_signature_unified(pdf_content, signature_info, self.public_key_path)
     
-    def validate_pdf(self, pdf_path, signature_record=None):
+    def validation_cache_key(self, current_hash, signature_record=None):
+        """Chave do resultado em services.validation_cache, ou None se não for possível montá-la
+        
+        (hash do arquivo, id do registro, versão do registro, impressão digital
+        do certificado que verifica o formato da assinatura do registro)
+        """
+        from services.certificate_manager import certificate_manager, algorithm_for_format
+        signature_id, row_version, signature_format = None, None, None
+        if signature_record is not None:
+            signature_id = getattr(signature_record, 'id', None)
+            if signature_id is None:
+                return None
+            signature_format = signature_record.signature_algorithm
+            row_version = hashlib.sha256('|'.join([
+                signature_record.signature_hash or '', signature_format or '', signature_record.signature_data or ''
+            ]).encode('utf-8')).hexdigest()
+        try:
+            fingerprint = certificate_manager.certificate_fingerprint(algorithm_for_format(signature_format))
+        except Exception:
+            return None
+        return (current_hash, signature_id, row_version, fingerprint)
+    
+    def validate_pdf(self, pdf_path, signature_record=None, digest=None, use_cache=True):
         """
         Valida um PDF assinado pelo sistema
         
         Args:
             pdf_path: Caminho para o arquivo PDF
             signature_record: Registro da assinatura no banco de dados (opcional)
+            digest: SHA-256 (hex) já calculado no recebimento do arquivo (opcional)
+            use_cache: reaproveita o resultado de uma validação recente do mesmo
+                arquivo e registro (services.validation_cache)
         
         Returns:
             dict: Resultado da validação com status e detalhes
         """
         try:
-            # Lê o conteúdo do PDF
-            with open(pdf_path, 'rb') as f:
-                pdf_content = f.read()
-            
-            # Calcula hash atual
-            current_hash = self.calculate_pdf_hash(pdf_content)
-            
+            # Hash atual, calculado uma única vez durante a leitura do arquivo;
+            # as verificações de assinatura usam este digest
+            if digest is None:
+                from utils.crypto_utils import calculate_pdf_hash
+                digest = calculate_pdf_hash(pdf_path)
+        except Exception as e:
+            return {
+                'valid': False,
+                'error': f"Erro ao processar PDF: {e}",
+                'errors': [str(e)]
+            }
+        
+        from services.validation_cache import validation_cache
+        cache_key = None
+        if use_cache and validation_cache.enabled:
+            cache_key = self.validation_cache_key(digest, signature_record)
+            cached = validation_cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                return cached
+        
+        result = self._validate_pdf(pdf_path, signature_record, digest)
+        if cache_key and 'error' not in result:
+            validation_cache.put(cache_key, result)
+        return result
+    
+    def _validate_pdf(self, pdf_path, signature_record, current_hash):
+        """Validação completa (assinaturas e metadados) a partir do hash atual"""
+        try:
             result = {
                 'valid': False,
                 'hash_match': False,
@@ -160,14 +199,15 @@ class PDFValidator:
                     }
                     
                     if signature_info['signature']:
-                        result['digital_signature_valid'] = self.verify_digital_signature(pdf_content, signature_info)
+                        result['digital_signature_valid'] = self.verify_digital_signature_digest(current_hash, signature_info)
                         # Verificação com certificado do sistema (PKI interna)
                         ok_cert, msg_cert = False, ''
                         try:
                             from services.certificate_manager import certificate_manager
-                            ok_cert, msg_cert = certificate_manager.verify_signature_with_certificate(pdf_content, {
+                            ok_cert, msg_cert = certificate_manager.verify_pdf_digest(current_hash, {
                                 'hash': signature_info.get('hash'),
-                                'signature_data': signature_info.get('signature')
+                                'signature_data': signature_info.get('signature'),
+                                'signature_format': signature_info.get('algorithm')
                             })
                         except Exception as e:
                             result['errors'].append(str(e))
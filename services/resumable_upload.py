@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Uploads retomáveis em partes para PDFs grandes (tablets em redes instáveis)
+Protocolo no estilo tus (https://tus.io), sem as extensões opcionais:
+    POST   /internal/uploads         cria o upload (Upload-Length, Upload-Metadata)
+    HEAD   /internal/uploads/<id>    progresso (Upload-Offset, Upload-Length)
+    PATCH  /internal/uploads/<id>    acrescenta bytes a partir de Upload-Offset
+    DELETE /internal/uploads/<id>    descarta o upload
+
+As partes são acrescentadas a um único arquivo em disco, com o SHA-256 e o
+cabeçalho %PDF calculados à medida que chegam (HashingUploadFile). Uma conexão
+interrompida no meio de uma parte mantém os bytes já recebidos; o cliente
+consulta o progresso e continua dali. Concluído, o upload é entregue ao
+recebimento normal de internal_signature_upload (campo upload_ids[]).
+
+Cada parte é conferida de novo sob o bloqueio do arquivo: uma repetição da
+mesma parte (PATCH reenviado enquanto o primeiro ainda era gravado) recebe 409
+em vez de ser acrescentada duas vezes. Ao receber a última parte, o SHA-256
+calculado durante o recebimento é gravado nos metadados e reaproveitado por
+take, em qualquer worker, sem reler o arquivo.
+
+O diretório é compartilhado pelos workers da máquina. Uploads sem atividade há
+mais de RESUMABLE_UPLOAD_RETENTION_HOURS são removidos pela rotina de limpeza.
+
+Configuração (variáveis de ambiente):
+    RESUMABLE_UPLOAD_DIR:             diretório das partes (padrão: temp_files/resumable)
+    RESUMABLE_UPLOAD_RETENTION_HOURS: horas sem atividade até o descarte (padrão: 24)
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import ClientDisconnected
+
+from services.upload_ingest import HashingUploadFile, COPY_CHUNK_SIZE, _remove
+
+try:
+    import fcntl
+except ImportError:  # Windows: apenas o bloqueio entre threads do processo
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'temp_files', 'resumable')
+META_FIELDS = ('user_id', 'filename', 'length', 'created', 'sha256', 'header_ok')
+
+
+class ResumableUploadError(Exception):
+    """Requisição do protocolo recusada; status_code é a resposta HTTP"""
+    status_code = 400
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        if status_code is not None:
+            self.status_code = status_code
+
+
+class ResumableUploadStore:
+    """Uploads em andamento: <id>.part com os bytes e <id>.json com os metadados
+
+    O deslocamento atual é sempre o tamanho do arquivo em disco, de modo que
+    qualquer worker pode continuar o upload. O hash parcial fica em memória no
+    processo que recebeu a última parte; outro processo o recalcula do disco.
+    """
+
+    def __init__(self, directory=None, retention_hours=None):
+        if directory is None:
+            directory = os.environ.get('RESUMABLE_UPLOAD_DIR') or DEFAULT_DIRECTORY
+        if retention_hours is None:
+            retention_hours = float(os.environ.get('RESUMABLE_UPLOAD_RETENTION_HOURS', '24'))
+        self.directory = directory
+        self.retention_seconds = retention_hours * 3600
+        self._open = {}
+        self._lock = threading.Lock()
+
+    def _paths(self, upload_id):
+        if not upload_id or not all(char.isalnum() for char in upload_id):
+            raise ResumableUploadError('Upload não encontrado', 404)
+        return os.path.join(self.directory, f"{upload_id}.part"), os.path.join(self.directory, f"{upload_id}.json")
+
+    def _load(self, upload_id, user_id):
+        part_path, meta_path = self._paths(upload_id)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            meta['offset'] = os.path.getsize(part_path)
+        except (OSError, ValueError):
+            raise ResumableUploadError('Upload não encontrado', 404)
+        if meta['user_id'] != str(user_id):
+            raise ResumableUploadError('Upload não encontrado', 404)
+        meta['id'] = upload_id
+        return meta
+
+    @staticmethod
+    def _save_meta(meta_path, meta):
+        temp_path = f"{meta_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({key: meta[key] for key in META_FIELDS if key in meta}, f)
+        os.replace(temp_path, meta_path)
+
+    def create(self, user_id, filename, length):
+        """Registra um upload de length bytes
+
+        Returns:
+            dict: id, filename, length, offset, created
+        """
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        part_path, meta_path = self._paths(upload_id)
+        meta = {'user_id': str(user_id), 'filename': filename, 'length': length, 'created': time.time()}
+        open(part_path, 'wb').close()
+        self._save_meta(meta_path, meta)
+        return dict(meta, id=upload_id, offset=0)
+
+    def info(self, upload_id, user_id):
+        """Metadados e deslocamento atual (ResumableUploadError 404 se não existir)"""
+        return self._load(upload_id, user_id)
+
+    def _stream_for(self, upload_id, part_path, offset):
+        with self._lock:
+            upload = self._open.pop(upload_id, None)
+        if upload is not None and upload.size != offset:
+            # Outro processo recebeu partes depois: recalcula do disco
+            upload.close()
+            upload = None
+        if upload is None:
+            upload = HashingUploadFile.resume(part_path)
+        return upload
+
+    @staticmethod
+    def _lock_file(upload):
+        """Impede que dois processos acrescentem partes ao mesmo upload ao mesmo tempo"""
+        if fcntl is None:
+            return
+        try:
+            fcntl.flock(upload.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            raise ResumableUploadError('Outra parte deste upload está sendo recebida', 423)
+
+    @staticmethod
+    def _unlock_file(upload):
+        if fcntl is not None:
+            fcntl.flock(upload.fileno(), fcntl.LOCK_UN)
+
+    def append(self, upload_id, user_id, offset, stream):
+        """Acrescenta os bytes de stream a partir de offset
+
+        Os bytes recebidos antes de uma desconexão ficam gravados.
+
+        Returns:
+            dict: metadados com o novo deslocamento
+        """
+        meta = self._load(upload_id, user_id)
+        part_path, meta_path = self._paths(upload_id)
+        if offset != meta['offset']:
+            raise ResumableUploadError(f"Deslocamento divergente: esperado {meta['offset']}", 409)
+        upload = self._stream_for(upload_id, part_path, offset)
+        try:
+            self._lock_file(upload)
+            try:
+                # Confere de novo sob o bloqueio: outra requisição pode ter
+                # gravado partes depois da verificação acima
+                size = os.fstat(upload.fileno()).st_size
+                if size != offset or upload.size != offset:
+                    raise ResumableUploadError(f"Deslocamento divergente: esperado {size}", 409)
+                upload.seek(0, os.SEEK_END)
+                while chunk := stream.read(COPY_CHUNK_SIZE):
+                    if upload.size + len(chunk) > meta['length']:
+                        raise ResumableUploadError('Parte ultrapassa o tamanho declarado do upload', 413)
+                    upload.write(chunk)
+                    if upload.header_ok is False:
+                        raise ResumableUploadError('Arquivo inválido (não é PDF)', 415)
+            except ClientDisconnected:
+                logger.info(f"Upload {upload_id} interrompido em {upload.size} bytes")
+            except ResumableUploadError as e:
+                if e.status_code == 413:
+                    # Descarta apenas a parte excedente (ainda sob o bloqueio),
+                    # mantendo o que veio antes dela
+                    upload.flush()
+                    os.ftruncate(upload.fileno(), offset)
+                raise
+            finally:
+                upload.flush()
+                self._unlock_file(upload)
+        except ResumableUploadError as e:
+            upload.close()
+            if e.status_code == 415:
+                self.delete(upload_id, user_id)
+            raise
+        meta['offset'] = upload.size
+        if meta['offset'] < meta['length']:
+            with self._lock:
+                self._open[upload_id] = upload
+        else:
+            # SHA-256 calculado durante o recebimento, para take não reler o arquivo
+            meta['sha256'], meta['header_ok'] = upload.hexdigest(), upload.header_ok
+            self._save_meta(meta_path, meta)
+            upload.close()
+        return meta
+
+    def take(self, upload_id, user_id):
+        """Entrega um upload concluído como FileStorage para UploadIngestor.receive
+
+        O arquivo deixa o armazenamento dos uploads em andamento ao ser
+        movido por receive (claim).
+        """
+        meta = self._load(upload_id, user_id)
+        if meta['offset'] != meta['length']:
+            raise ResumableUploadError(f"Upload incompleto: {meta['offset']} de {meta['length']} bytes", 409)
+        part_path, meta_path = self._paths(upload_id)
+        if meta.get('sha256'):
+            upload = HashingUploadFile.finished(part_path, meta['sha256'], meta['header_ok'])
+        else:
+            # Concluído antes de os metadados guardarem o hash: recalcula do disco
+            upload = HashingUploadFile.resume(part_path)
+        _remove(meta_path)
+        return FileStorage(stream=upload, filename=meta['filename'], content_type='application/pdf')
+
+    def delete(self, upload_id, user_id):
+        """Descarta um upload em andamento"""
+        self._load(upload_id, user_id)
+        self._discard(upload_id)
+
+    def _discard(self, upload_id):
+        with self._lock:
+            upload = self._open.pop(upload_id, None)
+        if upload is not None:
+            upload.close()
+        for path in self._paths(upload_id):
+            _remove(path)
+
+    def cleanup(self, max_age_seconds=None):
+        """Remove uploads sem atividade há mais de max_age_seconds (padrão: retenção configurada)
+
+        Returns:
+            int: uploads removidos
+        """
+        if max_age_seconds is None:
+            max_age_seconds = self.retention_seconds
+        if not os.path.isdir(self.directory):
+            return 0
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        for filename in os.listdir(self.directory):
+            upload_id, extension = os.path.splitext(filename)
+            if extension not in ('.part', '.json'):
+                continue
+            paths = self._paths(upload_id)
+            mtimes = [os.path.getmtime(path) for path in paths if os.path.exists(path)]
+            if mtimes and max(mtimes) < cutoff:
+                self._discard(upload_id)
+                removed += 1
+        return removed
+
+
+# Instância global dos uploads retomáveis
+resumable_uploads = ResumableUploadStore()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Cache de veredictos da verificação de segurança de PDFs
+O mesmo PDF costuma ser enviado várias vezes (modelos de contrato, reenvios,
+validações do mesmo arquivo assinado). O veredicto de scan_pdf_safeness é
+guardado pela chave SHA-256 dos bytes do arquivo, com a versão das regras do
+verificador: ao mudar as regras, os veredictos antigos deixam de ser usados e
+saem pelo LRU.
+
+O armazenamento é compartilhado por todos os workers do gunicorn:
+    sqlite: arquivo local da máquina (padrão)
+    redis:  SCAN_CACHE_URL=redis://..., compartilhado também entre máquinas
+
+SECURITY: um veredicto no cache dispensa a verificação do PDF. O arquivo
+SQLite fica no diretório instance/ da aplicação (nunca no /tmp compartilhado),
+é criado com permissão 0600 e é recusado se pertencer a outro usuário ou puder
+ser alterado por outros usuários.
+
+Configuração (variáveis de ambiente):
+    SCAN_CACHE_URL:         redis://... ou caminho do arquivo SQLite
+                            (padrão: instance/scan_cache.sqlite3)
+    SCAN_CACHE_MAX_ENTRIES: veredictos mantidos (LRU); 0 desativa o cache
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   'instance', 'scan_cache.sqlite3')
+
+
+def open_private_file(path):
+    """Cria o arquivo com permissão 0600 (se não existir) e confere o dono e as permissões
+
+    Raises:
+        PermissionError: arquivo de outro usuário, gravável pelo grupo/outros ou link simbólico
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_NOFOLLOW', 0), 0o600)
+    try:
+        stat = os.fstat(fd)
+    finally:
+        os.close(fd)
+    if hasattr(os, 'getuid'):
+        if stat.st_uid != os.getuid():
+            raise PermissionError(f"{path} pertence a outro usuário")
+        if stat.st_mode & 0o022:
+            raise PermissionError(f"{path} pode ser alterado por outros usuários")
+
+
+class SQLiteVerdictStore:
+    """Veredictos em um arquivo SQLite compartilhado pelos processos da máquina"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            open_private_file(self.path)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS scan_verdicts '
+                '(key TEXT PRIMARY KEY, verdict TEXT NOT NULL, last_used REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_scan_verdicts_last_used ON scan_verdicts (last_used)')
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        connection = self._connect()
+        row = connection.execute('SELECT verdict FROM scan_verdicts WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        connection.execute('UPDATE scan_verdicts SET last_used = ? WHERE key = ?', (time.time(), key))
+        return row[0]
+
+    def put(self, key, value, max_entries):
+        connection = self._connect()
+        connection.execute('INSERT OR REPLACE INTO scan_verdicts (key, verdict, last_used) VALUES (?, ?, ?)',
+                           (key, value, time.time()))
+        connection.execute(
+            'DELETE FROM scan_verdicts WHERE key IN '
+            '(SELECT key FROM scan_verdicts ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+            (max_entries,)
+        )
+
+    def count(self):
+        return self._connect().execute('SELECT COUNT(*) FROM scan_verdicts').fetchone()[0]
+
+    def clear(self):
+        self._connect().execute('DELETE FROM scan_verdicts')
+
+
+class RedisVerdictStore:
+    """Veredictos no Redis: um valor por chave e um sorted set com o último uso"""
+
+    PREFIX = 'assinador:scan_verdict:'
+    LRU_KEY = 'assinador:scan_verdicts:lru'
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=2)
+
+    def get(self, key):
+        value = self.client.get(self.PREFIX + key)
+        if value is None:
+            return None
+        self.client.zadd(self.LRU_KEY, {key: time.time()})
+        return value.decode('utf-8')
+
+    def put(self, key, value, max_entries):
+        pipeline = self.client.pipeline()
+        pipeline.set(self.PREFIX + key, value)
+        pipeline.zadd(self.LRU_KEY, {key: time.time()})
+        pipeline.zcard(self.LRU_KEY)
+        size = pipeline.execute()[-1]
+        if size > max_entries:
+            evicted = [member.decode('utf-8') for member, _score in self.client.zpopmin(self.LRU_KEY, size - max_entries)]
+            if evicted:
+                self.client.delete(*[self.PREFIX + member for member in evicted])
+
+    def count(self):
+        return self.client.zcard(self.LRU_KEY)
+
+    def clear(self):
+        members = [member.decode('utf-8') for member in self.client.zrange(self.LRU_KEY, 0, -1)]
+        if members:
+            self.client.delete(*[self.PREFIX + member for member in members])
+        self.client.delete(self.LRU_KEY)
+
+
+class ScanVerdictCache:
+    """Cache LRU de veredictos (ok, mensagem) por SHA-256 e versão do verificador
+
+    Falhas do armazenamento nunca impedem a verificação: o acesso é tratado
+    como falta no cache.
+    """
+
+    def __init__(self, url=None, max_entries=None):
+        if url is None:
+            url = os.environ.get('SCAN_CACHE_URL')
+            if not url:
+                url = DEFAULT_SQLITE_PATH
+                os.makedirs(os.path.dirname(url), mode=0o700, exist_ok=True)
+        if max_entries is None:
+            max_entries = int(os.environ.get('SCAN_CACHE_MAX_ENTRIES', '10000'))
+        self.url = url
+        self.max_entries = max(0, max_entries)
+        self._store = None
+        self._lock = threading.Lock()
+        self._metrics = {'hits': 0, 'misses': 0, 'stores': 0, 'errors': 0}
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _get_store(self):
+        with self._lock:
+            if self._store is None:
+                if self.url.startswith(('redis://', 'rediss://', 'unix://')):
+                    self._store = RedisVerdictStore(self.url)
+                else:
+                    self._store = SQLiteVerdictStore(self.url)
+            return self._store
+
+    @staticmethod
+    def _key(digest, version):
+        return f"{version}:{digest}"
+
+    def _count(self, name):
+        with self._lock:
+            self._metrics[name] += 1
+
+    def get(self, digest, version):
+        """Veredicto (ok, mensagem[, análise]) guardado, ou None"""
+        if not self.enabled:
+            return None
+        try:
+            value = self._get_store().get(self._key(digest, version))
+        except Exception as e:
+            self._count('errors')
+            logger.warning(f"Cache de verificação indisponível: {e}")
+            return None
+        if value is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return tuple(json.loads(value))
+
+    def put(self, digest, version, verdict):
+        """Guarda o veredicto (ok, mensagem[, análise]) e descarta os menos usados acima de max_entries"""
+        if not self.enabled:
+            return
+        try:
+            self._get_store().put(self._key(digest, version), json.dumps(list(verdict)), self.max_entries)
+            self._count('stores')
+        except Exception as e:
+            self._count('errors')
+            logger.warning(f"Cache de verificação indisponível: {e}")
+
+    def clear(self):
+        """Remove todos os veredictos"""
+        self._get_store().clear()
+
+    def get_metrics(self):
+        """Acertos e faltas do processo atual e tamanho do armazenamento compartilhado"""
+        with self._lock:
+            metrics = dict(self._metrics)
+        lookups = metrics['hits'] + metrics['misses']
+        metrics['hit_ratio'] = metrics['hits'] / lookups if lookups else 0.0
+        metrics['max_entries'] = self.max_entries
+        try:
+            store = self._get_store()
+            metrics['backend'] = 'redis' if isinstance(store, RedisVerdictStore) else 'sqlite'
+            metrics['entries'] = store.count() if self.enabled else 0
+        except Exception:
+            metrics['backend'] = None
+            metrics['entries'] = None
+        return metrics
+
+
+# Instância global do cache de veredictos
+scan_verdict_cache = ScanVerdictCache()
@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""
+Motor de carimbo em processos separados
+Executa o trabalho de PDF (CPU-bound) em processos filhos, com limite GLOBAL de
+jobs simultâneos e de jobs em espera, compartilhado por todos os workers do
+gunicorn da máquina (semáforo por arquivos de lock), timeout real por job (o
+processo é morto e recriado), teto de memória por job e métricas de espera em
+fila x execução.
+
+A verificação de segurança de PDFs (pdf_scanner) usa outra instância da mesma
+classe, com limites e diretório de locks próprios (variáveis SCANNER_*).
+
+Com workers "sync" do gunicorn a requisição continua ocupando o worker web até
+o fim do job; o motor limita quantos carimbos disputam a CPU ao mesmo tempo e
+garante que um job travado seja encerrado antes do timeout do gunicorn.
+
+Configuração (variáveis de ambiente):
+    STAMPING_WORKERS:       jobs executando ao mesmo tempo na máquina (0 executa inline, sem pool)
+    STAMPING_MAX_QUEUE:     jobs aguardando vaga antes de responder 429
+    STAMPING_JOB_TIMEOUT:   tempo máximo de execução de um job, em segundos
+    STAMPING_QUEUE_TIMEOUT: tempo máximo aguardando vaga, em segundos
+    STAMPING_MEMORY_LIMIT_MB: RSS máximo do processo de um job (0 desativa); acima
+                            dele o processo é morto e recriado, sem derrubar o container
+    STAMPING_LOCK_DIR:      diretório dos arquivos de lock compartilhados
+
+STAMPING_QUEUE_TIMEOUT + STAMPING_JOB_TIMEOUT deve ficar abaixo do --timeout do
+gunicorn (120s), senão o worker web é morto antes do motor encerrar o job.
+"""
+
+import os
+import math
+import time
+import atexit
+import queue
+import logging
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import psutil
+except ImportError:  # pragma: no cover - sem psutil o teto de memória fica desativado
+    psutil = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+class StampingUnavailable(Exception):
+    """Carimbo não pôde ser executado agora; o cliente pode tentar novamente"""
+    status_code = 503
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class StampingQueueFull(StampingUnavailable):
+    """Fila do motor de carimbo cheia; o cliente deve tentar novamente"""
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__(f"Fila de processamento cheia; tente novamente em {retry_after}s", retry_after)
+
+
+class StampingTimeout(StampingUnavailable):
+    """Job excedeu o tempo limite e o processo foi encerrado"""
+    status_code = 504
+
+
+class StampingWorkerLost(StampingUnavailable):
+    """Processo do job morreu durante a execução (ex.: falta de memória)"""
+    status_code = 503
+
+
+class StampingMemoryExceeded(StampingUnavailable):
+    """Job excedeu o teto de memória e o processo foi encerrado"""
+    status_code = 413
+
+
+def peak_rss_mb():
+    """Pico de memória residente (MB) do processo atual
+
+    Função de nível de módulo (serializável) para consulta no processo do job.
+    Usa VmHWM do /proc quando existe: o ru_maxrss do Linux é herdado do
+    processo pai através do exec do spawn.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class FileSemaphore:
+    """Semáforo entre processos baseado em arquivos de lock
+
+    Cada vaga é um arquivo travado com lock exclusivo não bloqueante. O sistema
+    operacional libera o lock quando o descritor é fechado ou o processo morre,
+    então uma vaga nunca fica presa por um worker que caiu.
+    """
+
+    def __init__(self, lock_dir, name, size):
+        self.lock_dir = lock_dir
+        self.name = name
+        self.size = size
+
+    def _path(self, index):
+        return os.path.join(self.lock_dir, f"{self.name}-{index}.lock")
+
+    def _try_lock(self, index):
+        fd = os.open(self._path(index), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return fd
+        except OSError:
+            os.close(fd)
+            return None
+
+    def try_acquire(self):
+        """Tenta ocupar uma vaga sem bloquear; retorna o descritor ou None"""
+        os.makedirs(self.lock_dir, exist_ok=True)
+        for index in range(self.size):
+            fd = self._try_lock(index)
+            if fd is not None:
+                return fd
+        return None
+
+    def release(self, fd):
+        """Libera a vaga ocupada"""
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+    def count_held(self):
+        """Quantidade aproximada de vagas ocupadas (por qualquer processo)"""
+        if not os.path.isdir(self.lock_dir):
+            return 0
+        held = 0
+        for index in range(self.size):
+            fd = self._try_lock(index)
+            if fd is None:
+                held += 1
+            else:
+                self.release(fd)
+        return held
+
+
+class StampingEngine:
+    """Pool limitado de processos para carimbo de PDFs
+
+    O limite de execução/espera é global (FileSemaphore), não por worker web.
+    Dentro de cada worker web, cada slot é um ProcessPoolExecutor de um único
+    processo: um job que estoura o timeout tem o seu processo morto e recriado
+    sem afetar os jobs que estão rodando nos demais slots.
+    """
+
+    POLL_INTERVAL = 0.05
+    MEMORY_POLL_INTERVAL = 0.1
+
+    def __init__(self, max_workers=None, max_queue=None, job_timeout=None, queue_timeout=None, lock_dir=None,
+                 memory_limit_mb=None, initializer=None, initargs=()):
+        if max_workers is None:
+            max_workers = int(os.environ.get('STAMPING_WORKERS', str(min(2, os.cpu_count() or 1))))
+        if max_queue is None:
+            max_queue = int(os.environ.get('STAMPING_MAX_QUEUE', '8'))
+        if job_timeout is None:
+            job_timeout = float(os.environ.get('STAMPING_JOB_TIMEOUT', '45'))
+        if queue_timeout is None:
+            queue_timeout = float(os.environ.get('STAMPING_QUEUE_TIMEOUT', '30'))
+        if lock_dir is None:
+            lock_dir = os.environ.get('STAMPING_LOCK_DIR') or os.path.join(tempfile.gettempdir(), 'assinador_stamping')
+        if memory_limit_mb is None:
+            memory_limit_mb = float(os.environ.get('STAMPING_MEMORY_LIMIT_MB', '512'))
+        self.max_workers = max(0, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.job_timeout = job_timeout
+        self.queue_timeout = queue_timeout
+        self.lock_dir = lock_dir
+        self.memory_limit_mb = max(0, memory_limit_mb) if psutil is not None else 0
+        # Executado em cada processo filho ao iniciar (ex.: limites de recursos)
+        self.initializer = initializer
+        self.initargs = initargs
+
+        self._running_slots = FileSemaphore(lock_dir, 'running', self.max_workers)
+        self._waiting_slots = FileSemaphore(lock_dir, 'waiting', self.max_queue)
+
+        self._lock = threading.Lock()
+        self._slots = None  # Criados sob demanda (evita processos no import)
+        self._pending = 0
+        self._running = 0
+        self._metrics = {
+            'jobs_submitted': 0,
+            'jobs_completed': 0,
+            'jobs_failed': 0,
+            'jobs_rejected': 0,
+            'jobs_timed_out': 0,
+            'jobs_memory_exceeded': 0,
+            'workers_restarted': 0,
+            'queue_wait_seconds_total': 0.0,
+            'queue_wait_seconds_max': 0.0,
+            'exec_seconds_total': 0.0,
+            'exec_seconds_max': 0.0,
+            'job_rss_mb_max': 0.0,
+        }
+
+    def _new_slot(self):
+        # spawn: seguro com threads no processo web e compatível com Windows
+        return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=self.initializer, initargs=self.initargs)
+
+    def _ensure_slots(self):
+        with self._lock:
+            if self._slots is None:
+                self._slots = queue.Queue()
+                for _ in range(self.max_workers):
+                    self._slots.put(self._new_slot())
+            return self._slots
+
+    def prestart(self):
+        """Cria os slots e inicia seus processos antes do primeiro job"""
+        if self.max_workers == 0:
+            return
+        slots = self._ensure_slots()
+        started = []
+        for _ in range(self.max_workers):
+            try:
+                slot = slots.get_nowait()
+            except queue.Empty:
+                break
+            # O ProcessPoolExecutor só cria o processo no primeiro submit
+            slot.submit(os.getpid)
+            started.append(slot)
+        for slot in started:
+            slots.put(slot)
+
+    def _kill_slot(self, slot):
+        """Encerra à força o processo de um slot"""
+        # ProcessPoolExecutor não expõe kill por job; usa o mapa interno de processos
+        for process in list((getattr(slot, '_processes', None) or {}).values()):
+            try:
+                process.kill()
+                process.join(5)
+            except Exception:
+                pass
+        try:
+            slot.shutdown(wait=False, cancel_futures=True)
+        except Exception:
+            pass
+
+    def _retry_after(self):
+        """Estimativa (segundos) para o cliente tentar novamente"""
+        completed = self._metrics['jobs_completed']
+        avg_exec = self._metrics['exec_seconds_total'] / completed if completed else 5.0
+        waiting = self._waiting_slots.count_held() + 1
+        return max(1, int(math.ceil(avg_exec * waiting / max(1, self.max_workers))))
+
+    def _reject(self):
+        with self._lock:
+            self._metrics['jobs_rejected'] += 1
+        raise StampingQueueFull(self._retry_after())
+
+    def _record(self, outcome, queue_wait, exec_time):
+        with self._lock:
+            self._metrics[outcome] += 1
+            self._metrics['queue_wait_seconds_total'] += queue_wait
+            self._metrics['queue_wait_seconds_max'] = max(self._metrics['queue_wait_seconds_max'], queue_wait)
+            self._metrics['exec_seconds_total'] += exec_time
+            self._metrics['exec_seconds_max'] = max(self._metrics['exec_seconds_max'], exec_time)
+
+    def _acquire_run_slot(self):
+        """Ocupa uma vaga global de execução, aguardando em uma vaga de espera
+
+        Raises:
+            StampingQueueFull: sem vaga de espera ou espera maior que queue_timeout
+        """
+        run_slot = self._running_slots.try_acquire()
+        if run_slot is not None:
+            return run_slot
+
+        ticket = self._waiting_slots.try_acquire()
+        if ticket is None:
+            self._reject()
+        try:
+            deadline = time.monotonic() + self.queue_timeout
+            while True:
+                time.sleep(self.POLL_INTERVAL)
+                run_slot = self._running_slots.try_acquire()
+                if run_slot is not None:
+                    return run_slot
+                if time.monotonic() >= deadline:
+                    self._reject()
+        finally:
+            self._waiting_slots.release(ticket)
+
+    def run(self, func, *args, timeout=None, **kwargs):
+        """Executa func(*args, **kwargs) em um processo do pool e aguarda o resultado
+
+        Raises:
+            StampingQueueFull: se a fila estiver cheia (responder 429 com Retry-After)
+            StampingTimeout: se o job exceder o tempo limite (processo encerrado)
+            StampingWorkerLost: se o processo do job morrer durante a execução
+            StampingMemoryExceeded: se o processo do job passar de memory_limit_mb
+        """
+        timeout = timeout or self.job_timeout
+        with self._lock:
+            self._pending += 1
+            self._metrics['jobs_submitted'] += 1
+
+        enqueued_at = time.monotonic()
+        try:
+            if self.max_workers == 0:
+                return self._run_inline(func, args, kwargs)
+            run_slot = self._acquire_run_slot()
+            try:
+                return self._run_in_slot(func, args, kwargs, timeout, enqueued_at)
+            finally:
+                self._running_slots.release(run_slot)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _run_inline(self, func, args, kwargs):
+        """Modo inline (STAMPING_WORKERS=0): executa na própria thread"""
+        started_at = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self._record('jobs_failed', 0.0, time.monotonic() - started_at)
+            raise
+        self._record('jobs_completed', 0.0, time.monotonic() - started_at)
+        return result
+
+    def _run_in_slot(self, func, args, kwargs, timeout, enqueued_at):
+        """Executa o job no processo de um slot local livre"""
+        slots = self._ensure_slots()
+        slot = slots.get()
+        started_at = time.monotonic()
+        queue_wait = started_at - enqueued_at
+        with self._lock:
+            self._running += 1
+        try:
+            future = slot.submit(func, *args, **kwargs)
+            result = self._wait_result(future, slot, timeout)
+        except StampingMemoryExceeded:
+            slot = self._restart_slot(slot)
+            self._record('jobs_memory_exceeded', queue_wait, time.monotonic() - started_at)
+            logger.warning(f"Job de carimbo excedeu {self.memory_limit_mb:.0f} MB; processo encerrado e recriado")
+            raise
+        except FuturesTimeoutError:
+            slot = self._restart_slot(slot)
+            self._record('jobs_timed_out', queue_wait, time.monotonic() - started_at)
+            logger.warning(f"Job de carimbo excedeu {timeout}s; processo encerrado e recriado")
+            raise StampingTimeout(f"Processamento excedeu o limite de {timeout}s")
+        except BrokenProcessPool:
+            # Processo morreu (ex.: OOM); recria o slot
+            slot = self._restart_slot(slot)
+            self._record('jobs_failed', queue_wait, time.monotonic() - started_at)
+            raise StampingWorkerLost("Processo de carimbo encerrado inesperadamente", self._retry_after())
+        except Exception:
+            self._record('jobs_failed', queue_wait, time.monotonic() - started_at)
+            raise
+        finally:
+            with self._lock:
+                self._running -= 1
+            slots.put(slot)
+
+        self._record('jobs_completed', queue_wait, time.monotonic() - started_at)
+        return result
+
+    def _slot_rss_mb(self, slot):
+        """Memória residente (MB) do processo do slot"""
+        rss = 0
+        for process in list((getattr(slot, '_processes', None) or {}).values()):
+            try:
+                rss += psutil.Process(process.pid).memory_info().rss
+            except Exception:
+                pass
+        return rss / (1024 * 1024)
+
+    def _wait_result(self, future, slot, timeout):
+        """Aguarda o resultado do job, verificando o teto de memória do processo
+
+        Raises:
+            FuturesTimeoutError: job excedeu timeout
+            StampingMemoryExceeded: processo acima de memory_limit_mb
+        """
+        if not self.memory_limit_mb:
+            return future.result(timeout=timeout)
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise FuturesTimeoutError()
+            try:
+                return future.result(timeout=min(remaining, self.MEMORY_POLL_INTERVAL))
+            except FuturesTimeoutError:
+                rss = self._slot_rss_mb(slot)
+                with self._lock:
+                    self._metrics['job_rss_mb_max'] = max(self._metrics['job_rss_mb_max'], rss)
+                if rss > self.memory_limit_mb:
+                    raise StampingMemoryExceeded(
+                        f"Processamento excedeu o limite de memória de {self.memory_limit_mb:.0f} MB"
+                    )
+
+    def _restart_slot(self, slot):
+        """Mata o processo do slot e retorna um slot novo no lugar"""
+        self._kill_slot(slot)
+        with self._lock:
+            self._metrics['workers_restarted'] += 1
+        return self._new_slot()
+
+    def get_metrics(self):
+        """Retorna métricas do motor
+
+        Contadores e tempos são do processo (worker web) que respondeu; as
+        vagas ocupadas (global_running/global_waiting) valem para a máquina.
+        """
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['pending'] = self._pending
+            metrics['running'] = self._running
+        finished = (metrics['jobs_completed'] + metrics['jobs_failed'] + metrics['jobs_timed_out']
+                    + metrics['jobs_memory_exceeded'])
+        metrics['queue_wait_seconds_avg'] = metrics['queue_wait_seconds_total'] / finished if finished else 0.0
+        metrics['exec_seconds_avg'] = metrics['exec_seconds_total'] / finished if finished else 0.0
+        metrics['global_running'] = self._running_slots.count_held()
+        metrics['global_waiting'] = self._waiting_slots.count_held()
+        metrics['pid'] = os.getpid()
+        metrics['max_workers'] = self.max_workers
+        metrics['max_queue'] = self.max_queue
+        metrics['job_timeout'] = self.job_timeout
+        metrics['queue_timeout'] = self.queue_timeout
+        metrics['memory_limit_mb'] = self.memory_limit_mb
+        return metrics
+
+    def shutdown(self):
+        """Encerra todos os processos do pool"""
+        with self._lock:
+            slots, self._slots = self._slots, None
+        if slots is None:
+            return
+        while True:
+            try:
+                slots.get_nowait().shutdown(wait=False, cancel_futures=True)
+            except queue.Empty:
+                break
+            except Exception:
+                pass
+
+
+# Instância global do motor de carimbo
+stamping_engine = StampingEngine()
+atexit.register(stamping_engine.shutdown)
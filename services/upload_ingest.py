@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Recebimento concorrente dos PDFs enviados em lote
+Cada arquivo é gravado (com o SHA-256 calculado durante a gravação), tem o
+cabeçalho conferido e passa pela verificação de segurança com análise
+(pdf_scanner.analyze_pdf_upload) em um pool de threads limitado. A verificação
+em si roda no pool de processos do scanner; as threads apenas aguardam, de modo
+que o tempo do lote fica próximo ao do arquivo mais lento e não à soma.
+
+UPLOAD_INGEST_WORKERS não deve passar de SCANNER_WORKERS + SCANNER_MAX_QUEUE,
+senão os arquivos excedentes são recusados com "Servidor ocupado".
+
+No modo assíncrono (UPLOAD_ASYNC_INGEST=true) a requisição apenas grava os
+arquivos (receive) e cria os registros no estado 'ingesting'; a verificação e a
+análise são enviadas ao mesmo pool (submit) e o andamento é consultado pelos
+registros no banco.
+
+StreamingUploadRequest (request_class da aplicação) grava os PDFs enviados
+direto no disco enquanto o multipart é lido, calculando SHA-256, tamanho e o
+cabeçalho %PDF na mesma passada (HashingUploadFile); receive apenas renomeia o
+arquivo, sem copiá-lo nem relê-lo.
+
+Configuração (variáveis de ambiente):
+    UPLOAD_INGEST_WORKERS:       arquivos processados ao mesmo tempo por processo (padrão: 4)
+    UPLOAD_ASYNC_INGEST:         responde ao envio antes da verificação (padrão: false)
+    UPLOAD_INGEST_STALE_SECONDS: registros em 'ingesting' há mais tempo que isso são
+                                 dados como interrompidos (reinício do worker) (padrão: 900)
+"""
+
+import os
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK_SIZE = 1024 * 1024
+ASYNC_INGEST = os.environ.get('UPLOAD_ASYNC_INGEST', 'false').lower() == 'true'
+STALE_SECONDS = int(os.environ.get('UPLOAD_INGEST_STALE_SECONDS', '900'))
+
+
+PDF_HEADER = b'%PDF'
+
+
+class HashingUploadFile:
+    """Destino de um arquivo do multipart: grava em disco calculando SHA-256 e
+    tamanho e conferindo o cabeçalho %PDF enquanto os bytes chegam
+
+    Conteúdo que não começa com %PDF deixa de ser gravado logo nos primeiros
+    bytes (header_ok False); acima de max_bytes a leitura é interrompida com
+    413. O arquivo temporário é removido ao fechar, salvo se tiver sido
+    movido para o destino final por claim.
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        fd, self.name = tempfile.mkstemp(prefix='upload_', suffix='.part', dir=directory)
+        self._file = os.fdopen(fd, 'w+b')
+        self._digest = hashlib.sha256()
+        self._head = b''
+        self.size = 0
+        self.max_bytes = max_bytes
+        self.header_ok = None
+        self._claimed = False
+        self._sha256 = None
+        self.keep = False
+
+    @classmethod
+    def _reopen(cls, path, max_bytes=None):
+        upload = cls.__new__(cls)
+        upload.name = path
+        upload._file = open(path, 'r+b')
+        upload._digest = hashlib.sha256()
+        upload._head = b''
+        upload.size = 0
+        upload.max_bytes = max_bytes
+        upload.header_ok = None
+        upload._claimed = False
+        upload._sha256 = None
+        upload.keep = True
+        return upload
+
+    @classmethod
+    def resume(cls, path, max_bytes=None):
+        """Reabre um arquivo gravado em partes (upload retomável)
+
+        O hash, o tamanho e o cabeçalho são recalculados a partir do que já
+        está no disco; o arquivo não é removido ao fechar.
+        """
+        upload = cls._reopen(path, max_bytes)
+        while chunk := upload._file.read(COPY_CHUNK_SIZE):
+            upload._track(chunk)
+        return upload
+
+    @classmethod
+    def finished(cls, path, sha256, header_ok):
+        """Reabre um upload retomável concluído, com o SHA-256 calculado enquanto as partes chegavam
+
+        O arquivo não é relido; não aceita mais gravações.
+        """
+        upload = cls._reopen(path)
+        upload.size = os.fstat(upload._file.fileno()).st_size
+        upload.header_ok = header_ok
+        upload._sha256 = sha256
+        return upload
+
+    def _track(self, data):
+        """Atualiza tamanho, cabeçalho e hash; False se o conteúdo deve ser descartado"""
+        self.size += len(data)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise RequestEntityTooLarge(f'Arquivo excede o limite de {self.max_bytes // (1024 * 1024)} MB')
+        if self.header_ok is None:
+            self._head += bytes(data[:len(PDF_HEADER) - len(self._head)])
+            if len(self._head) == len(PDF_HEADER):
+                self.header_ok = self._head == PDF_HEADER
+        if self.header_ok is False:
+            return False
+        self._digest.update(data)
+        return True
+
+    def write(self, data):
+        if self._sha256 is not None:
+            raise ValueError('Upload concluído não aceita gravações')
+        if not self._track(data):
+            return len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._sha256 or self._digest.hexdigest()
+
+    def claim(self, path):
+        """Move o arquivo gravado para path
+
+        Returns:
+            (sha256 hex, tamanho em bytes)
+        """
+        self._file.close()
+        shutil.move(self.name, path)
+        self._claimed = True
+        return self.hexdigest(), self.size
+
+    def read(self, *args):
+        return self._file.read(*args)
+
+    def readline(self, *args):
+        return self._file.readline(*args)
+
+    def seek(self, *args):
+        return self._file.seek(*args)
+
+    def tell(self):
+        return self._file.tell()
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def flush(self):
+        if not self._file.closed:
+            self._file.flush()
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def close(self):
+        self._file.close()
+        if not self._claimed and not self.keep:
+            _remove(self.name)
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class StreamingUploadRequest(Request):
+    """Request que grava os arquivos .pdf do multipart com HashingUploadFile
+
+    Usa o diretório UPLOAD_TEMP_DIR e o limite MAX_CONTENT_LENGTH (por
+    arquivo) da configuração da aplicação; os demais arquivos seguem o
+    comportamento padrão do Werkzeug.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if filename and filename.lower().endswith('.pdf'):
+            config = current_app.config
+            return HashingUploadFile(config.get('UPLOAD_TEMP_DIR'), config.get('MAX_CONTENT_LENGTH'))
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+
+def save_upload(file_storage, path):
+    """Grava o upload em path calculando o SHA-256 e o tamanho na mesma passada
+
+    Returns:
+        (sha256 hex, tamanho em bytes)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    stream = file_storage.stream
+    with open(path, 'wb') as output:
+        while chunk := stream.read(COPY_CHUNK_SIZE):
+            digest.update(chunk)
+            output.write(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class UploadIngestor:
+    """Grava e verifica os arquivos de um envio em paralelo (pool de threads limitado)"""
+
+    def __init__(self, max_workers=None, analyze_func=None):
+        if max_workers is None:
+            max_workers = int(os.environ.get('UPLOAD_INGEST_WORKERS', '4'))
+        self.max_workers = max(1, max_workers)
+        self._analyze_func = analyze_func
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='upload-ingest')
+            return self._executor
+
+    def _analyze(self, path, digest):
+        if self._analyze_func is not None:
+            return self._analyze_func(path, digest=digest)
+        from pdf_scanner import analyze_pdf_upload
+        return analyze_pdf_upload(path, digest=digest)
+
+    def receive(self, file_storage, filename, file_id, temp_path):
+        """Confere o cabeçalho e grava um arquivo, sem verificá-lo
+
+        Returns:
+            dict: filename, file_id, temp_path, ok, message, sha256, size,
+                  analysis (None até a verificação) e seconds
+        """
+        started = time.perf_counter()
+        result = {
+            'filename': filename, 'file_id': file_id, 'temp_path': temp_path,
+            'ok': False, 'message': '', 'sha256': None, 'size': 0, 'analysis': None
+        }
+        try:
+            stream = file_storage.stream
+            if isinstance(stream, HashingUploadFile):
+                # Já gravado, com hash e cabeçalho conferidos durante a leitura do multipart
+                header_ok = stream.header_ok
+            else:
+                header_ok = stream.read(len(PDF_HEADER)) == PDF_HEADER
+                stream.seek(0)
+            if not header_ok:
+                result['message'] = 'Arquivo inválido (não é PDF)'
+            else:
+                if isinstance(stream, HashingUploadFile):
+                    result['sha256'], result['size'] = stream.claim(temp_path)
+                else:
+                    result['sha256'], result['size'] = save_upload(file_storage, temp_path)
+                result['ok'] = True
+        except Exception as e:
+            logger.warning(f"Falha ao receber {filename}: {e}")
+            result['message'] = f'Falha ao ler o arquivo: {e}'
+        if not result['ok']:
+            _remove(temp_path)
+        result['seconds'] = time.perf_counter() - started
+        return result
+
+    def analyze(self, temp_path, digest=None):
+        """Verificação de segurança e análise de um arquivo já gravado; remove-o se for rejeitado
+
+        Returns:
+            (ok, mensagem, análise)
+        """
+        try:
+            ok, message, analysis = self._analyze(temp_path, digest)
+        except Exception as e:
+            logger.warning(f"Falha ao verificar {temp_path}: {e}")
+            ok, message, analysis = False, f'Falha ao processar PDF: {e}', None
+        if not ok:
+            _remove(temp_path)
+        return ok, message, analysis
+
+    def ingest_one(self, file_storage, filename, file_id, temp_path):
+        """Grava, confere o cabeçalho e verifica um arquivo; remove-o se for rejeitado
+
+        Returns:
+            dict: ver receive, com ok, message e analysis da verificação
+        """
+        result = self.receive(file_storage, filename, file_id, temp_path)
+        if result['ok']:
+            started = time.perf_counter()
+            result['ok'], result['message'], result['analysis'] = self.analyze(temp_path, result['sha256'])
+            result['seconds'] += time.perf_counter() - started
+        return result
+
+    def submit(self, func, *args):
+        """Executa func(*args) em segundo plano no pool do recebimento (modo assíncrono)"""
+        return self._get_executor().submit(func, *args)
+
+    def ingest(self, items):
+        """Processa [(file_storage, nome, file_id, caminho)] em paralelo
+
+        Returns:
+            list[dict] (ver ingest_one) na mesma ordem dos arquivos enviados
+        """
+        if len(items) <= 1:
+            return [self.ingest_one(*item) for item in items]
+        executor = self._get_executor()
+        futures = [executor.submit(self.ingest_one, *item) for item in items]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+# Instância global do recebimento de uploads
+upload_ingestor = UploadIngestor()
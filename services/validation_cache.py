@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Cache em memória dos resultados de PDFValidator.validate_pdf
+O mesmo documento costuma ser validado várias vezes em poucos segundos
+(QR code do comprovante, /validate/<file_id>, reenvios). O resultado é
+guardado pela chave (SHA-256 do arquivo, id do registro de assinatura, versão
+do registro, impressão digital do certificado): uma nova validação custa o
+hash do arquivo e uma consulta ao dicionário.
+
+A versão do registro é derivada dos campos usados na verificação, de modo que
+uma alteração feita por qualquer worker muda a chave; além disso, a aplicação
+descarta as entradas do registro alterado ou removido (invalidate) e cada
+entrada expira após VALIDATION_CACHE_TTL_SECONDS, o que limita o tempo em que
+a troca da chave pública legacy passa despercebida.
+
+Configuração (variáveis de ambiente):
+    VALIDATION_CACHE_TTL_SECONDS: validade de cada resultado (padrão: 300)
+    VALIDATION_CACHE_MAX_ENTRIES: resultados mantidos por processo (LRU); 0 desativa (padrão: 1000)
+"""
+
+import os
+import copy
+import time
+import threading
+from collections import OrderedDict
+
+
+class ValidationResultCache:
+    """Resultados de validação por (hash, registro, versão do registro, certificado), com TTL e LRU"""
+
+    def __init__(self, ttl_seconds=None, max_entries=None):
+        if ttl_seconds is None:
+            ttl_seconds = float(os.environ.get('VALIDATION_CACHE_TTL_SECONDS', '300'))
+        if max_entries is None:
+            max_entries = int(os.environ.get('VALIDATION_CACHE_MAX_ENTRIES', '1000'))
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(0, max_entries)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {'hits': 0, 'misses': 0, 'stores': 0, 'expired': 0, 'invalidated': 0}
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def get(self, key):
+        """Cópia do resultado guardado, ou None (ausente ou expirado)"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._metrics['misses'] += 1
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                self._metrics['expired'] += 1
+                self._metrics['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._metrics['hits'] += 1
+            result = entry[1]
+        # Cópia: quem chama acrescenta campos ao resultado (file_id, filename)
+        return copy.deepcopy(result)
+
+    def put(self, key, result):
+        """Guarda uma cópia do resultado e descarta os menos usados acima de max_entries"""
+        if not self.enabled:
+            return
+        entry = (time.monotonic() + self.ttl_seconds, copy.deepcopy(result))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._metrics['stores'] += 1
+
+    def invalidate(self, signature_id):
+        """Descarta os resultados do registro de assinatura informado (chave[1])
+
+        Returns:
+            int: entradas removidas
+        """
+        with self._lock:
+            keys = [key for key in self._entries if key[1] == signature_id]
+            for key in keys:
+                del self._entries[key]
+            self._metrics['invalidated'] += len(keys)
+        return len(keys)
+
+    def clear(self):
+        """Remove todos os resultados"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_metrics(self):
+        """Acertos, faltas, expirações e invalidações do processo atual"""
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['entries'] = len(self._entries)
+        lookups = metrics['hits'] + metrics['misses']
+        metrics['hit_ratio'] = metrics['hits'] / lookups if lookups else 0.0
+        metrics['max_entries'] = self.max_entries
+        metrics['ttl_seconds'] = self.ttl_seconds
+        return metrics
+
+
+# Instância global do cache de resultados de validação
+validation_cache = ValidationResultCache()
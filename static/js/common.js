@@ -175,9 +175,111 @@ function startAutoRefresh() {
     }, 30000);
 }
 
+// Andamento da verificação dos uploads em segundo plano (lista de pendentes)
+function pollIngestStatus() {
+    const badges = Array.from(document.querySelectorAll('[data-ingesting-id]'));
+    if (badges.length === 0) return;
+    
+    const ids = badges.map(badge => badge.getAttribute('data-ingesting-id'));
+    const timer = setInterval(function() {
+        if (document.visibilityState !== 'visible') return;
+        fetch('/internal/signature/status?ids=' + encodeURIComponent(ids.join(',')), {credentials: 'same-origin'})
+            .then(response => response.json())
+            .then(function(data) {
+                if (!data.success) return;
+                if (data.ingesting === 0) {
+                    clearInterval(timer);
+                    location.reload();
+                    return;
+                }
+                const done = data.signatures.length - data.ingesting;
+                badges.forEach(function(badge) {
+                    badge.title = `${done} de ${data.signatures.length} verificado(s)`;
+                });
+            })
+            .catch(function(err) {
+                if (isDebugMode) {
+                    console.error('Erro ao consultar andamento: ', err);
+                }
+            });
+    }, 3000);
+}
+
+// Envio retomável em partes (PDFs grandes em redes instáveis): cria o upload,
+// envia partes de RESUMABLE_CHUNK_SIZE e, após falha de rede, consulta o
+// deslocamento no servidor e continua dali. O endereço do upload fica no
+// localStorage para continuar também após recarregar a página.
+const RESUMABLE_CHUNK_SIZE = 1024 * 1024;
+const RESUMABLE_MAX_RETRIES = 8;
+
+function uploadResumable(file, onProgress) {
+    const csrf = document.querySelector('meta[name="csrf-token"]').getAttribute('content');
+    const storageKey = `resumable:${file.name}:${file.size}:${file.lastModified}`;
+    const headers = extra => Object.assign({'Tus-Resumable': '1.0.0', 'X-CSRFToken': csrf}, extra);
+    const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+
+    async function create() {
+        const name = btoa(unescape(encodeURIComponent(file.name)));
+        const response = await fetch('/internal/uploads', {
+            method: 'POST', credentials: 'same-origin',
+            headers: headers({'Upload-Length': String(file.size), 'Upload-Metadata': `filename ${name}`})
+        });
+        const data = await response.json();
+        if (!response.ok) throw new Error(data.error || 'Falha ao iniciar o envio');
+        localStorage.setItem(storageKey, response.headers.get('Location'));
+        return response.headers.get('Location');
+    }
+
+    async function currentOffset(location) {
+        const response = await fetch(location, {method: 'HEAD', credentials: 'same-origin', headers: headers({})});
+        if (response.status === 404) return null;
+        if (!response.ok) throw new Error('Falha ao consultar o envio');
+        return parseInt(response.headers.get('Upload-Offset'), 10);
+    }
+
+    return (async function() {
+        let location = localStorage.getItem(storageKey);
+        let offset = location ? await currentOffset(location).catch(() => null) : null;
+        if (offset === null) {
+            location = await create();
+            offset = 0;
+        }
+        let retries = 0;
+        while (offset < file.size) {
+            try {
+                const response = await fetch(location, {
+                    method: 'PATCH', credentials: 'same-origin',
+                    headers: headers({'Upload-Offset': String(offset), 'Content-Type': 'application/offset+octet-stream'}),
+                    body: file.slice(offset, offset + RESUMABLE_CHUNK_SIZE)
+                });
+                if (response.status === 409 || response.status === 423) {
+                    offset = await currentOffset(location);
+                    continue;
+                }
+                if (!response.ok) {
+                    const data = await response.json().catch(() => ({}));
+                    localStorage.removeItem(storageKey);
+                    throw Object.assign(new Error(data.error || 'Envio recusado'), {fatal: true});
+                }
+                offset = parseInt(response.headers.get('Upload-Offset'), 10);
+                retries = 0;
+                if (onProgress) onProgress(offset, file.size);
+            } catch (err) {
+                if (err.fatal || ++retries > RESUMABLE_MAX_RETRIES) throw err;
+                await sleep(Math.min(30000, 1000 * 2 ** retries));
+                offset = await currentOffset(location).catch(() => offset);
+                if (offset === null) throw err;
+            }
+        }
+        localStorage.removeItem(storageKey);
+        return location.split('/').pop();
+    })();
+}
+
 // Event listeners para botões com data-attributes
 document.addEventListener('DOMContentLoaded', function() {
     startAutoRefresh();
+    pollIngestStatus();
     
     // Event listener para formulários com confirmação
     document.addEventListener('submit', function(e) {
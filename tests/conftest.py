@@ -0,0 +1,89 @@
+"""
+Fixtures compartilhadas pelos testes
+"""
+
+import time
+import threading
+
+import pytest
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4, landscape
+
+from services.stamping_engine import StampingEngine
+
+
+class ConcurrencyProbe:
+    """Funções de teste que registram o pico de chamadas simultâneas (peak)"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.peak = 0
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def wrap(self, result):
+        """Função que aceita quaisquer argumentos, espera delay segundos e devolve result"""
+        def func(*args, **kwargs):
+            with self._lock:
+                self._active += 1
+                self.peak = max(self.peak, self._active)
+            time.sleep(self.delay)
+            with self._lock:
+                self._active -= 1
+            return result
+
+        return func
+
+
+@pytest.fixture
+def concurrency_probe():
+    return ConcurrencyProbe()
+
+
+@pytest.fixture
+def make_engine(tmp_path):
+    """Cria motores de carimbo com lock_dir em tmp_path e os encerra ao fim do teste
+
+    create: StampingEngine ou uma fábrica equivalente (pdf_scanner.create_scanner_engine)
+    """
+    engines = []
+
+    def factory(create=StampingEngine, **kwargs):
+        kwargs.setdefault('lock_dir', str(tmp_path / 'locks'))
+        engine = create(**kwargs)
+        engines.append(engine)
+        return engine
+
+    yield factory
+    for engine in engines:
+        engine.shutdown()
+
+
+def _wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.fixture
+def wait_until():
+    """Espera condition() ficar verdadeira (até timeout segundos); devolve se ficou"""
+    return _wait_until
+
+
+def _write_pdf(path, num_pages=3):
+    c = canvas.Canvas(str(path), pagesize=A4)
+    for i in range(num_pages):
+        c.setPageSize(landscape(A4) if i % 2 else A4)
+        c.drawString(72, 720, f"Página {i + 1}")
+        c.showPage()
+    c.save()
+
+
+@pytest.fixture
+def make_pdf():
+    """Grava um PDF com num_pages páginas "Página N", alternando A4 retrato e paisagem"""
+    return _write_pdf
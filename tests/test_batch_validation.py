@@ -0,0 +1,272 @@
+"""
+Testes da validação em lote (services/batch_validation.py, POST /validate/batch)
+"""
+
+import io
+import sys
+import json
+import hashlib
+import zipfile
+import threading
+
+import pytest
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+from sqlalchemy import event
+
+from services import scan_cache
+from services.scan_cache import ScanVerdictCache
+from services.batch_validation import BatchValidator, BatchValidationError
+from services.certificate_manager import CertificateManager
+from services.upload_ingest import UploadIngestor
+from utils.key_cache import KeyMaterialCache
+
+
+def pdf_bytes(text='Documento arquivado'):
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    c.drawString(72, 720, text)
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def zip_bytes(files, compression=zipfile.ZIP_DEFLATED):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression) as archive:
+        for name, data in files:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+@pytest.fixture(autouse=True)
+def verdict_cache(tmp_path, monkeypatch):
+    cache = ScanVerdictCache(url=str(tmp_path / 'scan_cache.sqlite3'), max_entries=100)
+    monkeypatch.setattr(scan_cache, 'scan_verdict_cache', cache)
+    return cache
+
+
+def test_results_stream_as_files_finish(tmp_path):
+    release = threading.Event()
+
+    def validate(path, record, digest=None):
+        # O primeiro arquivo só termina depois que os demais já foram entregues
+        if open(path, 'rb').read().endswith(b'lento'):
+            release.wait(5)
+        return {'valid': True, 'current_hash': digest}
+
+    validator = BatchValidator(max_workers=3, scan_func=lambda path, digest=None: (True, 'ok'),
+                               validate_func=validate)
+    items = []
+    for index, data in enumerate([b'%PDF-lento', b'%PDF-a', b'%PDF-b']):
+        path = tmp_path / f'{index}.pdf'
+        path.write_bytes(data)
+        items.append({'index': index, 'filename': path.name, 'temp_path': str(path), 'ok': True,
+                      'message': '', 'sha256': hashlib.sha256(data).hexdigest(), 'size': len(data)})
+
+    order = []
+    for result in validator.run(items, {}):
+        order.append(result['index'])
+        if len(order) == 2:
+            release.set()
+
+    assert order[-1] == 0 and sorted(order) == [0, 1, 2]
+    assert list(tmp_path.glob('*.pdf')) == []
+
+
+def test_concurrency_is_bounded(concurrency_probe):
+    validator = BatchValidator(max_workers=2, scan_func=concurrency_probe.wrap((True, 'ok')),
+                               validate_func=lambda *a, **k: {'valid': True})
+    items = [{'index': i, 'filename': f'{i}.pdf', 'temp_path': None, 'ok': True, 'message': '',
+              'sha256': str(i), 'size': 0} for i in range(6)]
+
+    assert len(list(validator.run(items, {}))) == 6
+    assert concurrency_probe.peak == 2
+
+
+def test_archive_limits(tmp_path):
+    validator = BatchValidator(max_files=2, max_bytes=1024 * 1024)
+    ingestor = UploadIngestor(max_workers=1)
+
+    with pytest.raises(BatchValidationError) as error:
+        validator.receive_archive(io.BytesIO(zip_bytes([(f'{i}.pdf', b'%PDF') for i in range(3)])),
+                                  str(tmp_path), ingestor)
+    assert error.value.status_code == 413
+    # Conteúdo declarado acima do limite do lote, ainda que compacte bem
+    with pytest.raises(BatchValidationError) as error:
+        validator.receive_archive(io.BytesIO(zip_bytes([('a.pdf', b'%PDF' + b'\0' * 2 * 1024 * 1024)])),
+                                  str(tmp_path), ingestor)
+    assert error.value.status_code == 413
+    with pytest.raises(BatchValidationError) as error:
+        validator.receive_archive(io.BytesIO(b'nao e zip'), str(tmp_path), ingestor)
+    assert error.value.status_code == 400
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.fixture
+def make_client(tmp_path, monkeypatch):
+    """Aplicação de teste com um usuário logado, o certificado em tmp_path e um documento assinado"""
+    import app as app_module
+    from config import config
+    from models import User, Signature
+
+    manager = CertificateManager(certs_dir=str(tmp_path / 'certificates'), key_cache=KeyMaterialCache())
+    monkeypatch.setattr(sys.modules['services.certificate_manager'], 'certificate_manager', manager)
+    # 'simple' não existe mais nas versões recentes do Flask-Caching
+    monkeypatch.setattr(config['testing'], 'CACHE_TYPE', 'SimpleCache')
+    temp_dir = tmp_path / 'temp'
+    temp_dir.mkdir()
+    monkeypatch.setattr(app_module, 'TEMP_DIR', str(temp_dir))
+    apps = []
+
+    def factory(csrf=False):
+        monkeypatch.setattr(config['testing'], 'WTF_CSRF_ENABLED', csrf)
+        flask_app = app_module.create_app('testing')
+        flask_app.secret_key = 'teste'
+        flask_app.config['UPLOAD_TEMP_DIR'] = str(temp_dir)
+        signed = pdf_bytes('Contrato assinado')
+        info = manager.sign_pdf_digest(hashlib.sha256(signed).hexdigest())
+        with flask_app.app_context():
+            app_module.db.create_all()
+            user = User(username='arquivo', email='arquivo@exemplo.com', full_name='Arquivo')
+            app_module.db.session.add(user)
+            app_module.db.session.flush()
+            app_module.db.session.add(Signature(
+                user_id=user.id, file_id='doc-1', original_filename='contrato.pdf', status='completed',
+                signature_hash=info['hash'], signature_algorithm=info['signature_format'],
+                signature_data=info['signature_data']))
+            app_module.db.session.commit()
+            user_id = user.id
+        apps.append(flask_app)
+        client = flask_app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = user_id
+            session['_fresh'] = True
+        client.flask_app = flask_app
+        client.signed = signed
+        client.temp_dir = temp_dir
+        return client
+
+    yield factory
+    for flask_app in apps:
+        with flask_app.app_context():
+            app_module.db.drop_all()
+
+
+@pytest.fixture
+def client(make_client):
+    return make_client()
+
+
+def count_signature_queries(flask_app):
+    import app as app_module
+
+    with flask_app.app_context():
+        engine = app_module.db.engine
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        if 'FROM signatures' in statement:
+            statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    return statements
+
+
+def test_batch_validates_many_files_with_one_lookup(client):
+    queries = count_signature_queries(client.flask_app)
+    response = client.post('/validate/batch', content_type='multipart/form-data', data={
+        'pdf_files': [(io.BytesIO(client.signed), 'contrato.pdf'),
+                      (io.BytesIO(pdf_bytes('Sem registro')), 'avulso.pdf'),
+                      (io.BytesIO(b'MZ executavel'), 'falso.pdf'),
+                      (io.BytesIO(b'texto'), 'notas.txt')],
+    })
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = ndjson(response)
+    summary = lines.pop()
+    results = {line['filename']: line for line in lines}
+    assert summary == {'done': True, 'total': 4, 'valid': 1, 'invalid': 1, 'errors': 2}
+    assert results['contrato.pdf']['valid'] is True and results['contrato.pdf']['file_id'] == 'doc-1'
+    assert results['contrato.pdf']['certificate_signature_valid'] is True
+    assert results['avulso.pdf']['valid'] is False and results['avulso.pdf']['file_id'] is None
+    assert 'error' in results['falso.pdf'] and 'error' in results['notas.txt']
+    assert sorted(line['index'] for line in lines) == [0, 1, 2, 3]
+    assert len([q for q in queries if ' IN ' in q]) == 1
+    assert list(client.temp_dir.iterdir()) == []
+
+
+def test_batch_accepts_zip_body_and_field(client):
+    archive = zip_bytes([('2023/contrato.pdf', client.signed), ('2023/', b''), ('leia-me.txt', b'x')])
+
+    body = ndjson(client.post('/validate/batch', data=archive, content_type='application/zip'))
+    field = ndjson(client.post('/validate/batch', content_type='multipart/form-data', data={
+        'archive': [(io.BytesIO(archive), 'lote.zip')]}))
+
+    for lines in (body, field):
+        assert lines[-1]['total'] == 1 and lines[-1]['valid'] == 1
+        assert lines[0]['filename'] == '2023/contrato.pdf' and lines[0]['file_id'] == 'doc-1'
+    assert list(client.temp_dir.iterdir()) == []
+
+
+def test_batch_requires_files(client):
+    response = client.post('/validate/batch', content_type='multipart/form-data', data={})
+    assert response.status_code == 400
+
+
+def test_zip_entry_with_bad_crc_is_reported(client):
+    corrupt = bytearray(pdf_bytes('Outro contrato'))
+    archive = bytearray(zip_bytes([('contrato.pdf', client.signed), ('corrompido.pdf', bytes(corrupt))],
+                                  zipfile.ZIP_STORED))
+    # Altera um byte dos dados armazenados (sem compressão) do último PDF do .zip
+    position = archive.rindex(bytes(corrupt[200:232]))
+    archive[position] ^= 0xFF
+
+    lines = ndjson(client.post('/validate/batch', data=bytes(archive), content_type='application/zip'))
+    results = {line['filename']: line for line in lines[:-1]}
+
+    assert lines[-1] == {'done': True, 'total': 2, 'valid': 1, 'invalid': 0, 'errors': 1}
+    assert results['contrato.pdf']['valid'] is True
+    assert 'CRC' in results['corrompido.pdf']['error']
+    assert list(client.temp_dir.iterdir()) == []
+
+
+def large_pdf(size_mb):
+    """PDF válido aumentado com um comentário antes da tabela xref"""
+    data = pdf_bytes('Anexo')
+    startxref = data.rindex(b'startxref')
+    filler = b'%' + b'x' * (size_mb * 1024 * 1024) + b'\n'
+    xref = int(data[startxref:].split()[1])
+    tail = data[xref:startxref] + b'startxref\n%d\n%%%%EOF\n' % (xref + len(filler))
+    return data[:xref] + filler + tail
+
+
+def test_batch_limit_applies_before_csrf_check(make_client):
+    from flask import session
+    from flask_wtf.csrf import generate_csrf
+
+    client = make_client(csrf=True)
+    with client.flask_app.test_request_context():
+        token = generate_csrf()
+        raw_token = session['csrf_token']
+    with client.session_transaction() as client_session:
+        client_session['csrf_token'] = raw_token
+    files = [large_pdf(7) for _ in range(3)]
+    assert sum(len(data) for data in files) > 20 * 1024 * 1024
+
+    def post(url, headers):
+        return client.post(url, headers=headers, content_type='multipart/form-data', data={
+            'pdf_files': [(io.BytesIO(data), f'anexo_{i}.pdf') for i, data in enumerate(files)]})
+
+    assert post('/validate/batch', {}).status_code == 400
+    response = post('/validate/batch', {'X-CSRFToken': token})
+    assert response.status_code == 200
+    assert ndjson(response)[-1]['total'] == 3
+    # Demais rotas continuam limitadas a MAX_CONTENT_LENGTH
+    assert post('/validate', {'X-CSRFToken': token}).status_code == 413
+    assert list(client.temp_dir.iterdir()) == []
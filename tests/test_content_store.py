@@ -0,0 +1,141 @@
+"""
+Testes do armazenamento dos originais por conteúdo (services/content_store.py)
+"""
+
+import io
+import os
+import hashlib
+
+import pytest
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+
+from services import scan_cache
+from services.scan_cache import ScanVerdictCache
+from services.content_store import ContentStore
+
+
+def pdf_bytes(text='Modelo de contrato'):
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    c.drawString(72, 720, text)
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path), hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture(autouse=True)
+def verdict_cache(tmp_path, monkeypatch):
+    cache = ScanVerdictCache(url=str(tmp_path / 'scan_cache.sqlite3'), max_entries=100)
+    monkeypatch.setattr(scan_cache, 'scan_verdict_cache', cache)
+    return cache
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ContentStore(directory=str(tmp_path / 'originais'), grace_seconds=0)
+
+
+def test_identical_uploads_share_one_blob(tmp_path, store):
+    data = pdf_bytes()
+    first = store.store(*write(tmp_path / 'a.pdf', data))
+    second = store.store(*write(tmp_path / 'b.pdf', data))
+    other = store.store(*write(tmp_path / 'c.pdf', pdf_bytes('Outro')))
+
+    assert first == second != other
+    assert store.contains(first) and not store.contains(str(tmp_path / 'a.pdf'))
+    assert not (tmp_path / 'a.pdf').exists() and not (tmp_path / 'b.pdf').exists()
+    usage = store.usage({first: 2, other: 1})
+    assert (usage['blobs'], usage['references'], usage['deduplicated']) == (2, 3, 1)
+    assert usage['saved_bytes'] == len(data)
+    assert usage['logical_bytes'] == usage['stored_bytes'] + len(data)
+
+
+def test_collect_keeps_referenced_and_recent_blobs(tmp_path, store):
+    kept = store.store(*write(tmp_path / 'a.pdf', pdf_bytes('A')))
+    orphan = store.store(*write(tmp_path / 'b.pdf', pdf_bytes('B')))
+    recent = store.store(*write(tmp_path / 'c.pdf', pdf_bytes('C')))
+    os.utime(kept, (0, 0))
+    os.utime(orphan, (0, 0))
+
+    removed, freed = store.collect([kept], grace_seconds=60)
+
+    assert removed == 1 and freed > 0
+    assert os.path.exists(kept) and os.path.exists(recent) and not os.path.exists(orphan)
+
+
+def test_invalid_digest_is_refused(tmp_path, store):
+    with pytest.raises(ValueError):
+        store.store(str(tmp_path / 'a.pdf'), '../../etc')
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, store):
+    """Aplicação de teste com um usuário logado e os originais em tmp_path"""
+    import app as app_module
+    from config import config
+    from models import User, DocumentType
+
+    # 'simple' não existe mais nas versões recentes do Flask-Caching
+    monkeypatch.setattr(config['testing'], 'CACHE_TYPE', 'SimpleCache')
+    monkeypatch.setattr(app_module, 'UPLOAD_ASYNC_INGEST', False)
+    monkeypatch.setattr(app_module, 'TEMP_DIR', str(tmp_path))
+    monkeypatch.setattr(app_module, 'content_store', store)
+    flask_app = app_module.create_app('testing')
+    flask_app.secret_key = 'teste'
+    with flask_app.app_context():
+        app_module.db.create_all()
+        user = User(username='interno', email='interno@exemplo.com', full_name='Interno')
+        document_type = DocumentType(name='Contrato')
+        app_module.db.session.add_all([user, document_type])
+        app_module.db.session.commit()
+        ids = user.id, document_type.id
+    client = flask_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = ids[0]
+        session['_fresh'] = True
+    client.document_type_id = ids[1]
+    client.flask_app = flask_app
+    yield client
+    with flask_app.app_context():
+        app_module.db.drop_all()
+
+
+def test_same_template_for_many_clients_is_stored_once(client, store, verdict_cache):
+    import app as app_module
+    from models import Signature
+
+    data = pdf_bytes()
+    for cpf in ('11122233344', '55566677788', '99988877766'):
+        response = client.post('/internal/signature/upload', content_type='multipart/form-data', data={
+            'document_type_id': client.document_type_id,
+            'signer_name[]': ['Cliente'],
+            'signer_cpf[]': [cpf],
+            'pdf_files': [(io.BytesIO(data), 'modelo.pdf')],
+        })
+        assert response.status_code == 302
+
+    with client.flask_app.app_context():
+        signatures = Signature.query.all()
+        paths = {signature.pdf_file_path for signature in signatures}
+        assert len(signatures) == 3 and paths == {store.path_for(hashlib.sha256(data).hexdigest())}
+        assert app_module.original_references() == {paths.pop(): 3}
+        blob = signatures[0].pdf_file_path
+        assert verdict_cache.get_metrics()['hits'] == 2
+
+        # A limpeza só remove o original quando a última referência deixa de precisar dele
+        for signature in signatures[:2]:
+            signature.status = 'cancelled'
+        app_module.db.session.commit()
+        app_module.cleanup_original_blobs(client.flask_app)
+        assert os.path.exists(blob)
+
+        signatures[2].status = 'completed'
+        app_module.db.session.commit()
+        app_module.cleanup_original_blobs(client.flask_app)
+        assert not os.path.exists(blob)
@@ -0,0 +1,107 @@
+"""
+Testes do cache de chaves e certificados (utils/key_cache.py)
+"""
+
+import os
+import time
+import hashlib
+import threading
+
+import pytest
+
+from services.certificate_manager import CertificateManager
+from utils.crypto_utils import DigitalSignatureManager
+from utils.key_cache import KeyMaterialCache
+
+
+@pytest.fixture
+def key_cache():
+    return KeyMaterialCache()
+
+
+@pytest.fixture
+def manager(tmp_path, key_cache):
+    return CertificateManager(certs_dir=str(tmp_path / 'certificates'), key_cache=key_cache)
+
+
+def test_sign_and_verify_parse_pem_once(manager, key_cache):
+    content = b'%PDF-1.4 conteudo'
+    for _ in range(5):
+        info = manager.sign_pdf_digest(hashlib.sha256(content).digest())
+        assert manager.verify_signature_with_certificate(content, info) == (True, 'Assinatura válida')
+    assert manager.get_certificate_status()[0] == 'VALID'
+    assert isinstance(manager.export_certificate_der(), bytes)
+
+    metrics = key_cache.get_metrics()
+    assert metrics['loads'] == 2
+    assert metrics['files'] == {os.path.abspath(manager.private_key_path): 1,
+                                os.path.abspath(manager.certificate_path): 1}
+    assert metrics['hits'] > 10
+
+
+def test_rotation_reloads_changed_files(tmp_path, manager, key_cache):
+    content = b'%PDF-1.4 conteudo'
+    before = manager.sign_pdf_with_certificate(content)
+
+    # Novo par gerado ao lado e colocado no lugar por rename (inode novo)
+    rotated = CertificateManager(certs_dir=str(tmp_path / 'novo'), key_cache=KeyMaterialCache())
+    os.replace(rotated.private_key_path, manager.private_key_path)
+    os.replace(rotated.certificate_path, manager.certificate_path)
+    after = manager.sign_pdf_with_certificate(content)
+
+    assert after['certificate_fingerprint'] != before['certificate_fingerprint']
+    assert manager.verify_signature_with_certificate(content, after)[0] is True
+    assert manager.verify_signature_with_certificate(content, before)[0] is False
+    assert key_cache.get_metrics()['reloads'] == 2
+
+
+def test_incomplete_rewrite_keeps_previous_object(manager, key_cache):
+    certificate = key_cache.certificate(manager.certificate_path)
+    with open(manager.certificate_path, 'ab') as f:
+        f.write(b'\n')
+    with open(manager.certificate_path, 'r+b') as f:
+        f.truncate(100)
+
+    assert key_cache.certificate(manager.certificate_path) is certificate
+    assert key_cache.get_metrics()['errors'] == 1
+
+
+def test_missing_file_raises(tmp_path, key_cache):
+    with pytest.raises(FileNotFoundError):
+        key_cache.certificate(str(tmp_path / 'inexistente.pem'))
+
+
+def test_concurrent_callers_share_one_load(tmp_path, key_cache):
+    manager = DigitalSignatureManager(keys_dir=str(tmp_path / 'keys'), key_cache=key_cache)
+    results = []
+
+    def sign():
+        info = manager.sign_data('documento')
+        results.append(manager.verify_signature('documento', info))
+
+    threads = [threading.Thread(target=sign) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [True] * 8
+    assert key_cache.get_metrics()['loads'] == 2
+
+
+def test_cached_sign_is_faster_than_reparsing(manager, key_cache):
+    digest = hashlib.sha256(b'x').digest()
+    manager.sign_pdf_digest(digest)
+
+    started = time.perf_counter()
+    for _ in range(20):
+        manager.sign_pdf_digest(digest)
+    cached = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(20):
+        key_cache.clear()
+        manager.sign_pdf_digest(digest)
+    reparsed = time.perf_counter() - started
+
+    assert cached < reparsed
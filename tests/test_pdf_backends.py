@@ -0,0 +1,190 @@
+"""
+Conformidade dos backends de PDF (pdf_backend.py): o mesmo corpus é lido,
+carimbado e gravado por todos os backends instalados, com o mesmo resultado
+"""
+
+import io
+
+import PyPDF2
+import pytest
+from PyPDF2.generic import ArrayObject, DictionaryObject, FloatObject, NameObject, TextStringObject
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4, landscape, letter
+
+from pdf_backend import PyPDF2Document, available_backends, open_pdf
+from pdf_stamper import OverlayCache, render_manifest_page, stamp_pdf
+
+BACKENDS = available_backends()
+
+
+def draw_stamp(c, width, height):
+    c.drawString(10, 10, "Assinado")
+
+
+def reportlab_pdf(sizes):
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer)
+    for i, size in enumerate(sizes):
+        c.setPageSize(size)
+        c.drawString(72, 400, f"Página {i + 1}")
+        c.showPage()
+    c.save()
+    buffer.seek(0)
+    return PyPDF2.PdfReader(buffer)
+
+
+def write_pdf(writer, path):
+    writer.add_metadata({'/Title': 'Corpus de conformidade'})
+    with open(path, 'wb') as f:
+        writer.write(f)
+
+
+def make_mixed_sizes(path):
+    writer = PyPDF2.PdfWriter()
+    for page in reportlab_pdf([A4, landscape(A4), letter, A4]).pages:
+        writer.add_page(page)
+    write_pdf(writer, path)
+
+
+def make_rotated(path):
+    writer = PyPDF2.PdfWriter()
+    for page in reportlab_pdf([A4, A4, A4]).pages:
+        writer.add_page(page)
+    writer.pages[1].rotate(90)
+    write_pdf(writer, path)
+
+
+def make_inherited_attributes(path):
+    # /MediaBox e /Resources herdados do nó /Pages
+    writer = PyPDF2.PdfWriter()
+    for page in reportlab_pdf([A4, A4]).pages:
+        writer.add_page(page)
+    pages = writer._root_object['/Pages'].get_object()
+    for key in ('/MediaBox', '/Resources'):
+        pages[NameObject(key)] = writer.pages[0][key]
+        for page in writer.pages:
+            del page[key]
+    write_pdf(writer, path)
+
+
+def make_annotated(path):
+    writer = PyPDF2.PdfWriter()
+    for page in reportlab_pdf([A4, A4]).pages:
+        writer.add_page(page)
+    annot = DictionaryObject({
+        NameObject('/Type'): NameObject('/Annot'),
+        NameObject('/Subtype'): NameObject('/Text'),
+        NameObject('/Rect'): ArrayObject([FloatObject(v) for v in (100, 100, 120, 120)]),
+        NameObject('/Contents'): TextStringObject('Nota do revisor'),
+    })
+    writer.pages[0][NameObject('/Annots')] = ArrayObject([writer._add_object(annot)])
+    write_pdf(writer, path)
+
+
+CORPUS = {
+    'mixed_sizes': make_mixed_sizes,
+    'rotated': make_rotated,
+    'inherited_attributes': make_inherited_attributes,
+    'annotated': make_annotated,
+}
+
+
+@pytest.fixture(params=sorted(CORPUS))
+def corpus_pdf(request, tmp_path):
+    path = tmp_path / f"{request.param}.pdf"
+    CORPUS[request.param](path)
+    return path
+
+
+def reference_structure(path):
+    """Estrutura lida pelo PyPDF2 diretamente, sem a camada de backend"""
+    reader = PyPDF2.PdfReader(str(path))
+    geometries = []
+    for page in reader.pages:
+        geometries.append((float(page.mediabox.width), float(page.mediabox.height), int(page.get('/Rotate', 0)) % 360))
+    return geometries
+
+
+def stamped_flags(path):
+    return ['Assinado' in page.extract_text() for page in PyPDF2.PdfReader(str(path)).pages]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_open_reads_same_structure(corpus_pdf, backend):
+    with open_pdf(str(corpus_pdf), backend) as document:
+        assert document.backend == backend
+        assert not document.is_encrypted
+        geometries = [geometry for _index, geometry in document.iter_pages()]
+        assert geometries == pytest.approx(reference_structure(corpus_pdf))
+        assert document.get_metadata()['/Title'] == 'Corpus de conformidade'
+        assert not document.is_manifest_page(document.page_count - 1)
+        annotations = [document.annotation_contents(i) for i in range(document.page_count)]
+    expected = [['Nota do revisor'], []] if corpus_pdf.stem == 'annotated' else [[]] * len(annotations)
+    assert annotations == expected
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('merge', [False, True])
+def test_stamp_append_and_write(corpus_pdf, tmp_path, backend, merge):
+    output = tmp_path / 'out.pdf'
+    overlay_cache = OverlayCache(draw_stamp, 'conformidade')
+    with open_pdf(str(corpus_pdf), backend) as document:
+        page_count = document.page_count
+        document.stamp_page(0, overlay_cache, merge=merge)
+        document.stamp_page(page_count - 1, overlay_cache, merge=merge)
+        index = document.append_page(render_manifest_page(page_count), manifest=True)
+        document.stamp_page(index, overlay_cache, merge=merge)
+        document.set_metadata({'/SignatureHash': 'abc'})
+        with open(output, 'wb') as f:
+            document.write(f)
+    overlay_cache.close()
+
+    # O resultado é lido igualmente por todos os backends
+    for reader_backend in BACKENDS:
+        with open_pdf(str(output), reader_backend) as document:
+            assert document.page_count == page_count + 1
+            assert document.is_manifest_page(page_count)
+            metadata = document.get_metadata()
+            assert metadata['/SignatureHash'] == 'abc'
+            assert metadata['/Title'] == 'Corpus de conformidade'
+    if 'pikepdf' in BACKENDS:
+        import pikepdf
+        with pikepdf.open(str(output)) as pdf:
+            assert pdf.check_pdf_syntax() == []
+    expected = [i in (0, page_count - 1) for i in range(page_count)] + [True]
+    assert stamped_flags(output) == expected
+    texts = [page.extract_text() for page in PyPDF2.PdfReader(str(output)).pages]
+    assert all(f"Página {i + 1}" in texts[i] for i in range(page_count))
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_xobject_shared_per_geometry(tmp_path, backend):
+    original, output = tmp_path / 'in.pdf', tmp_path / 'out.pdf'
+    make_mixed_sizes(original)
+
+    stats = stamp_pdf(str(original), str(output), draw_stamp, 'conformidade', mode='xobject', backend=backend)
+
+    assert stats['backend'] == backend
+    # A4, A4 paisagem e carta: três renderizações, uma reutilização
+    assert (stats['overlays_rendered'], stats['overlays_reused']) == (3, 1)
+    assert stamped_flags(output) == [True] * 4
+
+
+@pytest.mark.skipif(len(BACKENDS) < 2, reason='apenas um backend instalado')
+def test_backends_render_identically(corpus_pdf, tmp_path):
+    fitz = pytest.importorskip('fitz')
+    renders = []
+    for backend in BACKENDS:
+        output = tmp_path / f"{backend}.pdf"
+        stamp_pdf(str(corpus_pdf), str(output), draw_stamp, 'conformidade', mode='xobject',
+                  placement='signature_page', backend=backend)
+        with fitz.open(str(output)) as document:
+            renders.append([page.get_pixmap(dpi=50).samples for page in document])
+    assert all(render == renders[0] for render in renders[1:])
+
+
+def test_unknown_backend_falls_back_to_pypdf2(tmp_path):
+    path = tmp_path / 'in.pdf'
+    make_rotated(path)
+    with open_pdf(str(path), 'inexistente') as document:
+        assert isinstance(document, PyPDF2Document)
@@ -0,0 +1,99 @@
+"""
+Testes da atualização incremental (pdf_incremental.py) usada pelo carimbo
+"""
+
+import PyPDF2
+import pytest
+
+from pdf_stamper import stamp_pdf
+
+
+def draw_stamp(c, width, height):
+    c.drawString(10, 10, "Assinado")
+
+
+def stamp(input_path, output_path, mode='incremental'):
+    metadata = {'/SignatureInfo': '{"hash": ""}', '/SignatureHash': ''}
+    return stamp_pdf(str(input_path), str(output_path), draw_stamp, 'teste', mode=mode, metadata=metadata)
+
+
+def page_texts(path):
+    return [page.extract_text() for page in PyPDF2.PdfReader(str(path)).pages]
+
+
+def test_incremental_preserves_original_bytes(tmp_path, make_pdf):
+    original, output = tmp_path / 'in.pdf', tmp_path / 'out.pdf'
+    make_pdf(original)
+
+    stats = stamp(original, output)
+
+    assert stats['mode'] == 'incremental'
+    assert output.read_bytes().startswith(original.read_bytes())
+    assert stats['size'] == output.stat().st_size
+
+
+def test_incremental_revision_is_readable(tmp_path, make_pdf):
+    original, output = tmp_path / 'in.pdf', tmp_path / 'out.pdf'
+    make_pdf(original)
+
+    stamp(original, output)
+
+    reader = PyPDF2.PdfReader(str(output))
+    assert len(reader.pages) == 3
+    assert reader.metadata['/SignatureHash'] == ''
+    assert all('Assinado' in text for text in page_texts(output))
+    # Revisões anteriores continuam acessíveis via /Prev
+    assert '/Prev' in reader.trailer
+
+
+def test_incremental_renders_like_rewrite(tmp_path, make_pdf):
+    original = tmp_path / 'in.pdf'
+    make_pdf(original)
+
+    stamp(original, tmp_path / 'inc.pdf')
+    stamp(original, tmp_path / 'xobj.pdf', mode='xobject')
+
+    assert page_texts(tmp_path / 'inc.pdf') == page_texts(tmp_path / 'xobj.pdf')
+
+
+def test_incremental_on_xref_stream_pdf(tmp_path, make_pdf):
+    pikepdf = pytest.importorskip('pikepdf')
+    plain, original, output = tmp_path / 'plain.pdf', tmp_path / 'in.pdf', tmp_path / 'out.pdf'
+    make_pdf(plain)
+    with pikepdf.open(str(plain)) as pdf:
+        pdf.save(str(original), object_stream_mode=pikepdf.ObjectStreamMode.generate)
+
+    stamp(original, output)
+
+    assert output.read_bytes().startswith(original.read_bytes())
+    with pikepdf.open(str(output)) as pdf:
+        assert pdf.check_pdf_syntax() == []
+        assert len(pdf.pages) == 3
+    assert all('Assinado' in text for text in page_texts(output))
+
+
+def test_encrypted_pdf_falls_back_to_rewrite(tmp_path, make_pdf):
+    plain, original, output = tmp_path / 'plain.pdf', tmp_path / 'in.pdf', tmp_path / 'out.pdf'
+    make_pdf(plain)
+    writer = PyPDF2.PdfWriter()
+    for page in PyPDF2.PdfReader(str(plain)).pages:
+        writer.add_page(page)
+    writer.encrypt('', 'dono')
+    with open(original, 'wb') as f:
+        writer.write(f)
+
+    stats = stamp(original, output)
+
+    assert stats['mode'] == 'xobject'
+
+
+def test_successive_revisions_keep_previous_stamps(tmp_path, make_pdf):
+    original, first, second = tmp_path / 'in.pdf', tmp_path / 'r1.pdf', tmp_path / 'r2.pdf'
+    make_pdf(original)
+
+    stamp_pdf(str(original), str(first), lambda c, w, h: c.drawString(10, 10, "Assinante A"), 'a')
+    stamp_pdf(str(first), str(second), lambda c, w, h: c.drawString(10, 40, "Assinante B"), 'b')
+
+    assert second.read_bytes().startswith(first.read_bytes())
+    for text in page_texts(second):
+        assert 'Assinante A' in text and 'Assinante B' in text
@@ -0,0 +1,498 @@
+"""
+Testes da verificação de segurança de PDFs (pdf_scanner.py): pré-varredura em
+bytes, concordância com a varredura estrutural e pool de processos com limites
+"""
+
+import os
+import time
+import hashlib
+import threading
+
+import PyPDF2
+import pytest
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+
+import pdf_scanner
+from pdf_scanner import (ObjectWalker, analyze_pdf_upload, create_scanner_engine, page_box, prescan_pdf,
+                         run_with_cpu_limit, scan_pdf_safeness)
+from services import scan_cache
+from services.scan_cache import ScanVerdictCache
+from services.stamping_engine import StampingWorkerLost
+
+PAGE = b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R >>"
+
+
+@pytest.fixture(autouse=True)
+def verdict_cache(tmp_path, monkeypatch):
+    """Cache de veredictos vazio por teste, fora do arquivo compartilhado do sistema"""
+    cache = ScanVerdictCache(url=str(tmp_path / 'scan_cache.sqlite3'), max_entries=100)
+    monkeypatch.setattr(scan_cache, 'scan_verdict_cache', cache)
+    return cache
+
+
+def stream(data):
+    return b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream"
+
+
+def build_pdf(path, objects, catalog_extra=b"", xref_overrides=None):
+    """PDF escrito direto em bytes: objects numerados a partir de 3
+
+    Os objetos 1 (catálogo) e 2 (páginas) são fixos; o objeto 3 é a página.
+    xref_overrides: {número: deslocamento relativo ao início de outro objeto,
+    como (número_base, delta)} para apontar a xref para dentro de um objeto.
+    """
+    all_objects = [
+        b"<< /Type /Catalog /Pages 2 0 R " + catalog_extra + b">>",
+        b"<< /Type /Pages /Count 1 /Kids [3 0 R] >>",
+    ] + objects
+    offsets = {}
+    with open(path, 'wb') as f:
+        f.write(b"%PDF-1.4\n")
+        for number, body in enumerate(all_objects, start=1):
+            offsets[number] = f.tell()
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        for number, (base, delta) in (xref_overrides or {}).items():
+            offsets[number] = offsets[base] + delta
+        xref = f.tell()
+        size = max(offsets) + 1
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for number in range(1, size):
+            f.write(b"%010d 00000 n \n" % offsets.get(number, 0))
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref))
+
+
+def make_clean_pdf(path, num_pages=3):
+    c = canvas.Canvas(str(path), pagesize=A4)
+    for i in range(num_pages):
+        c.drawString(72, 720, f"Página {i + 1}")
+        c.showPage()
+    c.save()
+
+
+def make_shared_resources_pdf(path):
+    # Fonte, imagem e link interno compartilhados por 30 páginas
+    c = canvas.Canvas(str(path), pagesize=A4)
+    for i in range(30):
+        c.drawString(72, 720, f"Página {i + 1}")
+        c.rect(72, 600, 100, 50, fill=1)
+        c.linkAbsolute("Início", "inicio", (72, 600, 172, 650))
+        if i == 0:
+            c.bookmarkPage("inicio")
+        c.showPage()
+    c.save()
+
+
+def make_nested_pdf(path, depth, leaf):
+    nested = leaf
+    for _ in range(depth):
+        nested = b"<< /Next " + nested + b" >>"
+    build_pdf(path, [PAGE, stream(b"BT ET")], catalog_extra=b"/PieceInfo " + nested)
+
+
+# Corpus de regressão: (nome, gerador, aceito). Os veredictos são os da
+# varredura estrutural original (percurso recursivo com str/repr).
+REGRESSION_CORPUS = [
+    ('limpo', make_clean_pdf, True),
+    ('recursos_compartilhados', make_shared_resources_pdf, True),
+    ('acroform', lambda p: build_pdf(p, [PAGE, stream(b"BT ET")], b"/AcroForm << /Fields [] >>"), True),
+    ('link_goto', lambda p: build_pdf(p, [
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R /Annots [5 0 R] >>",
+        stream(b"BT ET"),
+        b"<< /Type /Annot /Subtype /Link /Rect [0 0 10 10] /A << /S /GoTo /D [3 0 R /Fit] >> >>",
+    ]), True),
+    ('aninhado_limpo', lambda p: make_nested_pdf(p, 30, b"(fim)"), True),
+    ('openaction_js', lambda p: build_pdf(p, [PAGE, stream(b"BT ET")],
+                                          b"/OpenAction << /S /JavaScript /JS (app.alert\\(1\\)) >>"), False),
+    ('pagina_aa', lambda p: build_pdf(p, [
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R /AA << /O 5 0 R >> >>",
+        stream(b"BT ET"), b"<< /S /GoTo /D [3 0 R /Fit] >>",
+    ]), False),
+    ('link_uri', lambda p: build_pdf(p, [
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R /Annots [5 0 R] >>",
+        stream(b"BT ET"),
+        b"<< /Type /Annot /Subtype /Link /Rect [0 0 10 10] /A << /S /URI /URI (https://exemplo.com) >> >>",
+    ]), False),
+    ('acroform_openaction', lambda p: build_pdf(p, [PAGE, stream(b"BT ET"), b"<< /S /GoTo /D [3 0 R /Fit] >>"],
+                                                b"/AcroForm << /Fields [] >> /OpenAction 5 0 R"), False),
+    ('launch', lambda p: build_pdf(p, [PAGE, stream(b"BT ET")],
+                                   b"/OpenAction << /S /Launch /F (calc.exe) >>"), False),
+    ('arquivo_embutido', lambda p: build_pdf(p, [PAGE, stream(b"BT ET"), stream(b"MZ")],
+                                             b"/Names << /EmbeddedFiles << /Names [(a.exe) 5 0 R] >> >>"), False),
+    ('padrao_js_em_string', lambda p: build_pdf(p, [PAGE, stream(b"BT ET")],
+                                                b"/PieceInfo << /Data (this.print\\(\\)) >>"), False),
+    ('nome_escapado', lambda p: build_pdf(p, [PAGE, stream(b"BT ET")],
+                                          b"/OpenAction << /S /J#61vaScript >>"), False),
+    ('aninhado_js', lambda p: make_nested_pdf(p, 30, b"<< /S /JavaScript >>"), False),
+]
+
+
+@pytest.mark.parametrize('name,make,accepted', REGRESSION_CORPUS, ids=[entry[0] for entry in REGRESSION_CORPUS])
+@pytest.mark.parametrize('prescan', [True, False])
+def test_regression_corpus_verdicts(tmp_path, name, make, accepted, prescan):
+    path = tmp_path / f"{name}.pdf"
+    make(path)
+
+    ok, message = scan_pdf_safeness(str(path), prescan=prescan)
+
+    assert ok == accepted, message
+
+
+def test_clean_document_skips_structural_walk(tmp_path):
+    path = tmp_path / 'limpo.pdf'
+    make_clean_pdf(path)
+
+    assert prescan_pdf(str(path)) == (False, set())
+    assert scan_pdf_safeness(str(path)) == (True, 'OK')
+    assert scan_pdf_safeness(str(path), prescan=False) == (True, 'OK')
+
+
+def test_tokens_inside_stream_data_are_ignored(tmp_path):
+    # Dados binários (imagem, conteúdo) não são objetos do PDF
+    path = tmp_path / 'binario.pdf'
+    build_pdf(path, [PAGE, stream(b"\x00/JS js: /AA eval(\xff/Launch")])
+
+    assert prescan_pdf(str(path)) == (False, set())
+    assert scan_pdf_safeness(str(path)) == (True, 'OK')
+
+
+@pytest.mark.parametrize('action', [
+    b"/OpenAction << /S /JavaScript /JS (app.alert\\(1\\)) >>",
+    b"/OpenAction << /S /J#61vaScript /J#53 (x) >>",
+    b"/OpenAction << /S /Launch /F <63616c632e657865> >>",
+    b"/Names << /Title <6170702e616c657274> >>",
+    b"/Names << /Title <feff0065007600610 06c0028> >>",
+])
+def test_dangerous_content_goes_to_structural_walk(tmp_path, action):
+    path = tmp_path / 'perigoso.pdf'
+    build_pdf(path, [PAGE, stream(b"BT ET")], catalog_extra=action)
+
+    suspicious, hits = prescan_pdf(str(path))
+
+    assert suspicious and hits
+
+
+def test_javascript_action_rejected(tmp_path):
+    path = tmp_path / 'js.pdf'
+    build_pdf(path, [PAGE, stream(b"BT ET")],
+              catalog_extra=b"/OpenAction << /S /JavaScript /JS (app.alert\\(1\\)) >>")
+
+    ok, message = scan_pdf_safeness(str(path))
+
+    assert not ok
+    assert 'perigoso' in message
+
+
+def test_escaped_name_rejected(tmp_path):
+    path = tmp_path / 'escapado.pdf'
+    build_pdf(path, [PAGE, stream(b"BT ET")], catalog_extra=b"/OpenAction << /S /J#61vaScript >>")
+
+    assert '/JavaScript' in prescan_pdf(str(path))[1]
+    assert not scan_pdf_safeness(str(path))[0]
+
+
+def test_acroform_needs_open_action_context(tmp_path):
+    form = tmp_path / 'formulario.pdf'
+    both = tmp_path / 'formulario_acao.pdf'
+    build_pdf(form, [PAGE, stream(b"BT ET")], catalog_extra=b"/AcroForm << /Fields [] >>")
+    build_pdf(both, [PAGE, stream(b"BT ET"), b"<< /S /GoTo /D [3 0 R /Fit] >>"],
+              catalog_extra=b"/AcroForm << /Fields [] >> /OpenAction 5 0 R")
+
+    assert prescan_pdf(str(form)) == (False, {'/AcroForm'})
+    assert prescan_pdf(str(both))[0]
+
+
+def test_fake_stream_in_string_does_not_hide_objects(tmp_path):
+    # Um "stream" dentro de string não inicia dados de fluxo
+    path = tmp_path / 'falso.pdf'
+    fake = b"<< /A (>> stream\n) /S /JavaScript /JS (x) /B (endstream) >>"
+    build_pdf(path, [PAGE, stream(b"BT ET"), fake], catalog_extra=b"/OpenAction 5 0 R")
+
+    assert prescan_pdf(str(path))[0]
+    assert not scan_pdf_safeness(str(path))[0]
+
+
+def test_object_hidden_inside_stream_data_is_scanned(tmp_path):
+    # A xref aponta o objeto 5 para dentro dos dados do fluxo 4
+    path = tmp_path / 'escondido.pdf'
+    hidden = b"5 0 obj\n<< /S /JavaScript /JS (x) >>\nendobj\n"
+    content = stream(b"BT ET\n" + hidden)
+    build_pdf(path, [PAGE, content], catalog_extra=b"/OpenAction 5 0 R",
+              xref_overrides={5: (4, len(b"4 0 obj\n") + content.index(hidden))})
+
+    assert prescan_pdf(str(path))[0]
+    assert not scan_pdf_safeness(str(path))[0]
+
+
+def test_javascript_inside_object_stream(tmp_path):
+    pikepdf = pytest.importorskip('pikepdf')
+    original, compressed = tmp_path / 'original.pdf', tmp_path / 'objstm.pdf'
+    make_clean_pdf(original)
+    with pikepdf.open(str(original)) as pdf:
+        pdf.Root.OpenAction = pdf.make_indirect(pikepdf.Dictionary(
+            S=pikepdf.Name.JavaScript, JS=pikepdf.String('app.alert(1)')))
+        pdf.save(str(compressed), object_stream_mode=pikepdf.ObjectStreamMode.generate)
+    assert b'/JavaScript' not in compressed.read_bytes()
+
+    suspicious, hits = prescan_pdf(str(compressed))
+
+    assert suspicious and '/JavaScript' in hits
+    assert not scan_pdf_safeness(str(compressed))[0]
+
+
+def test_walker_visits_shared_objects_once(tmp_path):
+    path = tmp_path / 'compartilhado.pdf'
+    make_shared_resources_pdf(path)
+    reader = PyPDF2.PdfReader(str(path))
+    walker = ObjectWalker()
+
+    assert walker.check(reader.trailer) == (False, None)
+    nodes = walker.nodes
+    # Páginas já alcançadas pelo trailer não são percorridas de novo
+    for page in reader.pages:
+        assert walker.check(page.indirect_reference) == (False, None)
+    assert walker.nodes == nodes
+    assert len(walker.visited) < reader.trailer['/Size']
+
+
+def test_walker_node_cap(tmp_path):
+    path = tmp_path / 'compartilhado.pdf'
+    make_shared_resources_pdf(path)
+
+    is_dangerous, reason = ObjectWalker(max_nodes=50).check(PyPDF2.PdfReader(str(path)).trailer)
+
+    assert is_dangerous
+    assert 'Limite de 50 objetos' in reason
+
+
+def test_walker_checks_every_annotation(tmp_path):
+    # O percurso antigo verificava só os 100 primeiros itens de cada lista
+    path = tmp_path / 'anotacoes.pdf'
+    link = b"<< /Type /Annot /Subtype /Link /Rect [0 0 10 10] /A << /S /GoTo /D [3 0 R /Fit] >> >>"
+    script = b"<< /Type /Annot /Subtype /Link /Rect [0 0 10 10] /A << /S /JavaScript >> >>"
+    annots = b" ".join(b"%d 0 R" % (5 + i) for i in range(150))
+    build_pdf(path, [
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R /Annots [" + annots + b"] >>",
+        stream(b"BT ET"),
+    ] + [link] * 149 + [script])
+
+    ok, message = scan_pdf_safeness(str(path), prescan=False)
+
+    assert not ok
+    assert '/JavaScript' in message
+
+
+@pytest.fixture
+def make_scanner_engine(make_engine, monkeypatch):
+    """Pool de varredura próprio do teste, usado por scan_pdf_safeness"""
+    def factory(**kwargs):
+        engine = make_engine(create_scanner_engine, **kwargs)
+        monkeypatch.setattr(pdf_scanner, '_scanner_engine', engine)
+        return engine
+
+    return factory
+
+
+def test_scan_runs_in_pool_process(tmp_path, make_scanner_engine):
+    engine = make_scanner_engine(max_workers=1)
+    path = tmp_path / 'limpo.pdf'
+    make_clean_pdf(path)
+
+    assert scan_pdf_safeness(str(path)) == (True, 'OK')
+    assert engine.run(os.getpid) != os.getpid()
+
+    metrics = engine.get_metrics()
+    assert metrics['jobs_completed'] == 2
+    assert metrics['exec_seconds_max'] > 0
+
+
+def test_prestart_spawns_processes(make_scanner_engine, wait_until):
+    engine = make_scanner_engine(max_workers=2)
+
+    engine.prestart()
+
+    slots = list(engine._slots.queue)
+    assert len(slots) == 2
+    assert wait_until(lambda: all(slot._processes for slot in slots))
+
+
+def test_scan_timeout_kills_process(tmp_path, make_scanner_engine):
+    # O primeiro job inclui o spawn do processo, bem acima de 50 ms
+    engine = make_scanner_engine(max_workers=1, job_timeout=0.05)
+    path = tmp_path / 'limpo.pdf'
+    make_clean_pdf(path)
+
+    ok, message = scan_pdf_safeness(str(path))
+
+    assert not ok
+    assert message.startswith('Timeout ao processar PDF')
+    metrics = engine.get_metrics()
+    assert metrics['jobs_timed_out'] == 1
+    assert metrics['workers_restarted'] == 1
+
+
+def test_scan_rejected_when_pool_saturated(tmp_path, make_scanner_engine, wait_until):
+    engine = make_scanner_engine(max_workers=1, max_queue=0)
+    path = tmp_path / 'limpo.pdf'
+    make_clean_pdf(path)
+    busy = threading.Thread(target=engine.run, args=(time.sleep, 2), daemon=True)
+    busy.start()
+    assert wait_until(lambda: engine.get_metrics()['running'] == 1)
+
+    ok, message = scan_pdf_safeness(str(path))
+
+    assert not ok
+    assert 'Servidor ocupado' in message
+    assert engine.get_metrics()['jobs_rejected'] == 1
+    busy.join()
+
+
+@pytest.mark.skipif(pdf_scanner.resource is None, reason='rlimits indisponíveis')
+def test_cpu_limit_kills_runaway_job(make_scanner_engine):
+    engine = make_scanner_engine(max_workers=1, job_timeout=60)
+
+    started = time.monotonic()
+    with pytest.raises(StampingWorkerLost):
+        engine.run(run_with_cpu_limit, 1, sum, range(10 ** 12))
+
+    assert time.monotonic() - started < 30
+    # O slot é recriado e o limite de CPU do job anterior não afeta o próximo
+    assert engine.run(run_with_cpu_limit, 1, sum, range(1000)) == 499500
+
+
+@pytest.mark.skipif(pdf_scanner.resource is None, reason='rlimits indisponíveis')
+def test_address_space_limit(make_scanner_engine):
+    engine = make_scanner_engine(max_workers=1, memory_limit_mb=0, initargs=(512,))
+
+    with pytest.raises(MemoryError):
+        engine.run(bytearray, 2 * 1024 ** 3)
+    assert engine.run(len, b'ok') == 2
+
+
+def test_verdict_cached_by_content(tmp_path, make_scanner_engine, verdict_cache):
+    engine = make_scanner_engine(max_workers=1)
+    path = tmp_path / 'limpo.pdf'
+    make_clean_pdf(path)
+    copy = tmp_path / 'copia.pdf'
+    copy.write_bytes(path.read_bytes())
+
+    assert scan_pdf_safeness(str(path)) == (True, 'OK')
+    assert scan_pdf_safeness(str(copy)) == (True, 'OK')
+
+    assert engine.get_metrics()['jobs_completed'] == 1
+    metrics = verdict_cache.get_metrics()
+    assert metrics['hits'] == 1
+    assert metrics['entries'] == 1
+
+
+def test_rejection_verdict_is_cached(tmp_path, make_scanner_engine, verdict_cache):
+    engine = make_scanner_engine(max_workers=1)
+    path = tmp_path / 'js.pdf'
+    build_pdf(path, [PAGE, stream(b"q Q")], catalog_extra=b"/OpenAction << /S /JavaScript /JS (app.alert(1)) >> ")
+
+    first = scan_pdf_safeness(str(path))
+    assert not first[0]
+    assert scan_pdf_safeness(str(path)) == first
+    assert engine.get_metrics()['jobs_completed'] == 1
+
+
+def test_execution_failures_are_not_cached(tmp_path, make_scanner_engine, verdict_cache):
+    make_scanner_engine(max_workers=1, job_timeout=0.05)
+    path = tmp_path / 'limpo.pdf'
+    make_clean_pdf(path)
+
+    assert scan_pdf_safeness(str(path))[1].startswith('Timeout ao processar PDF')
+
+    assert verdict_cache.get_metrics()['entries'] == 0
+
+
+def test_scanner_version_change_invalidates_verdicts(tmp_path, make_scanner_engine, monkeypatch):
+    engine = make_scanner_engine(max_workers=1)
+    path = tmp_path / 'limpo.pdf'
+    make_clean_pdf(path)
+
+    scan_pdf_safeness(str(path))
+    monkeypatch.setattr(pdf_scanner, 'SCANNER_VERSION_TAG', 'v-nova-regra')
+    scan_pdf_safeness(str(path))
+
+    assert engine.get_metrics()['jobs_completed'] == 2
+
+
+def make_mixed_pdf(path):
+    # Duas páginas A4, uma paisagem e uma com /Rotate 90 (o reportlab troca largura e altura)
+    c = canvas.Canvas(str(path), pagesize=A4)
+    for size, rotation in ((A4, 0), (A4, 0), ((842, 595), 0), (A4, 90)):
+        c.setPageSize(size)
+        c.setPageRotation(rotation)
+        c.drawString(72, 500, "Página")
+        c.showPage()
+    c.save()
+
+
+def test_upload_analysis(tmp_path):
+    path = tmp_path / 'misto.pdf'
+    make_mixed_pdf(path)
+
+    ok, message, analysis = analyze_pdf_upload(str(path))
+
+    assert (ok, message) == (True, 'OK')
+    assert analysis['page_count'] == 4
+    assert analysis['page_boxes'] == [[2, 595.28, 841.89, 0], [1, 842, 595, 0], [1, 841.89, 595.28, 90]]
+    assert page_box(analysis, 2) == (842, 595, 0)
+    assert page_box(analysis, 3) == (841.89, 595.28, 90)
+    assert page_box(analysis, 4) is None
+    assert analysis['incremental'] and analysis['xref_ok'] and not analysis['encrypted']
+    assert analysis['size'] == path.stat().st_size
+
+
+def test_upload_analysis_reuses_cached_verdict(tmp_path, make_scanner_engine, verdict_cache):
+    engine = make_scanner_engine(max_workers=1)
+    path = tmp_path / 'limpo.pdf'
+    make_clean_pdf(path)
+
+    first = analyze_pdf_upload(str(path))
+    assert analyze_pdf_upload(str(path)) == first
+    # O veredicto sem análise tem chave própria
+    assert scan_pdf_safeness(str(path)) == (True, 'OK')
+
+    assert engine.get_metrics()['jobs_completed'] == 2
+
+
+def test_supplied_digest_uses_cached_verdict(tmp_path, make_scanner_engine, verdict_cache):
+    engine = make_scanner_engine(max_workers=1)
+    path = tmp_path / 'limpo.pdf'
+    make_clean_pdf(path)
+    digest = hashlib.sha256(path.read_bytes()).hexdigest()
+
+    first = analyze_pdf_upload(str(path), digest=digest)
+    assert analyze_pdf_upload(str(path), digest=digest) == first
+    assert scan_pdf_safeness(str(path), digest=digest) == (True, 'OK')
+    assert scan_pdf_safeness(str(path), digest=digest) == (True, 'OK')
+
+    assert engine.get_metrics()['jobs_completed'] == 2
+    assert verdict_cache.get_metrics()['hits'] == 2
+
+
+def test_upload_analysis_of_rejected_pdf(tmp_path):
+    path = tmp_path / 'js.pdf'
+    build_pdf(path, [PAGE, stream(b"BT ET")], catalog_extra=b"/OpenAction << /S /JavaScript /JS (x) >>")
+
+    ok, _message, analysis = analyze_pdf_upload(str(path))
+
+    assert not ok
+    assert analysis is None
+
+
+def test_upload_analysis_flags_broken_xref(tmp_path):
+    path = tmp_path / 'xref_quebrada.pdf'
+    build_pdf(path, [PAGE, stream(b"BT ET")])
+    data = path.read_bytes()
+    start = data.rindex(b"startxref\n") + len(b"startxref\n")
+    path.write_bytes(data[:start] + b"12" + data[data.index(b"\n", start):])
+
+    ok, _message, analysis = analyze_pdf_upload(str(path))
+
+    # O PyPDF2 reconstrói a xref e o documento é aceito, mas não recebe revisão incremental
+    assert ok
+    assert not analysis['xref_ok']
+    assert not analysis['incremental']
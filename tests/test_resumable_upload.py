@@ -0,0 +1,251 @@
+"""
+Testes dos uploads retomáveis em partes (services/resumable_upload.py)
+"""
+
+import io
+import os
+import base64
+import hashlib
+
+import pytest
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+from werkzeug.exceptions import ClientDisconnected
+
+from services import scan_cache
+from services.scan_cache import ScanVerdictCache
+from services.content_store import ContentStore
+from services.resumable_upload import ResumableUploadStore, ResumableUploadError
+from services.upload_ingest import UploadIngestor
+
+
+def pdf_bytes(pages=20):
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    for page in range(pages):
+        c.drawString(72, 720, f"Página {page + 1}")
+        c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+class DroppingStream(io.BytesIO):
+    """Corpo de requisição que cai depois de limit bytes"""
+
+    def __init__(self, data, limit):
+        super().__init__(data[:limit])
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        if not chunk:
+            raise ClientDisconnected()
+        return chunk
+
+
+@pytest.fixture(autouse=True)
+def verdict_cache(tmp_path, monkeypatch):
+    cache = ScanVerdictCache(url=str(tmp_path / 'scan_cache.sqlite3'), max_entries=100)
+    monkeypatch.setattr(scan_cache, 'scan_verdict_cache', cache)
+    return cache
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResumableUploadStore(directory=str(tmp_path / 'resumable'), retention_hours=1)
+
+
+def test_interrupted_part_keeps_received_bytes_and_resumes(tmp_path, store):
+    data = pdf_bytes()
+    upload = store.create('user-1', 'grande.pdf', len(data))
+
+    first = store.append(upload['id'], 'user-1', 0, DroppingStream(data, 700))
+    assert first['offset'] == 700
+    with pytest.raises(ResumableUploadError) as error:
+        store.append(upload['id'], 'user-1', 0, io.BytesIO(data))
+    assert error.value.status_code == 409
+
+    # Outro worker continua o mesmo upload (hash parcial recalculado do disco)
+    other = ResumableUploadStore(directory=store.directory)
+    assert other.info(upload['id'], 'user-1')['offset'] == 700
+    assert other.append(upload['id'], 'user-1', 700, io.BytesIO(data[700:]))['offset'] == len(data)
+
+    received = UploadIngestor(max_workers=1).receive(
+        other.take(upload['id'], 'user-1'), 'grande.pdf', 'f1', str(tmp_path / 'grande.pdf'))
+    assert received['ok']
+    assert received['sha256'] == hashlib.sha256(data).hexdigest()
+    assert (tmp_path / 'grande.pdf').read_bytes() == data
+    assert os.listdir(store.directory) == []
+
+
+@pytest.mark.parametrize('retry', ['mesma parte', 'parte excedente'])
+def test_retry_racing_the_first_patch_is_refused(store, monkeypatch, retry):
+    data = pdf_bytes()
+    upload = store.create('user-1', 'grande.pdf', len(data))
+    original = store._stream_for
+
+    def racing(upload_id, part_path, offset):
+        # O primeiro PATCH termina entre a verificação do deslocamento e o bloqueio do reenvio
+        monkeypatch.setattr(store, '_stream_for', original)
+        store.append(upload_id, 'user-1', 0, io.BytesIO(data[:1000]))
+        return original(upload_id, part_path, offset)
+
+    monkeypatch.setattr(store, '_stream_for', racing)
+    body = data[:1000] if retry == 'mesma parte' else data + b'excedente'
+    with pytest.raises(ResumableUploadError) as error:
+        store.append(upload['id'], 'user-1', 0, io.BytesIO(body))
+
+    assert error.value.status_code == 409
+    assert store.info(upload['id'], 'user-1')['offset'] == 1000
+    assert open(os.path.join(store.directory, f"{upload['id']}.part"), 'rb').read() == data[:1000]
+
+
+def test_take_reuses_digest_computed_while_receiving(tmp_path, store, monkeypatch):
+    from services.upload_ingest import HashingUploadFile
+
+    data = pdf_bytes()
+    upload = store.create('user-1', 'grande.pdf', len(data))
+    store.append(upload['id'], 'user-1', 0, io.BytesIO(data[:1000]))
+    store.append(upload['id'], 'user-1', 1000, io.BytesIO(data[1000:]))
+
+    def reread(*args, **kwargs):
+        raise AssertionError('upload concluído relido do disco')
+
+    monkeypatch.setattr(HashingUploadFile, 'resume', reread)
+    # Outro worker entrega o upload: o hash vem dos metadados
+    other = ResumableUploadStore(directory=store.directory)
+    received = UploadIngestor(max_workers=1).receive(
+        other.take(upload['id'], 'user-1'), 'grande.pdf', 'f1', str(tmp_path / 'grande.pdf'))
+
+    assert received['ok'] and received['sha256'] == hashlib.sha256(data).hexdigest()
+    assert received['size'] == len(data)
+
+
+def test_upload_belongs_to_its_user(store):
+    upload = store.create('user-1', 'a.pdf', 10)
+
+    with pytest.raises(ResumableUploadError) as error:
+        store.info(upload['id'], 'user-2')
+    assert error.value.status_code == 404
+    with pytest.raises(ResumableUploadError):
+        store.info('../user-1', 'user-1')
+
+
+def test_non_pdf_is_rejected_on_first_part(store):
+    upload = store.create('user-1', 'falso.pdf', 4096)
+
+    with pytest.raises(ResumableUploadError) as error:
+        store.append(upload['id'], 'user-1', 0, io.BytesIO(b'MZ' + b'\x00' * 1000))
+
+    assert error.value.status_code == 415
+    assert os.listdir(store.directory) == []
+
+
+def test_part_beyond_declared_length_is_discarded(store):
+    data = pdf_bytes(1)
+    upload = store.create('user-1', 'a.pdf', 100)
+    store.append(upload['id'], 'user-1', 0, io.BytesIO(data[:50]))
+
+    with pytest.raises(ResumableUploadError) as error:
+        store.append(upload['id'], 'user-1', 50, io.BytesIO(data[50:]))
+
+    assert error.value.status_code == 413
+    assert store.info(upload['id'], 'user-1')['offset'] == 50
+    with pytest.raises(ResumableUploadError) as error:
+        store.take(upload['id'], 'user-1')
+    assert error.value.status_code == 409
+
+
+def test_cleanup_removes_abandoned_uploads(store):
+    stale = store.create('user-1', 'velho.pdf', 100)
+    fresh = store.create('user-1', 'novo.pdf', 100)
+    for path in (os.path.join(store.directory, f"{stale['id']}{ext}") for ext in ('.part', '.json')):
+        os.utime(path, (0, 0))
+
+    assert store.cleanup() == 1
+    assert store.info(fresh['id'], 'user-1')['offset'] == 0
+    with pytest.raises(ResumableUploadError):
+        store.info(stale['id'], 'user-1')
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, store):
+    """Aplicação de teste com um usuário logado e os uploads retomáveis em tmp_path"""
+    import app as app_module
+    from config import config
+    from models import User, DocumentType
+
+    # 'simple' não existe mais nas versões recentes do Flask-Caching
+    monkeypatch.setattr(config['testing'], 'CACHE_TYPE', 'SimpleCache')
+    monkeypatch.setattr(app_module, 'UPLOAD_ASYNC_INGEST', False)
+    monkeypatch.setattr(app_module, 'TEMP_DIR', str(tmp_path))
+    monkeypatch.setattr(app_module, 'content_store', ContentStore(directory=str(tmp_path / 'originais')))
+    monkeypatch.setattr(app_module, 'resumable_uploads', store)
+    flask_app = app_module.create_app('testing')
+    flask_app.secret_key = 'teste'
+    with flask_app.app_context():
+        app_module.db.create_all()
+        user = User(username='interno', email='interno@exemplo.com', full_name='Interno')
+        document_type = DocumentType(name='Contrato')
+        app_module.db.session.add_all([user, document_type])
+        app_module.db.session.commit()
+        ids = user.id, document_type.id
+    client = flask_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = ids[0]
+        session['_fresh'] = True
+    client.document_type_id = ids[1]
+    client.flask_app = flask_app
+    yield client
+    with flask_app.app_context():
+        app_module.db.drop_all()
+
+
+def test_chunked_upload_feeds_internal_signature_upload(client):
+    from models import Signature
+
+    data = pdf_bytes()
+    created = client.post('/internal/uploads', headers={
+        'Upload-Length': str(len(data)),
+        'Upload-Metadata': 'filename ' + base64.b64encode('contrato grande.pdf'.encode('utf-8')).decode('ascii'),
+    })
+    assert created.status_code == 201
+    location = created.headers['Location']
+
+    offset = 0
+    for start in range(0, len(data), 1000):
+        response = client.patch(location, data=data[start:start + 1000], headers={
+            'Upload-Offset': str(offset), 'Content-Type': 'application/offset+octet-stream'})
+        assert response.status_code == 204
+        offset = int(response.headers['Upload-Offset'])
+    assert client.head(location).headers['Upload-Offset'] == str(len(data))
+    stale = client.patch(location, data=b'x', headers={
+        'Upload-Offset': '0', 'Content-Type': 'application/offset+octet-stream'})
+    assert stale.status_code == 409
+
+    response = client.post('/internal/signature/upload', content_type='multipart/form-data', data={
+        'document_type_id': client.document_type_id,
+        'signer_name[]': ['Fulano de Tal'],
+        'signer_cpf[]': ['11122233344'],
+        'upload_ids[]': [created.get_json()['id']],
+        'pdf_files': [(io.BytesIO(b''), '')],
+    })
+
+    assert response.status_code == 302
+    with client.flask_app.app_context():
+        signature = Signature.query.one()
+        assert signature.original_filename == 'contrato grande.pdf'
+        assert signature.pdf_hash_cached == hashlib.sha256(data).hexdigest()
+        assert signature.file_size == len(data)
+        assert signature.get_document_analysis()['page_count'] == 20
+    assert client.head(location).status_code == 404
+
+
+def test_create_rejects_oversized_and_non_pdf(client):
+    too_big = client.post('/internal/uploads', headers={
+        'Upload-Length': str(100 * 1024 * 1024),
+        'Upload-Metadata': 'filename ' + base64.b64encode(b'a.pdf').decode('ascii')})
+    not_pdf = client.post('/internal/uploads', headers={
+        'Upload-Length': '100', 'Upload-Metadata': 'filename ' + base64.b64encode(b'a.exe').decode('ascii')})
+
+    assert too_big.status_code == 413
+    assert not_pdf.status_code == 400
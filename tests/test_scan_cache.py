@@ -0,0 +1,152 @@
+"""
+Testes do cache de veredictos da verificação de PDFs (services/scan_cache.py)
+"""
+
+import os
+import hashlib
+import threading
+
+import pytest
+
+from services.scan_cache import ScanVerdictCache
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / 'scan_cache.sqlite3')
+
+
+def test_miss_then_hit(cache_path):
+    cache = ScanVerdictCache(url=cache_path, max_entries=10)
+
+    assert cache.get(digest(b'a'), 'v1') is None
+    cache.put(digest(b'a'), 'v1', (False, 'PDF contém /JavaScript'))
+
+    assert cache.get(digest(b'a'), 'v1') == (False, 'PDF contém /JavaScript')
+    metrics = cache.get_metrics()
+    assert (metrics['hits'], metrics['misses'], metrics['entries']) == (1, 1, 1)
+    assert metrics['backend'] == 'sqlite'
+
+
+def test_version_change_invalidates(cache_path):
+    cache = ScanVerdictCache(url=cache_path, max_entries=10)
+    cache.put(digest(b'a'), 'v1', (True, 'OK'))
+
+    assert cache.get(digest(b'a'), 'v2') is None
+
+
+def test_lru_eviction_keeps_recently_used(cache_path):
+    cache = ScanVerdictCache(url=cache_path, max_entries=2)
+    cache.put(digest(b'a'), 'v1', (True, 'OK'))
+    cache.put(digest(b'b'), 'v1', (True, 'OK'))
+    assert cache.get(digest(b'a'), 'v1') is not None
+
+    cache.put(digest(b'c'), 'v1', (True, 'OK'))
+
+    assert cache.get(digest(b'b'), 'v1') is None
+    assert cache.get(digest(b'a'), 'v1') == (True, 'OK')
+    assert cache.get(digest(b'c'), 'v1') == (True, 'OK')
+    assert cache.get_metrics()['entries'] == 2
+
+
+def test_shared_between_instances(cache_path):
+    # Cada worker do gunicorn tem a sua instância apontando para o mesmo arquivo
+    worker_a = ScanVerdictCache(url=cache_path, max_entries=10)
+    worker_b = ScanVerdictCache(url=cache_path, max_entries=10)
+
+    worker_a.put(digest(b'a'), 'v1', (True, 'OK'))
+
+    assert worker_b.get(digest(b'a'), 'v1') == (True, 'OK')
+
+
+def test_concurrent_threads(cache_path):
+    cache = ScanVerdictCache(url=cache_path, max_entries=1000)
+    errors = []
+
+    def work(n):
+        try:
+            for i in range(50):
+                key = digest(b'%d-%d' % (n, i))
+                cache.put(key, 'v1', (True, 'OK'))
+                assert cache.get(key, 'v1') == (True, 'OK')
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert cache.get_metrics()['errors'] == 0
+
+
+def test_disabled_with_zero_entries(cache_path):
+    cache = ScanVerdictCache(url=cache_path, max_entries=0)
+    cache.put(digest(b'a'), 'v1', (True, 'OK'))
+
+    assert not cache.enabled
+    assert cache.get(digest(b'a'), 'v1') is None
+
+
+def test_backend_failure_is_a_miss(tmp_path):
+    cache = ScanVerdictCache(url=str(tmp_path / 'inexistente' / 'cache.sqlite3'), max_entries=10)
+
+    cache.put(digest(b'a'), 'v1', (True, 'OK'))
+
+    assert cache.get(digest(b'a'), 'v1') is None
+    assert cache.get_metrics()['errors'] == 2
+
+
+def test_redis_backend():
+    redis = pytest.importorskip('redis')
+    cache = ScanVerdictCache(url='redis://localhost:6379/15', max_entries=2)
+    try:
+        cache.clear()
+    except redis.exceptions.ConnectionError:
+        pytest.skip('servidor Redis indisponível')
+
+    cache.put(digest(b'a'), 'v1', (True, 'OK'))
+    cache.put(digest(b'b'), 'v1', (False, 'PDF contém /Launch'))
+    assert cache.get(digest(b'a'), 'v1') == (True, 'OK')
+    cache.put(digest(b'c'), 'v1', (True, 'OK'))
+
+    assert cache.get(digest(b'b'), 'v1') is None
+    assert cache.get_metrics()['entries'] == 2
+    cache.clear()
+
+
+def test_default_store_is_private():
+    import tempfile
+    from services.scan_cache import DEFAULT_SQLITE_PATH
+
+    assert not DEFAULT_SQLITE_PATH.startswith(tempfile.gettempdir())
+
+
+def test_store_created_with_private_permissions(cache_path):
+    cache = ScanVerdictCache(url=cache_path, max_entries=10)
+    cache.put(digest(b'a'), 'v1', (True, 'OK'))
+
+    assert os.stat(cache_path).st_mode & 0o777 == 0o600
+
+
+def test_planted_store_is_refused(cache_path):
+    # Arquivo criado antes por outro usuário com um veredicto forjado
+    planted = ScanVerdictCache(url=cache_path, max_entries=10)
+    planted.put(digest(b'malicioso'), 'v1', (True, 'OK'))
+    os.chmod(cache_path, 0o666)
+
+    cache = ScanVerdictCache(url=cache_path, max_entries=10)
+    assert cache.get(digest(b'malicioso'), 'v1') is None
+    assert cache.get_metrics()['errors'] == 1
+
+    if hasattr(os, 'getuid') and os.getuid() == 0:
+        os.chmod(cache_path, 0o600)
+        os.chown(cache_path, 12345, 12345)
+        cache = ScanVerdictCache(url=cache_path, max_entries=10)
+        assert cache.get(digest(b'malicioso'), 'v1') is None
@@ -0,0 +1,116 @@
+"""
+Testes da assinatura e verificação sobre o SHA-256 pré-calculado
+(services/certificate_manager.py, utils/crypto_utils.py, services/pdf_validator.py)
+"""
+
+import io
+import sys
+import base64
+import hashlib
+import types
+
+import pytest
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+
+import utils.crypto_utils as crypto_utils
+from services.certificate_manager import CertificateManager
+from services.pdf_validator import PDFValidator
+from utils.crypto_utils import DigitalSignatureManager, verify_pdf_digest_unified, verify_pdf_signature_unified
+from utils.key_cache import KeyMaterialCache
+
+
+def pdf_bytes():
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    c.drawString(72, 720, 'Documento assinado')
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    manager = CertificateManager(certs_dir=str(tmp_path / 'certificates'), key_cache=KeyMaterialCache())
+    # services/__init__.py expõe a instância com o mesmo nome do módulo
+    monkeypatch.setattr(sys.modules['services.certificate_manager'], 'certificate_manager', manager)
+    return manager
+
+
+def legacy_signature(manager, content):
+    """Assinatura no formato anterior: RSA sobre o conteúdo completo (hash calculado pela biblioteca)"""
+    signature = manager._load_private_key().sign(content, padding.PKCS1v15(), hashes.SHA256())
+    return {
+        'hash': hashlib.sha256(content).hexdigest(),
+        'signature_data': base64.b64encode(signature).decode('utf-8'),
+        'certificate_fingerprint': manager._load_certificate().fingerprint(hashes.SHA256()).hex(),
+    }
+
+
+def test_signatures_over_content_still_verify(manager):
+    content = pdf_bytes()
+    info = legacy_signature(manager, content)
+
+    assert manager.verify_signature_with_certificate(content, info) == (True, 'Assinatura válida')
+    assert manager.verify_pdf_digest(hashlib.sha256(content).digest(), info)[0] is True
+    assert manager.verify_pdf_digest(info['hash'], info)[0] is True
+
+
+def test_digest_signatures_verify_with_content_api(manager):
+    content = pdf_bytes()
+    info = manager.sign_pdf_digest(hashlib.sha256(content).hexdigest())
+
+    # Verificação pelo caminho anterior (a biblioteca calcula o hash do conteúdo)
+    manager._load_certificate().public_key().verify(
+        base64.b64decode(info['signature_data']), content, padding.PKCS1v15(), hashes.SHA256())
+    # PKCS#1 v1.5 é determinística: o mesmo documento gera a mesma assinatura pelos dois caminhos
+    from_content = manager.sign_pdf_with_certificate(content)
+    assert from_content['signature_data'] == info['signature_data']
+    assert from_content.keys() == info.keys()
+    assert manager.verify_signature_with_certificate(content, info)[0] is True
+
+
+def test_tampered_content_is_rejected(tmp_path, manager):
+    content = pdf_bytes()
+    info = manager.sign_pdf_with_certificate(content)
+    path = tmp_path / 'doc.pdf'
+    path.write_bytes(content + b'%adulterado\n')
+
+    assert manager.verify_pdf_file(str(path), info)[0] is False
+    path.write_bytes(content)
+    assert manager.verify_pdf_file(str(path), info) == (True, 'Assinatura válida')
+
+
+def test_legacy_pss_signature_verifies_from_digest(tmp_path):
+    keys = DigitalSignatureManager(keys_dir=str(tmp_path / 'keys'), key_cache=KeyMaterialCache())
+    content = pdf_bytes()
+    info = keys.sign_data(hashlib.sha256(content).hexdigest())
+
+    assert verify_pdf_signature_unified(content, info, keys.public_key_path) is True
+    assert verify_pdf_digest_unified(info['hash'], info, keys.public_key_path) is True
+    assert verify_pdf_digest_unified('0' * 64, info, keys.public_key_path) is False
+
+
+def test_validate_pdf_hashes_the_document_once(tmp_path, manager, monkeypatch):
+    content = pdf_bytes()
+    path = tmp_path / 'doc.pdf'
+    path.write_bytes(content)
+    info = legacy_signature(manager, content)
+    record = types.SimpleNamespace(signature_hash=info['hash'], signature_algorithm='RSA-SHA256',
+                                   signature_data=info['signature_data'])
+
+    calls = []
+    real_sha256 = hashlib.sha256
+
+    def counting_sha256(*args):
+        calls.append(args)
+        return real_sha256(*args)
+
+    monkeypatch.setattr(crypto_utils.hashlib, 'sha256', counting_sha256)
+    result = PDFValidator(keys_dir=str(tmp_path / 'keys')).validate_pdf(str(path), record)
+
+    assert result['hash_match'] and result['digital_signature_valid'] and result['certificate_signature_valid']
+    assert result['valid'] is True
+    assert len(calls) == 1
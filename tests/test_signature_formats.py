@@ -0,0 +1,83 @@
+"""
+Testes dos algoritmos da chave do sistema (RSA, Ed25519, ECDSA P-256) em
+services/certificate_manager.py
+"""
+
+import sys
+import base64
+import hashlib
+import types
+
+import pytest
+
+from services.certificate_manager import CertificateManager, KEY_ALGORITHMS
+from services.pdf_validator import PDFValidator
+from utils.key_cache import KeyMaterialCache
+
+DIGEST = hashlib.sha256(b'%PDF-1.4 conteudo').digest()
+
+
+@pytest.fixture
+def key_cache():
+    return KeyMaterialCache()
+
+
+def make_manager(tmp_path, key_cache, key_algorithm):
+    return CertificateManager(certs_dir=str(tmp_path / 'certificates'), key_cache=key_cache,
+                              key_algorithm=key_algorithm)
+
+
+@pytest.mark.parametrize('key_algorithm, signature_format, max_size', [
+    ('RSA', 'RSA-SHA256', 256),
+    ('ED25519', 'Ed25519-SHA256', 64),
+    ('ECDSA-P256', 'ECDSA-P256-SHA256', 72),
+])
+def test_sign_and_verify_each_algorithm(tmp_path, key_cache, key_algorithm, signature_format, max_size):
+    manager = make_manager(tmp_path, key_cache, key_algorithm)
+    info = manager.sign_pdf_digest(DIGEST)
+
+    assert info['signature_format'] == signature_format
+    assert len(base64.b64decode(info['signature_data'])) <= max_size
+    assert manager.verify_pdf_digest(DIGEST, info) == (True, 'Assinatura válida')
+    assert manager.verify_pdf_digest(hashlib.sha256(b'outro').digest(), dict(info, hash=None))[0] is False
+    assert manager.get_certificate_info()['key_algorithm'] == key_algorithm
+
+
+def test_historical_rsa_signatures_verify_after_switching(tmp_path, key_cache):
+    rsa_info = make_manager(tmp_path, key_cache, 'RSA').sign_pdf_digest(DIGEST)
+    manager = make_manager(tmp_path, key_cache, 'ED25519')
+    ed_info = manager.sign_pdf_digest(DIGEST)
+
+    # Registros antigos não têm formato: tratados como RSA
+    legacy = {'hash': rsa_info['hash'], 'signature_data': rsa_info['signature_data']}
+    assert manager.verify_pdf_digest(DIGEST, legacy)[0] is True
+    assert manager.verify_pdf_digest(DIGEST, rsa_info)[0] is True
+    assert manager.verify_pdf_digest(DIGEST, ed_info)[0] is True
+    # O formato gravado decide a chave: assinatura Ed25519 rotulada como RSA não confere
+    assert manager.verify_pdf_digest(DIGEST, dict(ed_info, signature_format='RSA-SHA256'))[0] is False
+
+
+def test_validator_uses_recorded_format(tmp_path, key_cache, monkeypatch):
+    manager = make_manager(tmp_path, key_cache, 'ECDSA-P256')
+    monkeypatch.setattr(sys.modules['services.certificate_manager'], 'certificate_manager', manager)
+    path = tmp_path / 'doc.pdf'
+    path.write_bytes(b'%PDF-1.4 conteudo')
+    info = manager.sign_pdf_digest(DIGEST)
+    record = types.SimpleNamespace(signature_hash=info['hash'], signature_algorithm=info['signature_format'],
+                                   signature_data=info['signature_data'])
+
+    result = PDFValidator(keys_dir=str(tmp_path / 'keys')).validate_pdf(str(path), record)
+
+    assert result['digital_signature_valid'] and result['certificate_signature_valid']
+    assert result['valid'] is True
+
+
+def test_algorithm_from_environment(tmp_path, key_cache, monkeypatch):
+    monkeypatch.setenv('CERTIFICATE_KEY_ALGORITHM', 'ed25519')
+    manager = CertificateManager(certs_dir=str(tmp_path / 'certificates'), key_cache=key_cache)
+    assert manager.signature_format == KEY_ALGORITHMS['ED25519']['format']
+    assert manager.private_key_path.endswith('private_key_ed25519.pem')
+
+    monkeypatch.setenv('CERTIFICATE_KEY_ALGORITHM', 'DSA')
+    with pytest.raises(ValueError):
+        CertificateManager(certs_dir=str(tmp_path / 'certificates'), key_cache=key_cache)
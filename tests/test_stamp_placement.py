@@ -0,0 +1,99 @@
+"""
+Testes das políticas de posicionamento do carimbo (pdf_stamper.STAMP_PLACEMENTS)
+"""
+
+import PyPDF2
+import pytest
+
+from pdf_stamper import MANIFEST_PAGE_KEY, pages_to_stamp, stamp_pdf
+
+MODES = ('incremental', 'xobject', 'merge')
+
+
+def stamped_flags(path, marker='Assinado'):
+    return [marker in page.extract_text() for page in PyPDF2.PdfReader(str(path)).pages]
+
+
+def stamp(input_path, output_path, placement, mode='incremental', text='Assinado', key='teste'):
+    return stamp_pdf(str(input_path), str(output_path), lambda c, w, h: c.drawString(10, 10, text),
+                     key, mode=mode, placement=placement)
+
+
+def test_pages_to_stamp():
+    assert pages_to_stamp(4, 'all') == {0, 1, 2, 3}
+    assert pages_to_stamp(4, 'last') == {3}
+    assert pages_to_stamp(4, 'first_last') == {0, 3}
+    assert pages_to_stamp(1, 'first_last') == {0}
+    assert pages_to_stamp(4, 'signature_page') == {3}
+    assert pages_to_stamp(0, 'all') == set()
+
+
+@pytest.mark.parametrize('mode', MODES)
+@pytest.mark.parametrize('placement,expected', [
+    ('all', [True] * 5),
+    ('last', [False, False, False, False, True]),
+    ('first_last', [True, False, False, False, True]),
+    ('desconhecida', [True] * 5),
+])
+def test_placement_stamps_only_selected_pages(tmp_path, make_pdf, mode, placement, expected):
+    original, output = tmp_path / 'in.pdf', tmp_path / 'out.pdf'
+    make_pdf(original, 5)
+
+    stats = stamp(original, output, placement, mode)
+
+    assert stamped_flags(output) == expected
+    assert stats['stamped_pages'] == sum(expected)
+    # Páginas não carimbadas mantêm o conteúdo original
+    texts = [page.extract_text() for page in PyPDF2.PdfReader(str(output)).pages]
+    assert all(f"Página {i + 1}" in text for i, text in enumerate(texts))
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_signature_page_appends_stamped_manifest(tmp_path, make_pdf, mode):
+    original, output = tmp_path / 'in.pdf', tmp_path / 'out.pdf'
+    make_pdf(original, 5)
+
+    stats = stamp(original, output, 'signature_page', mode)
+
+    reader = PyPDF2.PdfReader(str(output))
+    assert len(reader.pages) == 6 == stats['pages']
+    assert MANIFEST_PAGE_KEY in reader.pages[-1]
+    assert 'Página de assinaturas' in reader.pages[-1].extract_text()
+    assert stamped_flags(output) == [False, False, False, False, True, True]
+
+
+def test_incremental_leaves_unstamped_pages_untouched(tmp_path, make_pdf):
+    original, output = tmp_path / 'in.pdf', tmp_path / 'out.pdf'
+    make_pdf(original, 5)
+
+    stamp(original, output, 'last')
+
+    # Apenas a última página é regravada na revisão
+    revision = output.read_bytes()[original.stat().st_size - 1:]
+    reader = PyPDF2.PdfReader(str(original))
+    rewritten = [page.indirect_reference.idnum for page in reader.pages
+                 if f"\n{page.indirect_reference.idnum} 0 obj".encode() in revision]
+    assert rewritten == [reader.pages[-1].indirect_reference.idnum]
+
+
+def test_manifest_is_not_appended_twice(tmp_path, make_pdf):
+    original, first, second = tmp_path / 'in.pdf', tmp_path / 'r1.pdf', tmp_path / 'r2.pdf'
+    make_pdf(original, 5)
+
+    stamp(original, first, 'signature_page', text='Assinante A', key='a')
+    stamp(first, second, 'signature_page', text='Assinante B', key='b')
+
+    assert len(PyPDF2.PdfReader(str(second)).pages) == 6
+    assert stamped_flags(second, 'Assinante A') == [False, False, False, False, True, True]
+    assert stamped_flags(second, 'Assinante B') == [False, False, False, False, True, True]
+
+
+def test_analysis_without_incremental_support_skips_incremental_mode(tmp_path, make_pdf):
+    source = tmp_path / 'original.pdf'
+    make_pdf(source, 2)
+
+    stats = stamp_pdf(str(source), str(tmp_path / 'saida.pdf'), lambda c, w, h: c.drawString(10, 10, 'Assinado'),
+                      'teste', mode='incremental', placement='all', analysis={'incremental': False})
+
+    assert stats['mode'] == 'xobject'
+    assert stamped_flags(tmp_path / 'saida.pdf') == [True, True]
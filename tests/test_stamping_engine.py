@@ -0,0 +1,88 @@
+"""
+Testes do motor de carimbo (services/stamping_engine.py)
+Usam funções da biblioteca padrão como jobs, pois precisam ser serializáveis
+para os processos filhos (spawn).
+"""
+
+import os
+import time
+import threading
+
+import psutil
+import pytest
+
+from services.stamping_engine import StampingQueueFull, StampingTimeout
+
+
+def run_in_thread(engine, *args, **kwargs):
+    thread = threading.Thread(target=engine.run, args=args, kwargs=kwargs, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_inline_mode_runs_in_calling_process(make_engine):
+    engine = make_engine(max_workers=0)
+
+    assert engine.run(os.getpid) == os.getpid()
+    with pytest.raises(ValueError):
+        engine.run(int, 'x')
+
+    metrics = engine.get_metrics()
+    assert metrics['jobs_completed'] == 1
+    assert metrics['jobs_failed'] == 1
+
+
+def test_job_runs_in_child_process(make_engine):
+    engine = make_engine(max_workers=1)
+
+    assert engine.run(os.getpid) != os.getpid()
+    assert engine.get_metrics()['jobs_completed'] == 1
+
+
+def test_timeout_kills_process_and_restarts_slot(make_engine):
+    engine = make_engine(max_workers=1)
+    child_pid = engine.run(os.getpid)
+
+    with pytest.raises(StampingTimeout):
+        engine.run(time.sleep, 30, timeout=1)
+
+    assert not psutil.pid_exists(child_pid)
+    new_pid = engine.run(os.getpid)
+    assert new_pid != child_pid
+
+    metrics = engine.get_metrics()
+    assert metrics['jobs_timed_out'] == 1
+    assert metrics['workers_restarted'] == 1
+    assert metrics['global_running'] == 0
+
+
+def test_rejects_when_workers_and_queue_are_full(make_engine, wait_until):
+    engine = make_engine(max_workers=1, max_queue=1, queue_timeout=30)
+    threads = [run_in_thread(engine, time.sleep, 2)]
+    assert wait_until(lambda: engine.get_metrics()['global_running'] == 1)
+    threads.append(run_in_thread(engine, time.sleep, 0))
+    assert wait_until(lambda: engine.get_metrics()['global_waiting'] == 1)
+
+    with pytest.raises(StampingQueueFull) as exc_info:
+        engine.run(os.getpid)
+    assert exc_info.value.retry_after >= 1
+
+    for thread in threads:
+        thread.join(30)
+    metrics = engine.get_metrics()
+    assert metrics['jobs_rejected'] == 1
+    assert metrics['jobs_completed'] == 2
+
+
+def test_limit_is_shared_between_web_workers(make_engine, wait_until):
+    # Dois motores no mesmo diretório de locks simulam dois workers do gunicorn
+    worker_a = make_engine(max_workers=1, max_queue=0)
+    worker_b = make_engine(max_workers=1, max_queue=0)
+    thread = run_in_thread(worker_a, time.sleep, 2)
+    assert wait_until(lambda: worker_b.get_metrics()['global_running'] == 1)
+
+    with pytest.raises(StampingQueueFull):
+        worker_b.run(os.getpid)
+
+    thread.join(30)
+    assert worker_b.run(os.getpid) != os.getpid()
@@ -0,0 +1,85 @@
+"""
+Carimbo com memória limitada (modo incremental em blocos) e teto de memória
+do motor de carimbo (STAMPING_MEMORY_LIMIT_MB)
+"""
+
+import os
+
+import PyPDF2
+import pytest
+
+from pdf_stamper import stamp_single_signer
+from services.stamping_engine import StampingMemoryExceeded, peak_rss_mb
+
+# Teto do processo do job (interpretador e imports ocupam ~85 MB) e quanto o
+# carimbo do documento sintético de 1000 páginas (~65 MB) pode acrescentar:
+# manter o documento inteiro em memória acrescenta mais de 60 MB
+MEMORY_CEILING_MB = 128
+JOB_MEMORY_BUDGET_MB = 32
+
+
+def make_large_pdf(path, num_pages=1000, content_kb=64):
+    """PDF sintético escrito direto em bytes: cada página com um fluxo de conteúdo próprio"""
+    line = b"0 0 m 100 100 l S\n"
+    data = line * (content_kb * 1024 // len(line)) + b"BT /F1 12 Tf ET\n"
+    offsets = {}
+    with open(path, 'wb') as f:
+        f.write(b"%PDF-1.4\n")
+
+        def write_object(number, body):
+            offsets[number] = f.tell()
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+        kids = b" ".join(b"%d 0 R" % (3 + 2 * i) for i in range(num_pages))
+        write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        write_object(2, b"<< /Type /Pages /Count %d /Kids [%s] >>" % (num_pages, kids))
+        for i in range(num_pages):
+            page, content = 3 + 2 * i, 4 + 2 * i
+            write_object(page, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                               b"/Resources << >> /Contents %d 0 R >>" % content)
+            write_object(content, b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream")
+        xref = f.tell()
+        size = 3 + 2 * num_pages
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for number in range(1, size):
+            f.write(b"%010d 00000 n \n" % offsets[number])
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref))
+
+
+def test_large_document_stamped_under_memory_ceiling(tmp_path, make_engine):
+    original, output = tmp_path / 'in.pdf', tmp_path / 'out.pdf'
+    make_large_pdf(original)
+    engine = make_engine(max_workers=1, memory_limit_mb=MEMORY_CEILING_MB, job_timeout=120)
+
+    baseline_mb = engine.run(peak_rss_mb)
+
+    stats = engine.run(stamp_single_signer, str(original), str(output),
+                       personal_info={'nome': 'Assinante Teste'}, mode='incremental')
+    # Pico de RSS do processo que executou o job (o teto também é imposto pelo motor)
+    peak_mb = engine.run(peak_rss_mb)
+    assert peak_mb < MEMORY_CEILING_MB
+    assert peak_mb - baseline_mb < JOB_MEMORY_BUDGET_MB
+    assert stats['mode'] == 'incremental'
+    assert stats['stamped_pages'] == 1000
+    reader = PyPDF2.PdfReader(str(output))
+    assert len(reader.pages) == 1000
+    assert 'Assinante Teste' in reader.pages[-1].extract_text()
+    # Revisão incremental: os bytes originais são preservados
+    with open(original, 'rb') as f:
+        assert output.read_bytes().startswith(f.read())
+
+
+def test_job_over_memory_limit_is_killed(make_engine):
+    engine = make_engine(max_workers=1, memory_limit_mb=64, job_timeout=30)
+    pid = engine.run(os.getpid)
+
+    with pytest.raises(StampingMemoryExceeded) as excinfo:
+        engine.run(os.urandom, 512 * 1024 * 1024)
+
+    assert excinfo.value.status_code == 413
+    # O slot é recriado e continua atendendo
+    assert engine.run(os.getpid) != pid
+    metrics = engine.get_metrics()
+    assert metrics['jobs_memory_exceeded'] == 1
+    assert metrics['workers_restarted'] == 1
+    assert metrics['job_rss_mb_max'] > 64
@@ -0,0 +1,263 @@
+"""
+Testes do recebimento concorrente de uploads (services/upload_ingest.py)
+"""
+
+import io
+import time
+import hashlib
+import threading
+
+import pytest
+from flask import Flask, request
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from services import scan_cache
+from services.scan_cache import ScanVerdictCache
+from services.content_store import ContentStore
+from services.upload_ingest import HashingUploadFile, StreamingUploadRequest, UploadIngestor
+
+
+def pdf_bytes(text='Página'):
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    c.drawString(72, 720, text)
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def upload(tmp_path, name, data):
+    return (FileStorage(stream=io.BytesIO(data), filename=name), name, name.split('.')[0], str(tmp_path / name))
+
+
+@pytest.fixture(autouse=True)
+def verdict_cache(tmp_path, monkeypatch):
+    cache = ScanVerdictCache(url=str(tmp_path / 'scan_cache.sqlite3'), max_entries=100)
+    monkeypatch.setattr(scan_cache, 'scan_verdict_cache', cache)
+    return cache
+
+
+def test_per_file_outcomes(tmp_path):
+    data = pdf_bytes()
+    items = [
+        upload(tmp_path, 'bom.pdf', data),
+        upload(tmp_path, 'texto.pdf', b'nao sou um pdf'),
+        upload(tmp_path, 'js.pdf', data.replace(b'/Type /Catalog', b'/Type /Catalog /OpenAction << /S /JavaScript >>')),
+    ]
+
+    good, not_pdf, dangerous = UploadIngestor(max_workers=3).ingest(items)
+
+    assert good['ok'] and good['message'] == 'OK'
+    assert good['sha256'] == hashlib.sha256(data).hexdigest()
+    assert good['size'] == len(data)
+    assert good['analysis']['page_count'] == 1
+    assert (tmp_path / 'bom.pdf').read_bytes() == data
+    assert not not_pdf['ok'] and 'não é PDF' in not_pdf['message']
+    assert not dangerous['ok'] and '/JavaScript' in dangerous['message']
+    # Arquivos rejeitados não ficam no disco
+    assert not (tmp_path / 'texto.pdf').exists()
+    assert not (tmp_path / 'js.pdf').exists()
+
+
+def test_wall_time_follows_slowest_file(tmp_path):
+    delays = [0.2, 0.2, 0.2, 0.2, 0.5]
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def slow_analyze(path, digest=None):
+        with lock:
+            running.append(path)
+            peak.append(len(running))
+        time.sleep(delays[int(path.rsplit('_', 1)[1].split('.')[0])])
+        with lock:
+            running.remove(path)
+        return True, 'OK', {'page_count': 1}
+
+    ingestor = UploadIngestor(max_workers=len(delays), analyze_func=slow_analyze)
+    items = [upload(tmp_path, f'arquivo_{i}.pdf', pdf_bytes()) for i in range(len(delays))]
+
+    started = time.perf_counter()
+    results = ingestor.ingest(items)
+    elapsed = time.perf_counter() - started
+    ingestor.shutdown()
+
+    assert all(result['ok'] for result in results)
+    assert [result['filename'] for result in results] == [item[1] for item in items]
+    assert elapsed < max(delays) + 0.3 < sum(delays)
+    assert max(peak) == len(delays)
+
+
+def test_concurrency_is_bounded(tmp_path, concurrency_probe):
+    ingestor = UploadIngestor(max_workers=2, analyze_func=concurrency_probe.wrap((True, 'OK', {})))
+    ingestor.ingest([upload(tmp_path, f'arquivo_{i}.pdf', pdf_bytes()) for i in range(6)])
+    ingestor.shutdown()
+
+    assert concurrency_probe.peak == 2
+
+
+def test_receive_then_analyze(tmp_path):
+    ingestor = UploadIngestor(max_workers=1)
+    data = pdf_bytes()
+
+    received = ingestor.receive(*upload(tmp_path, 'bom.pdf', data))
+
+    assert received['ok'] and received['analysis'] is None
+    assert (tmp_path / 'bom.pdf').exists()
+    ok, message, analysis = ingestor.submit(ingestor.analyze, received['temp_path'], received['sha256']).result()
+    assert (ok, message, analysis['page_count']) == (True, 'OK', 1)
+    ingestor.shutdown()
+
+
+@pytest.fixture
+def async_client(tmp_path, monkeypatch):
+    """Aplicação de teste com o recebimento assíncrono ativado e um usuário logado"""
+    import app as app_module
+    from config import config
+    from models import User, DocumentType
+
+    # 'simple' não existe mais nas versões recentes do Flask-Caching
+    monkeypatch.setattr(config['testing'], 'CACHE_TYPE', 'SimpleCache')
+    monkeypatch.setattr(app_module, 'UPLOAD_ASYNC_INGEST', True)
+    monkeypatch.setattr(app_module, 'TEMP_DIR', str(tmp_path))
+    monkeypatch.setattr(app_module, 'content_store', ContentStore(directory=str(tmp_path / 'originais')))
+    flask_app = app_module.create_app('testing')
+    flask_app.secret_key = 'teste'
+    with flask_app.app_context():
+        app_module.db.create_all()
+        user = User(username='interno', email='interno@exemplo.com', full_name='Interno')
+        document_type = DocumentType(name='Contrato')
+        app_module.db.session.add_all([user, document_type])
+        app_module.db.session.commit()
+        ids = user.id, document_type.id
+    client = flask_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = ids[0]
+        session['_fresh'] = True
+    client.document_type_id = ids[1]
+    yield client
+    with flask_app.app_context():
+        app_module.db.drop_all()
+
+
+def test_async_upload_returns_before_scan_and_reports_status(async_client, monkeypatch):
+    import app as app_module
+    from pdf_scanner import analyze_pdf_upload
+
+    # A verificação só termina depois que a resposta do envio foi conferida
+    release = threading.Event()
+
+    def gated_analyze(path, digest=None):
+        release.wait(30)
+        return analyze_pdf_upload(path, digest=digest)
+
+    ingestor = UploadIngestor(max_workers=2, analyze_func=gated_analyze)
+    monkeypatch.setattr(app_module, 'upload_ingestor', ingestor)
+    data = {
+        'document_type_id': async_client.document_type_id,
+        'signer_name[]': ['Fulano de Tal'],
+        'signer_cpf[]': ['11122233344'],
+        'pdf_files': [
+            (io.BytesIO(pdf_bytes()), 'bom.pdf'),
+            (io.BytesIO(pdf_bytes().replace(b'/Type /Catalog', b'/Type /Catalog /OpenAction << /S /JavaScript >>')), 'js.pdf'),
+        ]
+    }
+
+    response = async_client.post('/internal/signature/upload', data=data, content_type='multipart/form-data')
+
+    assert response.status_code == 302
+    status = async_client.get('/internal/signature/status').get_json()
+    assert status['ingesting'] == 2
+    assert b'Verificando' in async_client.get('/internal/pending').data
+    ids = ','.join(item['id'] for item in status['signatures'])
+
+    release.set()
+    deadline = time.monotonic() + 30
+    while status['ingesting'] and time.monotonic() < deadline:
+        time.sleep(0.05)
+        status = async_client.get(f'/internal/signature/status?ids={ids}').get_json()
+    ingestor.shutdown()
+
+    items = {item['filename']: item for item in status['signatures']}
+    assert items['bom.pdf']['status'] == 'pending'
+    assert items['bom.pdf']['pages'] == 1
+    assert items['js.pdf']['status'] == 'rejected'
+    assert '/JavaScript' in items['js.pdf']['message']
+    pending = async_client.get('/internal/pending')
+    assert b'bom.pdf' in pending.data and b'js.pdf' not in pending.data
+
+
+def test_hashing_upload_file_hashes_while_writing(tmp_path):
+    data = pdf_bytes()
+    stream = HashingUploadFile(directory=str(tmp_path))
+    for start in range(0, len(data), 3):
+        stream.write(data[start:start + 3])
+    stream.seek(0)
+
+    assert stream.header_ok is True
+    assert stream.read() == data
+    assert stream.claim(str(tmp_path / 'final.pdf')) == (hashlib.sha256(data).hexdigest(), len(data))
+    assert (tmp_path / 'final.pdf').read_bytes() == data
+    stream.close()
+    assert [path.name for path in tmp_path.iterdir()] == ['final.pdf']
+
+
+def test_hashing_upload_file_discards_non_pdf(tmp_path):
+    stream = HashingUploadFile(directory=str(tmp_path))
+    stream.write(b'MZ\x90\x00')
+    stream.write(b'x' * 4096)
+
+    assert stream.header_ok is False
+    assert stream.tell() == 0
+    stream.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_hashing_upload_file_enforces_size_limit(tmp_path):
+    stream = HashingUploadFile(directory=str(tmp_path), max_bytes=1024)
+    stream.write(b'%PDF' + b'x' * 1000)
+
+    with pytest.raises(RequestEntityTooLarge):
+        stream.write(b'x' * 100)
+    stream.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_streaming_request_receive_uses_multipart_digest(tmp_path):
+    app = Flask(__name__)
+    app.request_class = StreamingUploadRequest
+    app.config['UPLOAD_TEMP_DIR'] = str(tmp_path)
+    ingestor = UploadIngestor(max_workers=1)
+    data = pdf_bytes()
+    received = {}
+
+    @app.route('/upload', methods=['POST'])
+    def upload_route():
+        for name, file in request.files.items():
+            assert isinstance(file.stream, HashingUploadFile)
+            received[name] = ingestor.receive(file, file.filename, name, str(tmp_path / file.filename))
+        return ''
+
+    app.test_client().post('/upload', content_type='multipart/form-data', data={
+        'bom': (io.BytesIO(data), 'bom.pdf'),
+        'falso': (io.BytesIO(b'<html></html>' * 100), 'falso.pdf'),
+    })
+
+    assert received['bom']['ok'] and received['bom']['sha256'] == hashlib.sha256(data).hexdigest()
+    assert received['bom']['size'] == len(data)
+    assert received['falso']['ok'] is False
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['bom.pdf']
+
+
+def test_signature_upload_keeps_digest(async_client):
+    data = pdf_bytes()
+
+    response = async_client.post('/signature/upload', content_type='multipart/form-data',
+                                 data={'pdf_file': (io.BytesIO(data), 'contrato.pdf')})
+
+    assert response.status_code == 302
+    with async_client.session_transaction() as session:
+        assert session['signature_process']['sha256'] == hashlib.sha256(data).hexdigest()
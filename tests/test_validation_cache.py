@@ -0,0 +1,178 @@
+"""
+Testes do cache de resultados de validação (services/validation_cache.py)
+"""
+
+import io
+import sys
+import time
+import hashlib
+
+import pytest
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+
+from services.certificate_manager import CertificateManager
+from services.pdf_validator import PDFValidator
+from services.validation_cache import ValidationResultCache
+from utils.key_cache import KeyMaterialCache
+
+
+def pdf_bytes(text='Comprovante assinado'):
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    c.drawString(72, 720, text)
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = ValidationResultCache(ttl_seconds=60, max_entries=10)
+    # services/__init__.py expõe a instância com o mesmo nome do módulo
+    monkeypatch.setattr(sys.modules['services.validation_cache'], 'validation_cache', cache)
+    return cache
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    manager = CertificateManager(certs_dir=str(tmp_path / 'certificates'), key_cache=KeyMaterialCache())
+    monkeypatch.setattr(sys.modules['services.certificate_manager'], 'certificate_manager', manager)
+    return manager
+
+
+class Record:
+    """Campos do registro de assinatura usados na validação"""
+
+    def __init__(self, id, info):
+        self.id = id
+        self.signature_hash = info['hash']
+        self.signature_algorithm = info['signature_format']
+        self.signature_data = info['signature_data']
+
+
+@pytest.fixture
+def signed(tmp_path, manager):
+    data = pdf_bytes()
+    path = tmp_path / 'comprovante.pdf'
+    path.write_bytes(data)
+    info = manager.sign_pdf_digest(hashlib.sha256(data).hexdigest())
+    return str(path), Record('sig-1', info)
+
+
+def counting(monkeypatch, obj, name):
+    calls = []
+    original = getattr(obj, name)
+
+    def wrapper(*args, **kwargs):
+        calls.append(args)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(obj, name, wrapper)
+    return calls
+
+
+def test_repeated_validation_skips_verification_and_metadata(tmp_path, cache, manager, signed, monkeypatch):
+    path, record = signed
+    validator = PDFValidator(keys_dir=str(tmp_path / 'keys'))
+    verifications = counting(monkeypatch, manager, 'verify_pdf_digest')
+    metadata = counting(monkeypatch, validator, 'extract_signature_metadata')
+
+    first = validator.validate_pdf(path, record)
+    first['file_id'] = 'alterado por quem chamou'
+    second = validator.validate_pdf(path, record)
+
+    assert second['valid'] is True and second['certificate_signature_valid'] is True
+    assert 'file_id' not in second
+    assert len(verifications) == 2 and len(metadata) == 1
+    assert cache.get_metrics()['hits'] == 1
+
+
+def test_changed_row_content_or_certificate_misses(tmp_path, cache, manager, signed, monkeypatch):
+    path, record = signed
+    validator = PDFValidator(keys_dir=str(tmp_path / 'keys'))
+    assert validator.validate_pdf(path, record)['valid'] is True
+
+    # Registro alterado (por outro worker): a versão do registro muda a chave
+    record.signature_data = manager.sign_pdf_digest(hashlib.sha256(b'outro').hexdigest())['signature_data']
+    assert validator.validate_pdf(path, record)['certificate_signature_valid'] is False
+
+    # Certificado trocado: a impressão digital muda a chave
+    key = validator.validation_cache_key(record.signature_hash, record)
+    rotated = CertificateManager(certs_dir=str(tmp_path / 'novo'), key_cache=KeyMaterialCache())
+    monkeypatch.setattr(sys.modules['services.certificate_manager'], 'certificate_manager', rotated)
+    assert validator.validation_cache_key(record.signature_hash, record) != key
+    assert cache.get_metrics()['hits'] == 0
+
+
+def test_ttl_and_invalidate(cache):
+    cache.ttl_seconds = 0.05
+    cache.put(('h', 'sig-1', 'v', 'fp'), {'valid': True})
+    cache.put(('h', 'sig-2', 'v', 'fp'), {'valid': True})
+
+    assert cache.invalidate('sig-1') == 1
+    assert cache.get(('h', 'sig-1', 'v', 'fp')) is None
+    time.sleep(0.1)
+    assert cache.get(('h', 'sig-2', 'v', 'fp')) is None
+    metrics = cache.get_metrics()
+    assert (metrics['invalidated'], metrics['expired'], metrics['entries']) == (1, 1, 0)
+
+
+def test_lru_bound(cache):
+    for index in range(15):
+        cache.put(('h', str(index), 'v', 'fp'), {'valid': True})
+    assert cache.get_metrics()['entries'] == 10
+    assert cache.get(('h', '0', 'v', 'fp')) is None and cache.get(('h', '14', 'v', 'fp')) is not None
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, manager, cache):
+    """Aplicação de teste com um documento assinado em PDF_SIGNED_DIR"""
+    import app as app_module
+    from config import config
+    from models import User, Signature
+
+    # 'simple' não existe mais nas versões recentes do Flask-Caching
+    monkeypatch.setattr(config['testing'], 'CACHE_TYPE', 'SimpleCache')
+    monkeypatch.setattr(app_module, 'validation_cache', cache)
+    signed_dir = tmp_path / 'assinados'
+    signed_dir.mkdir()
+    monkeypatch.setattr(app_module, 'PDF_SIGNED_DIR', str(signed_dir))
+    data = pdf_bytes()
+    (signed_dir / 'doc-1_comprovante.pdf').write_bytes(data)
+    info = manager.sign_pdf_digest(hashlib.sha256(data).hexdigest())
+    flask_app = app_module.create_app('testing')
+    flask_app.secret_key = 'teste'
+    with flask_app.app_context():
+        app_module.db.create_all()
+        user = User(username='assinante', email='assinante@exemplo.com', full_name='Assinante')
+        app_module.db.session.add(user)
+        app_module.db.session.flush()
+        app_module.db.session.add(Signature(
+            user_id=user.id, file_id='doc-1', original_filename='comprovante.pdf', status='completed',
+            signature_hash=info['hash'], signature_algorithm=info['signature_format'],
+            signature_data=info['signature_data']))
+        app_module.db.session.commit()
+    client = flask_app.test_client()
+    client.flask_app = flask_app
+    yield client
+    with flask_app.app_context():
+        app_module.db.drop_all()
+
+
+def test_qr_code_link_is_served_from_cache_until_row_changes(client, cache):
+    import app as app_module
+    from models import Signature
+
+    for _ in range(3):
+        response = client.get('/validate/doc-1')
+        assert response.status_code == 200
+    metrics = cache.get_metrics()
+    assert (metrics['stores'], metrics['hits']) == (1, 2)
+
+    with client.flask_app.app_context():
+        signature = Signature.query.filter_by(file_id='doc-1').one()
+        signature.verification_notes = 'Revisado'
+        app_module.db.session.commit()
+    assert cache.get_metrics()['invalidated'] == 1
+    assert cache.get_metrics()['entries'] == 0
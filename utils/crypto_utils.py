@@ -8,6 +8,7 @@ from cryptography.hazmat.primitives.asymmetric import rsa, padding
 from cryptography.hazmat.backends import default_backend
 from cryptography.exceptions import InvalidSignature
 import aiofiles
+from utils.key_cache import key_material_cache
 
 def calculate_pdf_hash(pdf_path):
     """
@@ -91,20 +92,30 @@ def verify_pdf_signature_unified(pdf_content, signature_info, public_key_path):
         signature_info: Dicionário com hash, signature e algorithm
         public_key_path: Caminho para a chave pública
         
+    Returns:
+        bool: True se a assinatura for válida
+    """
+    return verify_pdf_digest_unified(calculate_content_hash(pdf_content), signature_info, public_key_path)
+
+def verify_pdf_digest_unified(pdf_hash, signature_info, public_key_path):
+    """
+    Verificação da assinatura legacy a partir do SHA-256 já calculado do PDF
+    
+    Args:
+        pdf_hash: Hash SHA-256 do PDF em formato hexadecimal
+        signature_info: Dicionário com hash, signature e algorithm
+        public_key_path: Caminho para a chave pública
+        
     Returns:
         bool: True se a assinatura for válida
     """
     try:
-        # Carrega chave pública
-        with open(public_key_path, "rb") as f:
-            public_key = serialization.load_pem_public_key(f.read(), backend=default_backend())
+        # Carrega chave pública (cache do processo)
+        public_key = key_material_cache.public_key(public_key_path)
         
         # Decodifica a assinatura
         signature_data = base64.b64decode(signature_info['signature'])
         
-        # Calcula o hash do PDF
-        pdf_hash = calculate_content_hash(pdf_content)
-        
         # Verifica se o hash corresponde
         if pdf_hash != signature_info['hash']:
             return False
@@ -125,7 +136,9 @@ def verify_pdf_signature_unified(pdf_content, signature_info, public_key_path):
         return False
 
 class DigitalSignatureManager:
-    def __init__(self, keys_dir="keys"):
+    def __init__(self, keys_dir="keys", key_cache=None):
+        # Chaves interpretadas uma vez por processo (utils.key_cache)
+        self.key_cache = key_cache or key_material_cache
         # Usa KEYS_DIR_SECURE se configurado, senão usa keys_dir padrão
         secure_dir = os.environ.get('KEYS_DIR_SECURE')
         if secure_dir and secure_dir.strip():
@@ -202,13 +215,8 @@ class DigitalSignatureManager:
     
     def sign_data(self, data):
         """Assina os dados com a chave privada"""
-        # Carrega chave privada (com suporte para passphrase)
-        with open(self.private_key_path, "rb") as f:
-            private_key = serialization.load_pem_private_key(
-                f.read(),
-                password=self.key_passphrase,
-                backend=default_backend()
-            )
+        # Carrega chave privada (com suporte para passphrase; cache do processo)
+        private_key = self.key_cache.private_key(self.private_key_path, self.key_passphrase)
         
         # Se os dados já são um hash (64 caracteres hex), usa diretamente
         if isinstance(data, str) and len(data) == 64 and all(c in '0123456789abcdef' for c in data.lower()):
@@ -240,12 +248,8 @@ class DigitalSignatureManager:
     def verify_signature(self, data, signature_info):
         """Verifica a assinatura dos dados"""
         try:
-            # Carrega chave pública
-            with open(self.public_key_path, "rb") as f:
-                public_key = serialization.load_pem_public_key(
-                    f.read(),
-                    backend=default_backend()
-                )
+            # Carrega chave pública (cache do processo)
+            public_key = self.key_cache.public_key(self.public_key_path)
             
             # Se os dados já são um hash (64 caracteres hex), usa diretamente
             if isinstance(data, str) and len(data) == 64 and all(c in '0123456789abcdef' for c in data.lower()):
@@ -276,11 +280,7 @@ class DigitalSignatureManager:
     
     def get_public_key_info(self):
         """Retorna informações da chave pública"""
-        with open(self.public_key_path, "rb") as f:
-            public_key = serialization.load_pem_public_key(
-                f.read(),
-                backend=default_backend()
-            )
+        public_key = self.key_cache.public_key(self.public_key_path)
         
         # Extrai informações da chave
         public_numbers = public_key.public_numbers()
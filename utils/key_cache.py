@@ -0,0 +1,102 @@
+"""
+Cache em memória das chaves e certificados lidos dos arquivos PEM
+Cada processo carrega e interpreta a chave privada, a chave pública e o
+certificado uma única vez; as chamadas seguintes só conferem o arquivo com
+os.stat. Se o arquivo mudar (mtime, inode ou tamanho — por exemplo, na troca
+do certificado por rename), o objeto é recarregado na próxima chamada.
+
+Os objetos de chave da biblioteca cryptography são imutáveis e podem ser
+usados por várias threads ao mesmo tempo.
+"""
+
+import os
+import logging
+import threading
+
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.backends import default_backend
+
+logger = logging.getLogger(__name__)
+
+
+def _load_private_key(data, password):
+    return serialization.load_pem_private_key(data, password=password, backend=default_backend())
+
+
+def _load_public_key(data, _password):
+    return serialization.load_pem_public_key(data, backend=default_backend())
+
+
+def _load_certificate(data, _password):
+    return x509.load_pem_x509_certificate(data, default_backend())
+
+
+class KeyMaterialCache:
+    """Chaves e certificados já interpretados, por caminho do arquivo PEM"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._metrics = {'loads': 0, 'reloads': 0, 'hits': 0, 'errors': 0}
+        self._file_loads = {}
+
+    @staticmethod
+    def _file_version(path):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_ino, stat.st_dev, stat.st_size
+
+    def _get(self, kind, path, loader, password=None):
+        key = (kind, os.path.abspath(path))
+        version = self._file_version(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._metrics['hits'] += 1
+                return entry[1]
+            # Carrega sob o lock: evita que várias threads interpretem a mesma chave ao mesmo tempo
+            try:
+                with open(path, 'rb') as f:
+                    value = loader(f.read(), password)
+            except Exception as e:
+                self._metrics['errors'] += 1
+                if entry is None:
+                    raise
+                # Arquivo em substituição (gravação incompleta): mantém o objeto anterior
+                logger.warning(f"Falha ao recarregar {path}; mantendo a versão anterior: {e}")
+                return entry[1]
+            self._entries[key] = (version, value)
+            self._metrics['loads'] += 1
+            if entry is not None:
+                self._metrics['reloads'] += 1
+            self._file_loads[key[1]] = self._file_loads.get(key[1], 0) + 1
+            return value
+
+    def private_key(self, path, password=None):
+        """Chave privada do arquivo PEM (password: passphrase em bytes ou None)"""
+        return self._get('private_key', path, _load_private_key, password)
+
+    def public_key(self, path):
+        """Chave pública do arquivo PEM"""
+        return self._get('public_key', path, _load_public_key)
+
+    def certificate(self, path):
+        """Certificado X.509 do arquivo PEM"""
+        return self._get('certificate', path, _load_certificate)
+
+    def clear(self):
+        """Descarta todos os objetos carregados"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_metrics(self):
+        """Carregamentos (por arquivo), recargas por troca do arquivo e acertos do processo atual"""
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['files'] = dict(self._file_loads)
+            metrics['cached'] = len(self._entries)
+        return metrics
+
+
+# Instância global do cache de chaves e certificados
+key_material_cache = KeyMaterialCache()